@@ -0,0 +1,243 @@
+"""
+Búsqueda de hiperparámetros del modelo de predicción con validación temporal y presupuesto de tiempo
+"""
+import time
+import itertools
+import threading
+import multiprocessing
+from functools import partial
+from datetime import datetime
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.metrics import mean_absolute_error, r2_score
+from .procesos import contexto_procesos
+
+# Candidatos evaluados (producto de los valores de cada parámetro)
+GRILLA_PREDICCION = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [6, 10, 16, None],
+    'min_samples_leaf': [1, 5]
+}
+
+# Particiones de la validación cruzada temporal
+PLIEGUES_VALIDACION = 3
+
+# Segundos máximos de la búsqueda
+PRESUPUESTO_AJUSTE = 300
+
+
+def candidatos_grilla(grilla=None):
+    """Combinaciones de la grilla como diccionarios de parámetros del RandomForest"""
+    grilla = grilla or GRILLA_PREDICCION
+    nombres = list(grilla)
+    return [dict(zip(nombres, valores), random_state=42) for valores in itertools.product(*grilla.values())]
+
+
+def orden_temporal(matriz):
+    """Índices de los registros de la matriz ordenados por fecha (los registros sin fecha primero)"""
+    dia = np.nan_to_num(matriz.columna('dia_mes'), nan=0) if 'dia_mes' in matriz.features else np.zeros(len(matriz.X))
+    mes = np.nan_to_num(matriz.columna('mes'), nan=0) if 'mes' in matriz.features else np.zeros(len(matriz.X))
+    return np.lexsort((dia, mes, matriz.anio))
+
+
+def _validar_candidato(parametros, X, y, pliegues=PLIEGUES_VALIDACION):
+    """Validación cruzada temporal de un candidato (se ejecuta en un proceso del pool).
+
+    Cada pliegue entrena con el pasado y evalúa con el período siguiente; el scaler se
+    ajusta dentro de cada pliegue para no usar información del período evaluado.
+    Retorna (parametros, mae, r2, segundos, error); si el candidato falla, mae y r2 son
+    None y error describe la falla, para que la búsqueda siga con los demás.
+    """
+    inicio = time.perf_counter()
+    mae, r2 = [], []
+    try:
+        for entrenamiento, prueba in TimeSeriesSplit(n_splits=pliegues).split(X):
+            scaler = StandardScaler()
+            X_train = scaler.fit_transform(X[entrenamiento])
+            X_test = scaler.transform(X[prueba])
+            # El pool ya ocupa los núcleos: cada proceso entrena en un solo hilo
+            modelo = RandomForestRegressor(n_jobs=1, **parametros)
+            modelo.fit(X_train, y[entrenamiento])
+            y_pred = modelo.predict(X_test)
+            mae.append(mean_absolute_error(y[prueba], y_pred))
+            r2.append(r2_score(y[prueba], y_pred))
+    except Exception as e:
+        return parametros, None, None, time.perf_counter() - inicio, str(e)
+    return parametros, float(np.mean(mae)), float(np.mean(r2)), time.perf_counter() - inicio, None
+
+
+class AjusteModeloPrediccion:
+    """Busca los mejores hiperparámetros del modelo de `prediccion` y registra el ganador.
+
+    Los candidatos se validan en paralelo en un pool de procesos; al agotarse el
+    presupuesto se interrumpen los que faltan y se usa el mejor evaluado hasta entonces.
+    El modelo en uso sigue atendiendo predicciones durante la búsqueda y solo se
+    reemplaza al registrar el ganador, entrenado con todos los datos.
+    """
+
+    def __init__(self, prediccion, max_workers=None, presupuesto=PRESUPUESTO_AJUSTE, pliegues=PLIEGUES_VALIDACION,
+                 grilla=None):
+        self.prediccion = prediccion
+        self.max_workers = max_workers
+        self.presupuesto = presupuesto
+        self.pliegues = pliegues
+        self.grilla = grilla
+        self._lock = threading.Lock()
+        self._hilo = None
+        self.estado = self._estado_inicial()
+
+    def _estado_inicial(self):
+        return {
+            'estado': 'inactivo',
+            'total_candidatos': 0,
+            'candidatos_evaluados': 0,
+            'porcentaje': 0.0,
+            'presupuesto_agotado': False,
+            'mejor': None,
+            'resultados': [],
+            'fallidos': [],
+            'version': None,
+            'inicio': None,
+            'fin': None,
+            'duracion_total': None,
+            'error': None
+        }
+
+    def _actualizar_estado(self, **cambios):
+        with self._lock:
+            self.estado.update(cambios)
+
+    def _registrar_candidato(self, parametros, mae, r2, duracion, error=None):
+        """Registra el resultado (o la falla) de un candidato y actualiza el mejor (menor MAE)"""
+        with self._lock:
+            self.estado['candidatos_evaluados'] += 1
+            total = self.estado['total_candidatos']
+            self.estado['porcentaje'] = round(self.estado['candidatos_evaluados'] / total * 100, 1) if total else 100.0
+            if error is not None:
+                self.estado['fallidos'].append({'parametros': parametros, 'error': error})
+                return
+            resultado = {'parametros': parametros, 'mae': round(mae, 4), 'r2': round(r2, 4),
+                         'segundos': round(duracion, 3)}
+            self.estado['resultados'].append(resultado)
+            if self.estado['mejor'] is None or mae < self.estado['mejor']['mae']:
+                self.estado['mejor'] = resultado
+
+    def obtener_estado(self):
+        """Retorna una copia del estado de la búsqueda"""
+        with self._lock:
+            estado = dict(self.estado)
+            estado['resultados'] = list(self.estado['resultados'])
+            estado['fallidos'] = list(self.estado['fallidos'])
+        return estado
+
+    def en_proceso(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def _evaluar(self, candidatos, X, y, limite):
+        """Valida los candidatos en el pool hasta `limite` (perf_counter); retorna True si se agotó el tiempo"""
+        validar = partial(_validar_candidato, X=X, y=y, pliegues=self.pliegues)
+        try:
+            pool = contexto_procesos().Pool(processes=self.max_workers)
+        except Exception as e:
+            # Si el pool de procesos no está disponible, evaluar en serie
+            print(f"Pool de procesos no disponible, evaluando en serie: {e}")
+            for parametros in candidatos:
+                if time.perf_counter() >= limite:
+                    return True
+                self._registrar_candidato(*validar(parametros))
+            return False
+
+        try:
+            resultados = pool.imap_unordered(validar, candidatos)
+            for _ in candidatos:
+                self._registrar_candidato(*resultados.next(timeout=max(0, limite - time.perf_counter())))
+            return False
+        except multiprocessing.TimeoutError:
+            return True
+        finally:
+            # Al agotarse el presupuesto los candidatos en curso se interrumpen
+            pool.terminate()
+            pool.join()
+
+    def ejecutar(self, df):
+        """Busca hiperparámetros sobre df y registra el mejor candidato; retorna el resultado o None"""
+        inicio = time.perf_counter()
+        with self._lock:
+            self.estado = self._estado_inicial()
+            self.estado.update(estado='procesando', inicio=datetime.now().isoformat())
+
+        try:
+            matriz = self.prediccion.preparar_datos_prediccion(df)
+            if matriz is None or len(matriz.X) < 50:
+                raise ValueError('No hay datos suficientes para la validación cruzada temporal')
+
+            X, y = matriz.entrenamiento()
+            orden = orden_temporal(matriz)
+            X, y = X[orden], y[orden]
+
+            candidatos = candidatos_grilla(self.grilla)
+            self._actualizar_estado(total_candidatos=len(candidatos))
+            agotado = self._evaluar(candidatos, X, y, inicio + self.presupuesto)
+            self._actualizar_estado(presupuesto_agotado=agotado)
+
+            estado = self.obtener_estado()
+            mejor = estado['mejor']
+            if mejor is None:
+                if estado['fallidos']:
+                    raise ValueError(f"Ningún candidato pudo validarse: {estado['fallidos'][0]['error']}")
+                raise TimeoutError('El presupuesto de tiempo terminó antes de evaluar algún candidato')
+
+            # El ganador se entrena con todos los datos y se registra con sus métricas de validación
+            parametros = mejor['parametros']
+            inicio_entrenamiento = time.perf_counter()
+            scaler = StandardScaler()
+            modelo = RandomForestRegressor(n_jobs=-1, **parametros)
+            modelo.fit(scaler.fit_transform(X), y)
+            duracion = time.perf_counter() - inicio_entrenamiento
+
+            tiempos = dict(self.prediccion.metricas.get('tiempos_entrenamiento', {}), ajuste=round(duracion, 3))
+            metricas = {
+                'mae': mejor['mae'],
+                'r2': mejor['r2'],
+                'precision': float(max(0, min(100, mejor['r2'] * 100))),
+                'validacion': 'temporal',
+                'pliegues': self.pliegues,
+                'candidatos_evaluados': len(estado['resultados']),
+                'candidatos_fallidos': len(estado['fallidos']),
+                'modo': 'ajuste',
+                'tiempo_entrenamiento': round(duracion, 3),
+                'tiempos_entrenamiento': tiempos,
+                'arboles': len(modelo.estimators_),
+                'registros_entrenamiento': len(X)
+            }
+            version = self.prediccion.registro.version(matriz.version, matriz.features, parametros)
+            self.prediccion.registrar_modelo(version, matriz, modelo, scaler, metricas, parametros, modo='ajuste')
+
+            self._actualizar_estado(
+                estado='completado',
+                version=version,
+                fin=datetime.now().isoformat(),
+                duracion_total=round(time.perf_counter() - inicio, 4)
+            )
+            return {'version': version, 'parametros': parametros, 'metricas': metricas}
+
+        except Exception as e:
+            print(f"Error en el ajuste de hiperparámetros: {e}")
+            self._actualizar_estado(estado='error', error=str(e), fin=datetime.now().isoformat())
+            return None
+
+    def ejecutar_en_segundo_plano(self, df):
+        """Lanza la búsqueda en un hilo; el modelo actual sigue en uso hasta que termine.
+
+        Retorna None sin lanzar nada si ya hay una búsqueda en curso.
+        """
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return None
+            self.estado = self._estado_inicial()
+            self.estado['estado'] = 'en_cola'
+            self._hilo = threading.Thread(target=self.ejecutar, args=(df,), daemon=True)
+            self._hilo.start()
+            return self._hilo
@@ -0,0 +1,213 @@
+"""
+Almacén de artefactos: archivos cargados, reportes y exportaciones con presupuesto de espacio y antigüedad
+"""
+import os
+import time
+import threading
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+
+# Subcarpeta de cada área dentro del directorio base
+AREAS_ARTEFACTOS = {
+    'cargas': 'cargas',
+    'reportes': 'reportes',
+    'exportaciones': 'exportaciones'
+}
+
+
+class AlmacenArtefactos:
+    """Índice en memoria de los archivos de cada área, en orden de último uso (LRU).
+
+    Los archivos se registran al escribirse y se marcan al descargarse, así que las
+    consultas no recorren los directorios; el barrido periódico hace un solo os.scandir
+    por área para incorporar archivos escritos por fuera del almacén y olvidar los que
+    ya no existen. Al superar max_bytes se eliminan los archivos usados hace más tiempo,
+    y los que superan max_edad (segundos desde su último uso) se eliminan en el barrido;
+    los archivos con descargas en curso nunca se eliminan.
+    """
+
+    def __init__(self, directorio='uploads', max_bytes=None, max_edad=None, al_eliminar=None):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.max_edad = max_edad
+        self.al_eliminar = al_eliminar  # al_eliminar(area, nombres) tras cada eliminación
+        self._lock = threading.Lock()
+        self._archivos = OrderedDict()  # (area, nombre) -> {'bytes', 'uso'}
+        self._en_uso = Counter()
+        self._bytes = 0
+        self._hilo = None
+        self._detener = threading.Event()
+        self.ultimo_barrido = None
+
+        for area in AREAS_ARTEFACTOS:
+            os.makedirs(self.ruta(area), exist_ok=True)
+        self._escanear()
+
+    def ruta(self, area, nombre=None):
+        """Directorio del área, o ruta de un archivo dentro de ella"""
+        directorio = os.path.join(self.directorio, AREAS_ARTEFACTOS[area])
+        return directorio if nombre is None else os.path.join(directorio, nombre)
+
+    def _escanear(self):
+        """Sincroniza el índice con el contenido de las áreas (un os.scandir por área)"""
+        encontrados = {}
+        for area in AREAS_ARTEFACTOS:
+            try:
+                with os.scandir(self.ruta(area)) as entradas:
+                    for entrada in entradas:
+                        # Los archivos ocultos (índice del caché, temporales) no se administran
+                        if entrada.name.startswith('.') or not entrada.is_file():
+                            continue
+                        info = entrada.stat()
+                        encontrados[(area, entrada.name)] = (info.st_size, info.st_mtime)
+            except OSError:
+                continue
+
+        with self._lock:
+            for clave in [c for c in self._archivos if c not in encontrados]:
+                self._bytes -= self._archivos.pop(clave)['bytes']
+            # Los archivos desconocidos entran por su fecha de modificación
+            nuevos = sorted((mtime, clave, tamano) for clave, (tamano, mtime) in encontrados.items()
+                            if clave not in self._archivos)
+            for mtime, clave, tamano in nuevos:
+                self._archivos[clave] = {'bytes': tamano, 'uso': mtime}
+                self._bytes += tamano
+            if nuevos:
+                ordenados = sorted(self._archivos.items(), key=lambda item: item[1]['uso'])
+                self._archivos = OrderedDict(ordenados)
+
+    def registrar(self, area, nombre):
+        """Registra un archivo recién escrito en el área y aplica el presupuesto de espacio"""
+        if not nombre:
+            return nombre
+        try:
+            tamano = os.path.getsize(self.ruta(area, nombre))
+        except OSError:
+            return nombre
+        with self._lock:
+            anterior = self._archivos.pop((area, nombre), None)
+            if anterior:
+                self._bytes -= anterior['bytes']
+            self._archivos[(area, nombre)] = {'bytes': tamano, 'uso': time.time()}
+            self._bytes += tamano
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            self._eliminar(self._seleccionar(time.time(), solo_presupuesto=True))
+        return nombre
+
+    def tocar(self, area, nombre):
+        """Marca el archivo como usado recién (pasa al final del orden de eliminación)"""
+        with self._lock:
+            info = self._archivos.get((area, nombre))
+            if info:
+                info['uso'] = time.time()
+                self._archivos.move_to_end((area, nombre))
+
+    def adquirir(self, area, nombre):
+        """Protege el archivo de la eliminación mientras se envía; retorna False si no existe"""
+        with self._lock:
+            if (area, nombre) not in self._archivos and not os.path.isfile(self.ruta(area, nombre)):
+                return False
+            self._en_uso[(area, nombre)] += 1
+        self.tocar(area, nombre)
+        return True
+
+    def liberar(self, area, nombre):
+        with self._lock:
+            self._en_uso[(area, nombre)] -= 1
+            if self._en_uso[(area, nombre)] <= 0:
+                del self._en_uso[(area, nombre)]
+
+    @contextmanager
+    def usando(self, area, nombre):
+        disponible = self.adquirir(area, nombre)
+        try:
+            yield disponible
+        finally:
+            if disponible:
+                self.liberar(area, nombre)
+
+    def _seleccionar(self, ahora, solo_presupuesto=False):
+        """Archivos a eliminar: vencidos por antigüedad y, del menos al más usado, los que exceden el presupuesto"""
+        with self._lock:
+            seleccion = []
+            restantes = self._bytes
+            for clave, info in self._archivos.items():
+                if self._en_uso.get(clave):
+                    continue
+                vencido = (not solo_presupuesto and self.max_edad is not None
+                           and ahora - info['uso'] > self.max_edad)
+                excedido = self.max_bytes is not None and restantes > self.max_bytes
+                if not (vencido or excedido):
+                    # El resto del orden se usó más recientemente
+                    break
+                seleccion.append(clave)
+                restantes -= info['bytes']
+            return seleccion
+
+    def _eliminar(self, claves):
+        eliminados = {}
+        for area, nombre in claves:
+            with self._lock:
+                if self._en_uso.get((area, nombre)) or (area, nombre) not in self._archivos:
+                    continue
+                info = self._archivos.pop((area, nombre))
+                self._bytes -= info['bytes']
+            try:
+                os.remove(self.ruta(area, nombre))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error eliminando artefacto {area}/{nombre}: {e}")
+                continue
+            eliminados.setdefault(area, []).append(nombre)
+
+        if self.al_eliminar is not None:
+            for area, nombres in eliminados.items():
+                try:
+                    self.al_eliminar(area, nombres)
+                except Exception as e:
+                    print(f"Error notificando artefactos eliminados: {e}")
+        return eliminados
+
+    def barrer(self):
+        """Sincroniza el índice y elimina los archivos vencidos o fuera de presupuesto"""
+        self._escanear()
+        eliminados = self._eliminar(self._seleccionar(time.time()))
+        self.ultimo_barrido = time.time()
+        return eliminados
+
+    def iniciar_barrido(self, intervalo):
+        """Barre las áreas cada `intervalo` segundos en un hilo de fondo"""
+        if self._hilo is not None and self._hilo.is_alive():
+            return self._hilo
+
+        def tarea():
+            while not self._detener.wait(intervalo):
+                try:
+                    self.barrer()
+                except Exception as e:
+                    print(f"Error en el barrido de artefactos: {e}")
+
+        self._detener.clear()
+        self._hilo = threading.Thread(target=tarea, daemon=True, name='barrido_artefactos')
+        self._hilo.start()
+        return self._hilo
+
+    def detener_barrido(self):
+        self._detener.set()
+
+    def obtener_estado(self):
+        """Uso de espacio por área y límites configurados"""
+        with self._lock:
+            areas = {area: {'archivos': 0, 'bytes': 0} for area in AREAS_ARTEFACTOS}
+            for (area, _), info in self._archivos.items():
+                areas[area]['archivos'] += 1
+                areas[area]['bytes'] += info['bytes']
+            return {
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_edad': self.max_edad,
+                'descargas_en_curso': sum(self._en_uso.values()),
+                'ultimo_barrido': self.ultimo_barrido,
+                'areas': areas
+            }
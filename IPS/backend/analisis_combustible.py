@@ -7,14 +7,46 @@ from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
 import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
+from .contexto_reporte import ContextoReporte, DIAS_SEMANA, DIAS_FIN_DE_SEMANA, NIVELES_RIESGO
+from .reportes_ligeros import datos_reporte_anomalias, guardar_reporte_ligero
+from .reduccion_datos import graficar_dispersion, indices_muestra
+from .tabla_pdf import TablaPDF
+from .render_graficos import renderizar
 import warnings
 warnings.filterwarnings('ignore')
 
 # Configurar matplotlib para evitar problemas con GUI
 plt.switch_backend('Agg')
 
+# Características usadas por el modelo de detección de anomalías
+FEATURES_ANOMALIAS = [
+    'TIPO_COMBUSTIBLE', 
+    'KM_RECORRIDO',
+    'CANTIDAD_GALONES',
+    'PRECIO',
+    'TOTAL_CONSUMO',
+    'EFICIENCIA',
+    'COSTO_POR_KM',
+    'DIA_SEMANA'
+]
+
+# Columnas que agrega la detección de anomalías
+COLUMNAS_ANOMALIA = ['ANOMALIA', 'SCORE_ANOMALIA', 'NIVEL_RIESGO']
+
+# Columnas del anexo con el listado completo de vales anómalos: (título, columna, formato, alineación)
+COLUMNAS_ANEXO_ANOMALIAS = [
+    ('Fecha', 'FECHA_INGRESO_VALE', '{:%d/%m/%Y}', 'C'),
+    ('Placa', 'PLACA', None, 'C'),
+    ('Combustible', 'TIPO_COMBUSTIBLE', None, 'L'),
+    ('Galones', 'CANTIDAD_GALONES', '{:,.2f}', 'R'),
+    ('Km', 'KM_RECORRIDO', '{:,.1f}', 'R'),
+    ('Consumo (S/)', 'TOTAL_CONSUMO', '{:,.2f}', 'R'),
+    ('Eficiencia', 'EFICIENCIA', '{:.2f}', 'R'),
+    ('Score', 'SCORE_ANOMALIA', '{:.3f}', 'R'),
+    ('Nivel Riesgo', 'NIVEL_RIESGO', None, 'C')
+]
+
 
 def procesar_datos(df):
     # Realiza el procesamiento de datos después de cargar
@@ -97,8 +129,79 @@ def aplicar_filtros(df, mes, dependencia):
         print(f"Error al aplicar filtros: {str(e)}")
         return pd.DataFrame()
 
-def detectar_anomalias(df):
-    # Detecta anomalías en los datos filtrados
+def muestra_estratificada(df_model, tamano, columna='TIPO_COMBUSTIBLE', random_state=42):
+    """Muestra de a lo sumo `tamano` registros que conserva la proporción de cada categoría de `columna`"""
+    if tamano is None or len(df_model) <= tamano:
+        return df_model
+    if columna not in df_model.columns:
+        return df_model.sample(n=tamano, random_state=random_state)
+
+    # Registros por categoría con el método del resto mayor: la suma nunca supera `tamano`
+    grupos = df_model.groupby(columna)
+    cuotas = grupos.size() * (tamano / len(df_model))
+    n_grupo = np.floor(cuotas).astype(int)
+    faltan = int(round(cuotas.sum())) - int(n_grupo.sum())
+    if faltan > 0:
+        restos = (cuotas - n_grupo).sort_values(ascending=False, kind='stable')
+        n_grupo[restos.index[:faltan]] += 1
+    return pd.concat([grupo.sample(n=int(n_grupo[clave]), random_state=random_state) for clave, grupo in grupos])
+
+def ajustar_modelo_anomalias(df_model, tamano_muestra=None, n_jobs=None):
+    """Ajusta el preprocesador y el IsolationForest sobre registros sin valores faltantes.
+
+    Con tamano_muestra el ajuste se hace sobre una muestra estratificada por tipo de
+    combustible y X corresponde solo a esa muestra; los árboles se ajustan en paralelo con n_jobs.
+    """
+    df_ajuste = muestra_estratificada(df_model, tamano_muestra)
+    
+    # Separar variables numéricas y categóricas
+    numeric_features = df_ajuste.select_dtypes(include=np.number).columns.tolist()
+    categorical_features = df_ajuste.select_dtypes(include='object').columns.tolist()
+    
+    # Preparar la pipeline para el procesamiento de datos
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', StandardScaler(), numeric_features),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
+        ])
+    
+    X = preprocessor.fit_transform(df_ajuste)
+    iso_forest = IsolationForest(n_estimators=150, contamination=0.05, random_state=42, n_jobs=n_jobs)
+    iso_forest.fit(X)
+    
+    return preprocessor, iso_forest, X
+
+def puntuar_por_bloques(preprocessor, iso_forest, df_model, tamano_bloque=None):
+    """decision_function de todos los registros en bloques de tamaño fijo para acotar la memoria"""
+    if tamano_bloque is None or len(df_model) <= tamano_bloque:
+        return iso_forest.decision_function(preprocessor.transform(df_model))
+    decision = np.empty(len(df_model), dtype=np.float64)
+    for inicio in range(0, len(df_model), tamano_bloque):
+        bloque = df_model.iloc[inicio:inicio + tamano_bloque]
+        decision[inicio:inicio + len(bloque)] = iso_forest.decision_function(preprocessor.transform(bloque))
+    return decision
+
+def clasificar_nivel_riesgo(scores):
+    """Clasifica el score de anomalía en niveles de riesgo"""
+    return pd.cut(scores,
+                  bins=[-1, 0.3, 0.6, 0.9, 1.1],
+                  labels=NIVELES_RIESGO,
+                  include_lowest=True)
+
+def detectar_anomalias(df, detector='auto', umbral_isolation_forest=None, opciones_isolation_forest=None):
+    # Detecta anomalías en los datos filtrados con el detector indicado:
+    # 'robusto', 'isolation_forest' o 'auto' (IsolationForest solo para particiones grandes)
+    from .detectores_anomalias import seleccionar_detector, UMBRAL_ISOLATION_FOREST
+    
+    umbral = umbral_isolation_forest or UMBRAL_ISOLATION_FOREST
+    return seleccionar_detector(len(df), detector, umbral, opciones_isolation_forest).detectar(df)
+
+def detectar_anomalias_isolation_forest(df, tamano_muestra=None, tamano_bloque=None, n_jobs=None):
+    # Detecta anomalías con IsolationForest sobre la partición
+    # En particiones grandes se ajusta sobre una muestra acotada y se puntúa por bloques
+    # Descartar resultados previos (p. ej. del procesamiento en lote) para no duplicar columnas
+    df = df.drop(columns=[c for c in COLUMNAS_ANOMALIA if c in df.columns])
+    
     if df.empty or len(df) < 10:  # Necesitamos un mínimo de registros
         print("Datos insuficientes para detección de anomalías")
         if not df.empty:
@@ -108,19 +211,8 @@ def detectar_anomalias(df):
         return df
     
     # Seleccionamos características relevantes del dataset
-    features = [
-        'TIPO_COMBUSTIBLE', 
-        'KM_RECORRIDO',
-        'CANTIDAD_GALONES',
-        'PRECIO',
-        'TOTAL_CONSUMO',
-        'EFICIENCIA',
-        'COSTO_POR_KM',
-        'DIA_SEMANA'
-    ]
-    
     # Filtrar solo datos disponibles y con valores válidos
-    features = [f for f in features if f in df.columns]
+    features = [f for f in FEATURES_ANOMALIAS if f in df.columns]
     df_model = df[features].copy().dropna()
     
     # Verificar si tenemos datos suficientes para modelar
@@ -131,30 +223,17 @@ def detectar_anomalias(df):
         df['NIVEL_RIESGO'] = 'Bajo'
         return df
     
-    # Separar variables numéricas y categóricas
-    numeric_features = df_model.select_dtypes(include=np.number).columns.tolist()
-    categorical_features = df_model.select_dtypes(include='object').columns.tolist()
-    
-    # Preparar la pipeline para el procesamiento de datos
-    preprocessor = ColumnTransformer(
-        transformers=[
-            ('num', StandardScaler(), numeric_features),
-            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
-        ])
-    
     try:
-        # Procesamiento
-        X = preprocessor.fit_transform(df_model)
-        
-        # Detección de anomalías
-        iso_forest = IsolationForest(n_estimators=150, contamination=0.05, random_state=42)
-        iso_pred = iso_forest.fit_predict(X)
+        # Procesamiento y detección de anomalías
+        preprocessor, iso_forest, _ = ajustar_modelo_anomalias(df_model, tamano_muestra, n_jobs)
+        decision = puntuar_por_bloques(preprocessor, iso_forest, df_model, tamano_bloque)
         
         # Añadir resultados al dataframe
         # Primero creamos un DataFrame temporal con los índices de df_model
+        # (predict de IsolationForest equivale a decision_function < 0)
         temp_df = pd.DataFrame(index=df_model.index)
-        temp_df['ANOMALIA'] = np.where(iso_pred == -1, 1, 0)
-        temp_df['SCORE_ANOMALIA'] = iso_forest.decision_function(X) * -1
+        temp_df['ANOMALIA'] = np.where(decision < 0, 1, 0)
+        temp_df['SCORE_ANOMALIA'] = decision * -1
         
         # Luego unimos con el df original
         df = df.join(temp_df, how='left')
@@ -164,10 +243,7 @@ def detectar_anomalias(df):
         df['SCORE_ANOMALIA'] = df['SCORE_ANOMALIA'].fillna(0)
         
         # Clasificación de nivel de riesgo
-        df['NIVEL_RIESGO'] = pd.cut(df['SCORE_ANOMALIA'],
-                                    bins=[-1, 0.3, 0.6, 0.9, 1.1],
-                                    labels=['Bajo', 'Moderado', 'Alto', 'Critico'],
-                                    include_lowest=True)
+        df['NIVEL_RIESGO'] = clasificar_nivel_riesgo(df['SCORE_ANOMALIA'])
     # Manejo de errores en la detección
     except Exception as e:
         print(f"Error en detección de anomalías: {str(e)}")
@@ -177,155 +253,141 @@ def detectar_anomalias(df):
     
     return df
 
-def crear_graficos_pdf(df, mes, dependencia):
-    """Crea gráficos para incluir en el PDF"""
-    graficos = {}
+def _grafico_eficiencia_hist(eficiencia):
+    plt.figure(figsize=(10, 6))
+    plt.hist(eficiencia, bins=20, alpha=0.7, color='skyblue', edgecolor='black')
+    plt.axvline(eficiencia.mean(), color='red', linestyle='--', linewidth=2, label=f'Promedio: {eficiencia.mean():.2f}')
+    plt.xlabel('Eficiencia (km/gal)')
+    plt.ylabel('Frecuencia')
+    plt.title('Distribución de Eficiencia de Combustible')
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+
+def _grafico_consumo_diario(dias, valores):
+    plt.figure(figsize=(12, 6))
+    bars = plt.bar(dias, valores, color='lightcoral', alpha=0.8)
+    plt.xlabel('Día de la Semana')
+    plt.ylabel('Consumo Total (S/)')
+    plt.title('Consumo de Combustible por Día de la Semana')
+    plt.xticks(rotation=45)
+    
+    # Agregar valores en las barras
+    for bar, valor in zip(bars, valores):
+        plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(valores)*0.01, 
+                f'S/ {valor:,.0f}', ha='center', va='bottom', fontsize=9)
+    
+    plt.grid(True, alpha=0.3)
+
+def _grafico_anomalias_pie(niveles, conteos):
+    plt.figure(figsize=(10, 8))
+    
+    # Crear gráfico de pastel
+    colors = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99']
+    wedges, texts, autotexts = plt.pie(conteos, labels=niveles, 
+                                      autopct='%1.1f%%', colors=colors, startangle=90)
+    
+    # Mejorar la presentación
+    for autotext in autotexts:
+        autotext.set_color('white')
+        autotext.set_fontweight('bold')
+    
+    plt.title('Distribución de Anomalías por Nivel de Riesgo', fontsize=14, fontweight='bold')
+
+def _grafico_eficiencia_consumo(normales_x, normales_y, anomalos_x, anomalos_y, max_puntos=None, celdas=None):
+    plt.figure(figsize=(10, 6))
     
-    # Crear directorio temporal para gráficos
-    temp_dir = 'temp_graficos'
-    os.makedirs(temp_dir, exist_ok=True)
+    # Con muchos registros los normales se agregan en hexágonos y los anómalos se submuestrean
+    graficar_dispersion(plt.gca(), normales_x, normales_y, max_puntos=max_puntos, celdas=celdas,
+                        alpha=0.6, color='blue', label='Normal', s=50)
     
-    # Configurar estilo de matplotlib
-    plt.style.use('seaborn-v0_8')
-    sns.set_palette("husl")
+    if len(anomalos_x):
+        muestra = indices_muestra(len(anomalos_x), max_puntos)
+        plt.scatter(anomalos_x[muestra], anomalos_y[muestra], 
+                   alpha=0.8, color='red', label='Anomalía', s=100, marker='x')
+    
+    plt.xlabel('Eficiencia (km/gal)')
+    plt.ylabel('Consumo Total (S/)')
+    plt.title('Relación entre Eficiencia y Consumo Total')
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+
+def _grafico_tendencia_temporal(fechas, valores):
+    plt.figure(figsize=(12, 6))
+    # Los marcadores solo se dibujan si hay pocos puntos
+    plt.plot(fechas, valores, 
+            marker='o' if len(fechas) <= 60 else None,
+            linewidth=2, markersize=6, color='green')
+    plt.xlabel('Fecha')
+    plt.ylabel('Consumo Total (S/)')
+    plt.title('Tendencia de Consumo a lo largo del Tiempo')
+    plt.xticks(rotation=45)
+    plt.grid(True, alpha=0.3)
+
+def _grafico_top_vehiculos(placas, valores):
+    plt.figure(figsize=(12, 8))
+    bars = plt.barh(range(len(placas)), valores, color='orange', alpha=0.8)
+    plt.yticks(range(len(placas)), placas)
+    plt.xlabel('Consumo Total (S/)')
+    plt.title('Top 10 Vehículos con Mayor Consumo de Combustible')
+    plt.gca().invert_yaxis()
+    
+    # Agregar valores en las barras
+    for bar, valor in zip(bars, valores):
+        plt.text(bar.get_width() + max(valores)*0.01, bar.get_y() + bar.get_height()/2, 
+                f'S/ {valor:,.0f}', va='center', fontsize=9)
+    
+    plt.grid(True, alpha=0.3)
+
+def crear_graficos_pdf(df, mes, dependencia, cubo=None, perfil=None, contexto=None, limites=None):
+    """Crea los gráficos del PDF en memoria, dibujados en paralelo en el pool de render_graficos.
+
+    Los datos de cada gráfico se leen del ContextoReporte (se construye aquí con `limites` si
+    no se indica); perfil elige resolución y formato de las imágenes (ver PERFILES_SALIDA).
+    """
+    contexto = contexto or ContextoReporte.construir(df, mes, dependencia, cubo, limites)
+    tareas = {}
     
     # 1. Gráfico de eficiencia (histograma)
-    if 'EFICIENCIA' in df.columns:
-        plt.figure(figsize=(10, 6))
-        eficiencia = df['EFICIENCIA'].dropna()
-        if not eficiencia.empty:
-            plt.hist(eficiencia, bins=20, alpha=0.7, color='skyblue', edgecolor='black')
-            plt.axvline(eficiencia.mean(), color='red', linestyle='--', linewidth=2, label=f'Promedio: {eficiencia.mean():.2f}')
-            plt.xlabel('Eficiencia (km/gal)')
-            plt.ylabel('Frecuencia')
-            plt.title('Distribución de Eficiencia de Combustible')
-            plt.legend()
-            plt.grid(True, alpha=0.3)
-            grafico_path = os.path.join(temp_dir, 'eficiencia_hist.png')
-            plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            graficos['eficiencia_hist'] = grafico_path
+    if contexto.eficiencia is not None:
+        tareas['eficiencia_hist'] = (_grafico_eficiencia_hist, {'eficiencia': contexto.eficiencia['valores']})
     
     # 2. Gráfico de consumo por día de la semana
-    if 'DIA_SEMANA' in df.columns and 'TOTAL_CONSUMO' in df.columns:
-        plt.figure(figsize=(12, 6))
-        dias = {0: 'Lunes', 1: 'Martes', 2: 'Miércoles', 3: 'Jueves', 
-                4: 'Viernes', 5: 'Sábado', 6: 'Domingo'}
-        df['DIA_NOMBRE'] = df['DIA_SEMANA'].map(dias)
-        consumo_diario = df.groupby('DIA_NOMBRE')['TOTAL_CONSUMO'].sum()
-        
-        # Reordenar días de la semana
-        orden_dias = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-        consumo_diario = consumo_diario.reindex(orden_dias, fill_value=0)
-        
-        bars = plt.bar(consumo_diario.index, consumo_diario.values, color='lightcoral', alpha=0.8)
-        plt.xlabel('Día de la Semana')
-        plt.ylabel('Consumo Total (S/)')
-        plt.title('Consumo de Combustible por Día de la Semana')
-        plt.xticks(rotation=45)
-        
-        # Agregar valores en las barras
-        for bar, valor in zip(bars, consumo_diario.values):
-            plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(consumo_diario.values)*0.01, 
-                    f'S/ {valor:,.0f}', ha='center', va='bottom', fontsize=9)
-        
-        plt.grid(True, alpha=0.3)
-        grafico_path = os.path.join(temp_dir, 'consumo_diario.png')
-        plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        graficos['consumo_diario'] = grafico_path
+    if contexto.consumo_diario is not None:
+        consumo_diario = contexto.consumo_diario.reindex(DIAS_SEMANA, fill_value=0)
+        tareas['consumo_diario'] = (_grafico_consumo_diario, {
+            'dias': DIAS_SEMANA, 'valores': consumo_diario.to_numpy(dtype=float)
+        })
     
     # 3. Gráfico de anomalías por nivel de riesgo
-    if 'NIVEL_RIESGO' in df.columns:
-        plt.figure(figsize=(10, 8))
-        distribucion = df['NIVEL_RIESGO'].value_counts()
-        
-        # Crear gráfico de pastel
-        colors = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99']
-        wedges, texts, autotexts = plt.pie(distribucion.values, labels=distribucion.index, 
-                                          autopct='%1.1f%%', colors=colors, startangle=90)
-        
-        # Mejorar la presentación
-        for autotext in autotexts:
-            autotext.set_color('white')
-            autotext.set_fontweight('bold')
-        
-        plt.title('Distribución de Anomalías por Nivel de Riesgo', fontsize=14, fontweight='bold')
-        grafico_path = os.path.join(temp_dir, 'anomalias_pie.png')
-        plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        graficos['anomalias_pie'] = grafico_path
+    if contexto.riesgo is not None:
+        tareas['anomalias_pie'] = (_grafico_anomalias_pie, {
+            'niveles': contexto.riesgo.index.tolist(), 'conteos': contexto.riesgo['CANTIDAD'].to_numpy()
+        })
     
     # 4. Gráfico de dispersión: Eficiencia vs Consumo
-    if 'EFICIENCIA' in df.columns and 'TOTAL_CONSUMO' in df.columns:
-        plt.figure(figsize=(10, 6))
-        
-        # Separar datos normales y anómalos
-        normales = df[df['ANOMALIA'] == 0] if 'ANOMALIA' in df.columns else df
-        anomalos = df[df['ANOMALIA'] == 1] if 'ANOMALIA' in df.columns else pd.DataFrame()
-        
-        plt.scatter(normales['EFICIENCIA'], normales['TOTAL_CONSUMO'], 
-                   alpha=0.6, color='blue', label='Normal', s=50)
-        
-        if not anomalos.empty:
-            plt.scatter(anomalos['EFICIENCIA'], anomalos['TOTAL_CONSUMO'], 
-                       alpha=0.8, color='red', label='Anomalía', s=100, marker='x')
-        
-        plt.xlabel('Eficiencia (km/gal)')
-        plt.ylabel('Consumo Total (S/)')
-        plt.title('Relación entre Eficiencia y Consumo Total')
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-        grafico_path = os.path.join(temp_dir, 'eficiencia_consumo.png')
-        plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        graficos['eficiencia_consumo'] = grafico_path
-    
-    # 5. Gráfico de tendencia mensual (si hay datos de fecha)
-    if 'FECHA_INGRESO_VALE' in df.columns:
-        plt.figure(figsize=(12, 6))
-        df_temp = df.copy()
-        df_temp['FECHA'] = pd.to_datetime(df_temp['FECHA_INGRESO_VALE'])
-        
-        # Agrupar por día y calcular consumo total
-        consumo_temporal = df_temp.groupby(df_temp['FECHA'].dt.date)['TOTAL_CONSUMO'].sum().reset_index()
-        
-        if len(consumo_temporal) > 1:
-            plt.plot(consumo_temporal['FECHA'], consumo_temporal['TOTAL_CONSUMO'], 
-                    marker='o', linewidth=2, markersize=6, color='green')
-            plt.xlabel('Fecha')
-            plt.ylabel('Consumo Total (S/)')
-            plt.title('Tendencia de Consumo a lo largo del Tiempo')
-            plt.xticks(rotation=45)
-            plt.grid(True, alpha=0.3)
-            grafico_path = os.path.join(temp_dir, 'tendencia_temporal.png')
-            plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            graficos['tendencia_temporal'] = grafico_path
+    if contexto.dispersion is not None:
+        dispersion = contexto.dispersion
+        tareas['eficiencia_consumo'] = (_grafico_eficiencia_consumo, {
+            'normales_x': dispersion['x'][dispersion['normal']], 'normales_y': dispersion['y'][dispersion['normal']],
+            'anomalos_x': dispersion['x'][dispersion['anomalo']], 'anomalos_y': dispersion['y'][dispersion['anomalo']],
+            'max_puntos': contexto.limites.max_puntos_dispersion, 'celdas': contexto.limites.celdas_dispersion
+        })
+    
+    # 5. Gráfico de tendencia (consumo diario ya reducido con LTTB)
+    if contexto.consumo_temporal is not None:
+        tareas['tendencia_temporal'] = (_grafico_tendencia_temporal, {
+            'fechas': contexto.consumo_temporal.index.to_numpy(),
+            'valores': contexto.consumo_temporal.to_numpy(dtype=float)
+        })
     
     # 6. Top 10 vehículos con mayor consumo
-    if 'PLACA' in df.columns:
-        plt.figure(figsize=(12, 8))
-        consumo_por_vehiculo = df.groupby('PLACA')['TOTAL_CONSUMO'].sum().sort_values(ascending=False).head(10)
-        
-        bars = plt.barh(range(len(consumo_por_vehiculo)), consumo_por_vehiculo.values, color='orange', alpha=0.8)
-        plt.yticks(range(len(consumo_por_vehiculo)), consumo_por_vehiculo.index)
-        plt.xlabel('Consumo Total (S/)')
-        plt.title('Top 10 Vehículos con Mayor Consumo de Combustible')
-        plt.gca().invert_yaxis()
-        
-        # Agregar valores en las barras
-        for i, (bar, valor) in enumerate(zip(bars, consumo_por_vehiculo.values)):
-            plt.text(bar.get_width() + max(consumo_por_vehiculo.values)*0.01, bar.get_y() + bar.get_height()/2, 
-                    f'S/ {valor:,.0f}', va='center', fontsize=9)
-        
-        plt.grid(True, alpha=0.3)
-        grafico_path = os.path.join(temp_dir, 'top_vehiculos.png')
-        plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        graficos['top_vehiculos'] = grafico_path
-    
-    return graficos
+    if contexto.top_consumo_vehiculos is not None:
+        tareas['top_vehiculos'] = (_grafico_top_vehiculos, {
+            'placas': contexto.top_consumo_vehiculos.index.tolist(),
+            'valores': contexto.top_consumo_vehiculos.to_numpy(dtype=float)
+        })
+    
+    return renderizar(tareas, perfil)
     """Genera un reporte en PDF con gráficos y tablas de anomalías"""
     try:
         # Configurar PDF
@@ -461,15 +523,25 @@ def crear_graficos_pdf(df, mes, dependencia):
         print(f"Error al generar PDF: {str(e)}")
         return None
     
-def generar_reporte_anomalias(df, mes, dependencia):
-    """Función que decide qué tipo de reporte generar (PDF por defecto)"""
-    return generar_reporte_pdf(df, mes, dependencia)
+def generar_reporte_anomalias(df, mes, dependencia, cubo=None, perfil=None, formato='pdf', directorio='uploads',
+                              limites=None):
+    """Función que decide qué tipo de reporte generar (PDF por defecto; 'html' o 'json'
+    usan los mismos agregados sin dibujar con matplotlib ni armar el PDF)"""
+    if formato == 'pdf':
+        return generar_reporte_pdf(df, mes, dependencia, cubo, perfil, directorio, limites)
+    try:
+        contexto = ContextoReporte.construir(df, mes, dependencia, cubo, limites)
+        return guardar_reporte_ligero(datos_reporte_anomalias(contexto), 'reporte_completo', formato, directorio)
+    except Exception as e:
+        print(f"Error al generar reporte {formato}: {str(e)}")
+        return None
 
-def generar_reporte_pdf(df, mes, dependencia):
+def generar_reporte_pdf(df, mes, dependencia, cubo=None, perfil=None, directorio='uploads', limites=None):
     """Genera un reporte en PDF mejorado con gráficos y tablas detalladas"""
     try:
-        # Crear gráficos
-        graficos = crear_graficos_pdf(df, mes, dependencia)
+        # Agregados del reporte, compartidos por gráficos, tablas y recomendaciones
+        contexto = ContextoReporte.construir(df, mes, dependencia, cubo, limites)
+        graficos = crear_graficos_pdf(df, mes, dependencia, cubo, perfil, contexto)
         
         # Configurar PDF
         pdf = FPDF()
@@ -493,13 +565,13 @@ def generar_reporte_pdf(df, mes, dependencia):
         pdf.cell(0, 10, 'RESUMEN EJECUTIVO', 0, 1)
         pdf.ln(5)
         
-        # Calcular estadísticas principales
-        total_registros = len(df)
-        total_consumo = df['TOTAL_CONSUMO'].sum() if 'TOTAL_CONSUMO' in df.columns else 0
-        total_galones = df['CANTIDAD_GALONES'].sum() if 'CANTIDAD_GALONES' in df.columns else 0
-        total_km = df['KM_RECORRIDO'].sum() if 'KM_RECORRIDO' in df.columns else 0
-        total_anomalias = df['ANOMALIA'].sum() if 'ANOMALIA' in df.columns else 0
-        eficiencia_promedio = df['EFICIENCIA'].mean() if 'EFICIENCIA' in df.columns else 0
+        # Estadísticas principales
+        total_registros = contexto.total_registros
+        total_consumo = contexto.total_consumo
+        total_galones = contexto.total_galones
+        total_km = contexto.total_km
+        total_anomalias = contexto.total_anomalias
+        eficiencia_promedio = contexto.eficiencia_promedio
         
         pdf.set_font('Arial', '', 12)
         pdf.cell(0, 8, f'• Total de registros analizados: {total_registros:,}', 0, 1)
@@ -510,7 +582,7 @@ def generar_reporte_pdf(df, mes, dependencia):
         pdf.cell(0, 8, f'• Eficiencia promedio: {eficiencia_promedio:.2f} km/gal', 0, 1)
         
         # Porcentaje de anomalías
-        porcentaje_anomalias = (total_anomalias / total_registros * 100) if total_registros > 0 else 0
+        porcentaje_anomalias = contexto.porcentaje_anomalias
         pdf.ln(5)
         pdf.set_font('Arial', 'B', 12)
         if porcentaje_anomalias > 10:
@@ -541,17 +613,17 @@ def generar_reporte_pdf(df, mes, dependencia):
             pdf.cell(0, 8, 'Análisis de Eficiencia:', 0, 1)
             pdf.set_font('Arial', '', 10)
             
-            eficiencia = df['EFICIENCIA'].dropna()
-            if not eficiencia.empty:
-                pdf.cell(0, 6, f'• Eficiencia mínima: {eficiencia.min():.2f} km/gal', 0, 1)
-                pdf.cell(0, 6, f'• Eficiencia máxima: {eficiencia.max():.2f} km/gal', 0, 1)
-                pdf.cell(0, 6, f'• Eficiencia promedio: {eficiencia.mean():.2f} km/gal', 0, 1)
-                pdf.cell(0, 6, f'• Desviación estándar: {eficiencia.std():.2f} km/gal', 0, 1)
+            eficiencia = contexto.eficiencia
+            if eficiencia is not None:
+                pdf.cell(0, 6, f'• Eficiencia mínima: {eficiencia["min"]:.2f} km/gal', 0, 1)
+                pdf.cell(0, 6, f'• Eficiencia máxima: {eficiencia["max"]:.2f} km/gal', 0, 1)
+                pdf.cell(0, 6, f'• Eficiencia promedio: {eficiencia["mean"]:.2f} km/gal', 0, 1)
+                pdf.cell(0, 6, f'• Desviación estándar: {eficiencia["std"]:.2f} km/gal', 0, 1)
                 
-                if eficiencia.mean() < 8:
+                if eficiencia['mean'] < 8:
                     pdf.set_text_color(255, 0, 0)
                     pdf.cell(0, 6, '⚠️ La eficiencia promedio está por debajo del estándar (8 km/gal)', 0, 1)
-                elif eficiencia.mean() > 12:
+                elif eficiencia['mean'] > 12:
                     pdf.set_text_color(0, 128, 0)
                     pdf.cell(0, 6, '✅ Excelente eficiencia promedio de combustible', 0, 1)
                 else:
@@ -576,12 +648,8 @@ def generar_reporte_pdf(df, mes, dependencia):
             pdf.cell(0, 8, 'Análisis del Consumo Diario:', 0, 1)
             pdf.set_font('Arial', '', 10)
             
-            if 'DIA_SEMANA' in df.columns:
-                dias = {0: 'Lunes', 1: 'Martes', 2: 'Miércoles', 3: 'Jueves', 
-                        4: 'Viernes', 5: 'Sábado', 6: 'Domingo'}
-                df['DIA_NOMBRE'] = df['DIA_SEMANA'].map(dias)
-                consumo_diario = df.groupby('DIA_NOMBRE')['TOTAL_CONSUMO'].sum()
-                
+            consumo_diario = contexto.consumo_diario
+            if consumo_diario is not None and not consumo_diario.empty:
                 dia_mayor_consumo = consumo_diario.idxmax()
                 dia_menor_consumo = consumo_diario.idxmin()
                 
@@ -589,8 +657,8 @@ def generar_reporte_pdf(df, mes, dependencia):
                 pdf.cell(0, 6, f'• Día con menor consumo: {dia_menor_consumo} (S/ {consumo_diario.min():,.2f})', 0, 1)
                 
                 # Análisis de fines de semana
-                consumo_fds = consumo_diario[['Sábado', 'Domingo']].sum()
-                consumo_semana = consumo_diario[['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes']].sum()
+                consumo_fds = contexto.consumo_fin_de_semana
+                consumo_semana = consumo_diario.drop(DIAS_FIN_DE_SEMANA, errors='ignore').sum()
                 
                 pdf.cell(0, 6, f'• Consumo en días laborables: S/ {consumo_semana:,.2f}', 0, 1)
                 pdf.cell(0, 6, f'• Consumo en fines de semana: S/ {consumo_fds:,.2f}', 0, 1)
@@ -621,11 +689,11 @@ def generar_reporte_pdf(df, mes, dependencia):
             
             # Datos de la tabla
             pdf.set_font('Arial', '', 9)
-            if 'NIVEL_RIESGO' in df.columns:
-                distribucion = df['NIVEL_RIESGO'].value_counts()
-                for nivel, cantidad in distribucion.items():
+            if contexto.riesgo is not None:
+                for nivel, fila in contexto.riesgo.iterrows():
+                    cantidad = int(fila['CANTIDAD'])
                     porcentaje = (cantidad / total_registros * 100) if total_registros > 0 else 0
-                    consumo_nivel = df[df['NIVEL_RIESGO'] == nivel]['TOTAL_CONSUMO'].sum()
+                    consumo_nivel = fila['CONSUMO']
                     
                     # Determinar color según nivel
                     if nivel == 'Critico':
@@ -659,14 +727,8 @@ def generar_reporte_pdf(df, mes, dependencia):
             pdf.cell(0, 8, 'Vehículos con Anomalías Detectadas:', 0, 1)
             pdf.ln(5)
             
-            if 'PLACA' in df.columns and 'ANOMALIA' in df.columns:
-                vehiculos_anomalias = df[df['ANOMALIA'] == 1].groupby('PLACA').agg({
-                    'ANOMALIA': 'count',
-                    'TOTAL_CONSUMO': 'sum',
-                    'EFICIENCIA': 'mean',
-                    'NIVEL_RIESGO': lambda x: x.mode().iloc[0] if not x.mode().empty else 'N/A'
-                }).sort_values('ANOMALIA', ascending=False).head(10)
-                
+            vehiculos_anomalias = contexto.vehiculos_anomalias
+            if vehiculos_anomalias is not None:
                 if not vehiculos_anomalias.empty:
                     # Encabezados de tabla
                     pdf.set_font('Arial', 'B', 8)
@@ -696,6 +758,41 @@ def generar_reporte_pdf(df, mes, dependencia):
                         
                         pdf.cell(50, 6, recomendacion, 1, 1, 'C')
         
+        # Página 6: Inconsistencias en la secuencia de cargas por vehículo
+        secuencia = contexto.secuencia
+        total_inconsistencias = contexto.total_inconsistencias
+        if total_inconsistencias > 0:
+            pdf.add_page()
+            pdf.set_font('Arial', 'B', 16)
+            pdf.cell(0, 10, 'INCONSISTENCIAS EN LA SECUENCIA DE CARGAS', 0, 1)
+            pdf.ln(5)
+            
+            pdf.set_font('Arial', '', 10)
+            pdf.cell(0, 6, f'• Vales con alguna inconsistencia: {total_inconsistencias:,}', 0, 1)
+            pdf.cell(0, 6, f'• Cargas seguidas (mismo día o demasiadas en 7 días): {int(secuencia["CARGA_RAPIDA"].sum()):,}', 0, 1)
+            pdf.cell(0, 6, f'• Cargas sobre la capacidad estimada del tanque: {int(secuencia["SOBRECARGA_TANQUE"].sum()):,}', 0, 1)
+            pdf.cell(0, 6, f'• Kilometraje que no explica el combustible cargado: {int(secuencia["KM_INCONSISTENTE"].sum()):,}', 0, 1)
+            pdf.ln(5)
+            
+            resumen_secuencia = contexto.resumen_secuencia
+            if resumen_secuencia is not None and not resumen_secuencia.empty:
+                pdf.set_font('Arial', 'B', 8)
+                pdf.cell(25, 6, 'Placa', 1, 0, 'C')
+                pdf.cell(20, 6, 'Vales', 1, 0, 'C')
+                pdf.cell(35, 6, 'Cargas Seguidas', 1, 0, 'C')
+                pdf.cell(35, 6, 'Sobrecarga Tanque', 1, 0, 'C')
+                pdf.cell(35, 6, 'Km Inconsistente', 1, 0, 'C')
+                pdf.cell(40, 6, 'Total Inconsistencias', 1, 1, 'C')
+                
+                pdf.set_font('Arial', '', 7)
+                for placa, row in resumen_secuencia.iterrows():
+                    pdf.cell(25, 6, str(placa), 1, 0, 'C')
+                    pdf.cell(20, 6, str(int(row['VALES'])), 1, 0, 'C')
+                    pdf.cell(35, 6, str(int(row['CARGA_RAPIDA'])), 1, 0, 'C')
+                    pdf.cell(35, 6, str(int(row['SOBRECARGA_TANQUE'])), 1, 0, 'C')
+                    pdf.cell(35, 6, str(int(row['KM_INCONSISTENTE'])), 1, 0, 'C')
+                    pdf.cell(40, 6, str(int(row['INCONSISTENCIA_SECUENCIA'])), 1, 1, 'C')
+        
         # Página final: Recomendaciones y conclusiones
         pdf.add_page()
         pdf.set_font('Arial', 'B', 16)
@@ -707,27 +804,8 @@ def generar_reporte_pdf(df, mes, dependencia):
         pdf.cell(0, 8, 'Recomendaciones:', 0, 1)
         pdf.set_font('Arial', '', 10)
         
-        recomendaciones = []
-        
-        if porcentaje_anomalias > 10:
-            recomendaciones.append('• URGENTE: Implementar programa de mantenimiento preventivo')
-            recomendaciones.append('• Revisar procedimientos de carga de combustible')
-            recomendaciones.append('• Capacitar a conductores en manejo eficiente')
-        
-        if eficiencia_promedio < 8:
-            recomendaciones.append('• Optimizar rutas para mejorar eficiencia')
-            recomendaciones.append('• Revisar estado mecánico de vehículos')
-        
-        if 'DIA_SEMANA' in df.columns:
-            consumo_fds = df[df['DIA_SEMANA'].isin([5, 6])]['TOTAL_CONSUMO'].sum()
-            if consumo_fds > total_consumo * 0.3:
-                recomendaciones.append('• Evaluar el uso de vehículos en fines de semana')
-        
-        recomendaciones.append('• Implementar sistema de monitoreo continuo')
-        recomendaciones.append('• Generar reportes mensuales de seguimiento')
-        
-        for rec in recomendaciones:
-            pdf.cell(0, 6, rec, 0, 1)
+        for rec in contexto.recomendaciones():
+            pdf.cell(0, 6, f'• {rec}', 0, 1)
         
         pdf.ln(10)
         pdf.set_font('Arial', 'B', 12)
@@ -745,23 +823,26 @@ def generar_reporte_pdf(df, mes, dependencia):
         pdf.cell(0, 10, 'Sistema de Análisis de Combustible - Municipalidad de Ate', 0, 1, 'C')
         pdf.cell(0, 10, f'Generado el: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}', 0, 1, 'C')
         
+        # Anexo: listado completo de vales anómalos
+        vales_anomalos = contexto.vales_anomalos
+        if vales_anomalos is not None and not vales_anomalos.empty:
+            pdf.add_page()
+            pdf.set_font('Arial', 'B', 16)
+            pdf.cell(0, 10, 'ANEXO: LISTADO DE VALES CON ANOMALÍAS', 0, 1)
+            pdf.set_font('Arial', '', 10)
+            pdf.cell(0, 6, f'{len(vales_anomalos):,} vales ordenados por score de anomalía', 0, 1)
+            pdf.ln(3)
+            
+            columnas = [c for c in COLUMNAS_ANEXO_ANOMALIAS if c[1] in vales_anomalos.columns]
+            TablaPDF(pdf, columnas).dibujar(vales_anomalos)
+        
         # Guardar archivo
-        os.makedirs('uploads', exist_ok=True)
+        os.makedirs(directorio, exist_ok=True)
         nombre_archivo = f"reporte_completo_{dependencia}_mes{mes}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         nombre_archivo = re.sub(r'[^a-zA-Z0-9_.-]', '', nombre_archivo)  # Limpiar nombre
-        ruta_completa = os.path.join('uploads', nombre_archivo)
+        ruta_completa = os.path.join(directorio, nombre_archivo)
         pdf.output(ruta_completa)
         
-        # Limpiar archivos temporales de gráficos
-        for grafico_path in graficos.values():
-            if os.path.exists(grafico_path):
-                os.remove(grafico_path)
-        
-        # Eliminar directorio temporal
-        temp_dir = 'temp_graficos'
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-        
         print(f"Reporte PDF mejorado generado: {nombre_archivo}")
         return nombre_archivo
         
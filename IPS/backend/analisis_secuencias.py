@@ -0,0 +1,157 @@
+"""
+Análisis de secuencias de vales por vehículo: cargas seguidas, sobrecarga de tanque y kilometraje inconsistente
+"""
+import numpy as np
+import pandas as pd
+
+# Columnas que agrega el análisis de secuencias
+COLUMNAS_SECUENCIA = [
+    'DIAS_DESDE_CARGA_ANTERIOR',
+    'CARGAS_VENTANA',
+    'GALONES_VENTANA',
+    'CAPACIDAD_ESTIMADA',
+    'CARGA_RAPIDA',
+    'SOBRECARGA_TANQUE',
+    'KM_INCONSISTENTE',
+    'INCONSISTENCIA_SECUENCIA'
+]
+
+FLAGS_SECUENCIA = ['CARGA_RAPIDA', 'SOBRECARGA_TANQUE', 'KM_INCONSISTENTE']
+
+
+def _por_vehiculo(codigos, valores, n_vehiculos, estadistico, min_registros):
+    """Estadístico de valores por vehículo; NaN para vehículos con menos de min_registros valores"""
+    serie = pd.Series(valores).groupby(codigos)
+    if estadistico == 'mediana':
+        resultado = serie.median()
+    else:
+        resultado = serie.quantile(estadistico)
+    resultado[serie.count() < min_registros] = np.nan
+    return resultado.reindex(np.arange(n_vehiculos)).to_numpy(dtype=np.float64)
+
+
+class AnalizadorSecuencias:
+    """Evalúa los vales consecutivos de cada PLACA ordenando una sola vez por (PLACA, FECHA_INGRESO_VALE).
+
+    Los rezagos se obtienen comparando cada fila con la anterior del arreglo ordenado y las
+    ventanas móviles con búsqueda binaria sobre la clave (vehículo, día), por lo que toda la
+    flota se procesa en O(n log n) sin iterar por vehículo.
+    """
+
+    def __init__(self, configuracion=None):
+        self.configuracion = {
+            'dias_minimos_entre_cargas': 1,   # Cargas del mismo día se consideran seguidas
+            'ventana_dias': 7,
+            'max_cargas_ventana': 5,
+            'percentil_capacidad': 0.9,       # Capacidad estimada: percentil de galones del vehículo...
+            'margen_capacidad': 1.25,         # ...por este margen (si no existe CAPACIDAD_TANQUE)
+            'factor_km': 2.0,                 # Tolerancia entre km recorridos y combustible cargado
+            'min_registros_vehiculo': 5
+        }
+        if configuracion:
+            self.configuracion.update(configuracion)
+
+    def _resultado_vacio(self, df):
+        resultado = pd.DataFrame(index=df.index)
+        for columna in ['DIAS_DESDE_CARGA_ANTERIOR', 'GALONES_VENTANA', 'CAPACIDAD_ESTIMADA']:
+            resultado[columna] = np.nan
+        for columna in ['CARGAS_VENTANA'] + FLAGS_SECUENCIA + ['INCONSISTENCIA_SECUENCIA']:
+            resultado[columna] = 0
+        return resultado
+
+    def analizar(self, df):
+        """Retorna un DataFrame con COLUMNAS_SECUENCIA alineado al índice de df"""
+        resultado = self._resultado_vacio(df)
+        if df.empty or 'PLACA' not in df.columns or 'FECHA_INGRESO_VALE' not in df.columns:
+            return resultado
+
+        try:
+            cfg = self.configuracion
+            codigos, placas = pd.factorize(df['PLACA'])
+            fechas = pd.to_datetime(df['FECHA_INGRESO_VALE'], errors='coerce')
+            validos = np.flatnonzero((codigos >= 0) & fechas.notna().to_numpy())
+            if len(validos) == 0:
+                return resultado
+
+            # Único ordenamiento: por vehículo y fecha (estable para vales del mismo día)
+            dias = fechas.to_numpy()[validos].astype('datetime64[s]').astype(np.int64) / 86400.0
+            dias -= dias.min()
+            orden = np.lexsort((dias, codigos[validos]))
+            filas = validos[orden]
+            vehiculo = codigos[filas]
+            dias = dias[orden]
+
+            def columna(nombre):
+                if nombre not in df.columns:
+                    return np.full(len(filas), np.nan)
+                return pd.to_numeric(df[nombre], errors='coerce').to_numpy(dtype=np.float64)[filas]
+
+            galones = columna('CANTIDAD_GALONES')
+            km = columna('KM_RECORRIDO')
+
+            # Rezagos dentro del mismo vehículo
+            mismo_vehiculo = np.r_[False, vehiculo[1:] == vehiculo[:-1]]
+            dias_desde = np.where(mismo_vehiculo, dias - np.r_[np.nan, dias[:-1]], np.nan)
+            galones_anterior = np.where(mismo_vehiculo, np.r_[np.nan, galones[:-1]], np.nan)
+
+            # Ventana móvil [t - ventana, t] por vehículo: la clave separa vehículos por más que la ventana
+            ventana = float(cfg['ventana_dias'])
+            separacion = dias.max() + ventana + 1.0
+            clave = vehiculo * separacion + dias
+            izquierda = np.searchsorted(clave, clave - ventana, side='left')
+            derecha = np.searchsorted(clave, clave, side='right')
+            cargas_ventana = derecha - izquierda
+            acumulado = np.r_[0.0, np.cumsum(np.nan_to_num(galones))]
+            galones_ventana = acumulado[derecha] - acumulado[izquierda]
+
+            # Referencias por vehículo: capacidad del tanque y eficiencia típica
+            n_vehiculos = len(placas)
+            minimo = cfg['min_registros_vehiculo']
+            if 'CAPACIDAD_TANQUE' in df.columns:
+                capacidad = columna('CAPACIDAD_TANQUE')
+            else:
+                capacidad = _por_vehiculo(vehiculo, galones, n_vehiculos, cfg['percentil_capacidad'], minimo)[vehiculo]
+                capacidad = capacidad * cfg['margen_capacidad']
+            with np.errstate(divide='ignore', invalid='ignore'):
+                eficiencia = np.where(galones > 0, km / galones, np.nan)
+            eficiencia_tipica = _por_vehiculo(vehiculo, eficiencia, n_vehiculos, 'mediana', minimo)[vehiculo]
+
+            with np.errstate(invalid='ignore'):
+                carga_rapida = (dias_desde < cfg['dias_minimos_entre_cargas']) | (cargas_ventana > cfg['max_cargas_ventana'])
+
+                # Una carga, o dos cargas seguidas, que no caben en el tanque
+                cargas_seguidas = dias_desde < cfg['dias_minimos_entre_cargas']
+                sobrecarga = (galones > capacidad) | (cargas_seguidas & (galones + galones_anterior > capacidad))
+
+                # Los km desde la carga anterior deben explicar el combustible repuesto, y no pueden
+                # superar la autonomía de un tanque lleno según la eficiencia típica del vehículo
+                consumido = km / eficiencia_tipica
+                km_inconsistente = (((galones > 0) & (km <= 0))
+                                    | (mismo_vehiculo & (galones > consumido * cfg['factor_km']))
+                                    | (km > capacidad * eficiencia_tipica))
+
+            resultado.loc[df.index[filas], 'DIAS_DESDE_CARGA_ANTERIOR'] = dias_desde
+            resultado.loc[df.index[filas], 'CARGAS_VENTANA'] = cargas_ventana
+            resultado.loc[df.index[filas], 'GALONES_VENTANA'] = galones_ventana
+            resultado.loc[df.index[filas], 'CAPACIDAD_ESTIMADA'] = capacidad
+            for nombre, flag in zip(FLAGS_SECUENCIA, [carga_rapida, sobrecarga, km_inconsistente]):
+                resultado.loc[df.index[filas], nombre] = flag.astype(int)
+            resultado['INCONSISTENCIA_SECUENCIA'] = resultado[FLAGS_SECUENCIA].max(axis=1).astype(int)
+
+        except Exception as e:
+            print(f"Error en análisis de secuencias: {e}")
+            return self._resultado_vacio(df)
+
+        return resultado
+
+    def resumen_por_vehiculo(self, df, resultado=None):
+        """Cantidad de inconsistencias de cada tipo por PLACA, de mayor a menor"""
+        if resultado is None:
+            resultado = df[COLUMNAS_SECUENCIA] if all(c in df.columns for c in COLUMNAS_SECUENCIA) else self.analizar(df)
+        if 'PLACA' not in df.columns or resultado.empty:
+            return pd.DataFrame(columns=FLAGS_SECUENCIA + ['INCONSISTENCIA_SECUENCIA', 'VALES'])
+
+        resumen = resultado[FLAGS_SECUENCIA + ['INCONSISTENCIA_SECUENCIA']].groupby(df['PLACA']).sum()
+        resumen['VALES'] = df.groupby('PLACA').size()
+        resumen = resumen[resumen['INCONSISTENCIA_SECUENCIA'] > 0]
+        return resumen.sort_values('INCONSISTENCIA_SECUENCIA', ascending=False)
@@ -0,0 +1,211 @@
+"""
+Detección de anomalías en lote para toda la flota (todas las particiones MES / UNIDAD_ORGANICA)
+"""
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import pandas as pd
+from .analisis_combustible import detectar_anomalias_isolation_forest, FEATURES_ANOMALIAS, COLUMNAS_ANOMALIA
+from .detectores_anomalias import DetectorRobusto, FEATURES_ROBUSTAS, UMBRAL_ISOLATION_FOREST
+from .procesos import contexto_procesos
+
+COLUMNAS_PARTICION = ['MES', 'UNIDAD_ORGANICA']
+
+
+def _detectar_particion(clave, df_particion, opciones_isolation_forest=None):
+    """Ejecuta IsolationForest sobre una partición (se ejecuta en un proceso del pool)"""
+    inicio = time.perf_counter()
+    resultado = detectar_anomalias_isolation_forest(df_particion, **(opciones_isolation_forest or {}))
+    duracion = time.perf_counter() - inicio
+
+    resultado = resultado[COLUMNAS_ANOMALIA].copy()
+    resultado['NIVEL_RIESGO'] = resultado['NIVEL_RIESGO'].astype(str)
+    return clave, resultado, duracion
+
+
+class ProcesadorAnomaliasLote:
+    def __init__(self, max_workers=None, detector='auto', umbral_isolation_forest=UMBRAL_ISOLATION_FOREST,
+                 opciones_isolation_forest=None):
+        self.max_workers = max_workers
+        self.detector = detector
+        self.umbral_isolation_forest = umbral_isolation_forest
+        # El pool ya ocupa los núcleos: cada proceso ajusta sus árboles en un solo hilo
+        self.opciones_isolation_forest = dict(opciones_isolation_forest or {}, n_jobs=1)
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._pendiente = None  # (df, al_terminar) del último procesamiento en cola
+        self._atendiendo = False
+        self.estado = self._estado_inicial()
+
+    def _estado_inicial(self):
+        return {
+            'estado': 'inactivo',
+            'total_particiones': 0,
+            'particiones_procesadas': 0,
+            'porcentaje': 0.0,
+            'registros_procesados': 0,
+            'registros_nivel_rapido': 0,
+            'duracion_nivel_rapido': None,
+            'tiempos_particiones': [],
+            'inicio': None,
+            'fin': None,
+            'duracion_total': None,
+            'error': None
+        }
+
+    def _actualizar_estado(self, **cambios):
+        with self._lock:
+            self.estado.update(cambios)
+
+    def _registrar_particion(self, clave, registros, duracion):
+        """Registra el avance y el tiempo de una partición terminada"""
+        mes, dependencia = clave
+        with self._lock:
+            self.estado['particiones_procesadas'] += 1
+            self.estado['registros_procesados'] += registros
+            total = self.estado['total_particiones']
+            self.estado['porcentaje'] = round(self.estado['particiones_procesadas'] / total * 100, 1) if total else 100.0
+            self.estado['tiempos_particiones'].append({
+                'mes': int(mes),
+                'dependencia': dependencia,
+                'registros': int(registros),
+                'segundos': round(duracion, 4)
+            })
+
+    def obtener_estado(self):
+        """Retorna una copia del estado del procesamiento en lote"""
+        with self._lock:
+            estado = dict(self.estado)
+            estado['tiempos_particiones'] = list(self.estado['tiempos_particiones'])
+            estado['pendiente'] = self._pendiente is not None
+        return estado
+
+    def en_proceso(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def ejecutar(self, df):
+        """Detecta anomalías en todas las particiones (MES, UNIDAD_ORGANICA).
+
+        El nivel rápido (robusto) se calcula sobre todo el dataset en una sola pasada;
+        las particiones grandes (o todas, si se pide 'isolation_forest') se recalculan
+        con IsolationForest en paralelo en un pool de procesos.
+        Retorna un DataFrame con ANOMALIA, SCORE_ANOMALIA y NIVEL_RIESGO alineado al índice de df.
+        """
+        inicio = time.perf_counter()
+        with self._lock:
+            self.estado = self._estado_inicial()
+            self.estado.update(estado='procesando', inicio=datetime.now().isoformat())
+
+        try:
+            if df is None or df.empty or not all(c in df.columns for c in COLUMNAS_PARTICION):
+                raise ValueError('Columnas MES y UNIDAD_ORGANICA requeridas para el procesamiento en lote')
+
+            # Nivel rápido sobre toda la flota en una sola pasada
+            base = None
+            if self.detector != 'isolation_forest':
+                inicio_rapido = time.perf_counter()
+                columnas_robustas = [c for c in FEATURES_ROBUSTAS + ['PLACA', 'UNIDAD_ORGANICA'] if c in df.columns]
+                base = DetectorRobusto().detectar(df[columnas_robustas])[COLUMNAS_ANOMALIA]
+                base['NIVEL_RIESGO'] = base['NIVEL_RIESGO'].astype(str)
+                self._actualizar_estado(
+                    registros_nivel_rapido=len(base),
+                    duracion_nivel_rapido=round(time.perf_counter() - inicio_rapido, 4)
+                )
+
+            # Particiones que pasan a IsolationForest; solo se envían las columnas que usa el modelo
+            columnas = [c for c in FEATURES_ANOMALIAS if c in df.columns]
+            particiones = []
+            if self.detector != 'robusto':
+                for clave, grupo in df.groupby(COLUMNAS_PARTICION, sort=True):
+                    if self.detector == 'isolation_forest' or len(grupo) >= self.umbral_isolation_forest:
+                        particiones.append((clave, grupo[columnas]))
+            self._actualizar_estado(total_particiones=len(particiones))
+
+            resultados = []
+            pendientes = dict(particiones)
+            if particiones:
+                try:
+                    with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=contexto_procesos()) as pool:
+                        futuros = {pool.submit(_detectar_particion, clave, grupo, self.opciones_isolation_forest): clave
+                                   for clave, grupo in particiones}
+                        for futuro in as_completed(futuros):
+                            try:
+                                clave, resultado, duracion = futuro.result()
+                            except Exception as e:
+                                print(f"Error en la partición {futuros[futuro]}, se procesará en serie: {e}")
+                                continue
+                            resultados.append(resultado)
+                            self._registrar_particion(clave, len(resultado), duracion)
+                            del pendientes[clave]
+                except Exception as e:
+                    print(f"Pool de procesos no disponible, procesando en serie: {e}")
+
+            # Particiones que fallaron en el pool o no llegaron a ejecutarse
+            for clave, grupo in pendientes.items():
+                clave, resultado, duracion = _detectar_particion(clave, grupo, self.opciones_isolation_forest)
+                resultados.append(resultado)
+                self._registrar_particion(clave, len(resultado), duracion)
+
+            # Los resultados de IsolationForest reemplazan a los del nivel rápido en sus particiones
+            if base is not None:
+                df_resultados = base.copy()
+                if resultados:
+                    forest = pd.concat(resultados)
+                    df_resultados.loc[forest.index, COLUMNAS_ANOMALIA] = forest[COLUMNAS_ANOMALIA]
+            elif resultados:
+                df_resultados = pd.concat(resultados).reindex(df.index)
+            else:
+                df_resultados = pd.DataFrame(index=df.index, columns=COLUMNAS_ANOMALIA)
+
+            # Registros sin MES o dependencia quedan sin anomalía
+            df_resultados['ANOMALIA'] = df_resultados['ANOMALIA'].fillna(0).astype(int)
+            df_resultados['SCORE_ANOMALIA'] = df_resultados['SCORE_ANOMALIA'].fillna(0).astype(float)
+            df_resultados['NIVEL_RIESGO'] = df_resultados['NIVEL_RIESGO'].fillna('Bajo')
+
+            self._actualizar_estado(
+                estado='completado',
+                porcentaje=100.0,
+                fin=datetime.now().isoformat(),
+                duracion_total=round(time.perf_counter() - inicio, 4)
+            )
+            return df_resultados
+
+        except Exception as e:
+            print(f"Error en detección de anomalías en lote: {e}")
+            self._actualizar_estado(estado='error', error=str(e), fin=datetime.now().isoformat())
+            return None
+
+    def ejecutar_en_segundo_plano(self, df, al_terminar=None):
+        """Lanza el procesamiento en un hilo y llama a al_terminar(df, resultados) al finalizar.
+
+        Si hay un procesamiento en curso el nuevo queda en cola y se inicia al terminar el
+        actual; un pedido en cola reemplaza al anterior, porque solo interesa el último dataset.
+        """
+        with self._lock:
+            self._pendiente = (df, al_terminar)
+            if self._atendiendo:
+                return self._hilo
+            self._atendiendo = True
+            self.estado = self._estado_inicial()
+            self.estado['estado'] = 'en_cola'
+            self._hilo = threading.Thread(target=self._atender_cola, daemon=True)
+            self._hilo.start()
+            return self._hilo
+
+    def _atender_cola(self):
+        """Ejecuta los procesamientos en cola de a uno hasta vaciarla"""
+        while True:
+            with self._lock:
+                if self._pendiente is None:
+                    self._atendiendo = False
+                    return
+                df, al_terminar = self._pendiente
+                self._pendiente = None
+
+            resultados = self.ejecutar(df)
+            if resultados is not None and al_terminar is not None:
+                try:
+                    al_terminar(df, resultados)
+                except Exception as e:
+                    print(f"Error aplicando resultados del lote: {e}")
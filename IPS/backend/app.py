@@ -1,12 +1,28 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, session, Response
 from flask_login import LoginManager, login_required, current_user
+from werkzeug.wsgi import ClosingIterator
 import os
 import pandas as pd
 import numpy as np
 from datetime import datetime
 from functools import wraps
-from .analisis_combustible import procesar_datos, aplicar_filtros, detectar_anomalias, generar_reporte_anomalias
-from .prediccion_ia import PrediccionConsumo
+from .analisis_combustible import procesar_datos, aplicar_filtros, detectar_anomalias, generar_reporte_anomalias, COLUMNAS_ANOMALIA
+from .anomalias_lote import ProcesadorAnomaliasLote
+from .analisis_secuencias import AnalizadorSecuencias
+from .gestor_reportes import GestorReportes
+from .cache_reportes import CacheReportes
+from .almacen_artefactos import AlmacenArtefactos
+from .lote_reportes import GeneradorLoteReportes
+from .cubo_consumo import CacheCubos
+from .puntuacion_anomalias import PuntuadorAnomalias
+from .reduccion_datos import histograma, reducir_dispersion, reducir_serie, MAX_BINS_HISTOGRAMA, LimitesGraficos
+from .reportes_ligeros import FORMATOS_REPORTE
+from .render_graficos import configurar as configurar_render_graficos, PERFILES_SALIDA
+from .prediccion_ia import PrediccionConsumo, MAX_DIAS_PRONOSTICO, MODOS_ENTRENAMIENTO
+from .motor_pronostico import METODOS_PRONOSTICO, FRECUENCIAS, MAX_HORIZONTE
+from .registro_modelos import RegistroModelos
+from .ajuste_prediccion import AjusteModeloPrediccion
+from .procesos import es_proceso_principal
 from .sistema_alertas import SistemaAlertas
 from .historial_notificaciones import GestorHistorialNotificaciones
 from .filtros_avanzados import FiltrosAvanzados
@@ -46,9 +62,15 @@ app.json_encoder = json.JSONEncoder(
     default=lambda o: int(o) if isinstance(o, np.integer) else float(o) if isinstance(o, np.floating) else None
 )
 
+# Límites de reducción de los gráficos (JSON de /analyze y reportes)
+limites_graficos = LimitesGraficos(
+    app.config['CHART_MAX_LINE_POINTS'], app.config['CHART_MAX_SCATTER_POINTS'], app.config['CHART_SCATTER_GRID']
+)
+
 # Variable global para almacenar datos
 global_df = None
 global_data_analyzed = False  # Flag para indicar si los datos han sido analizados
+global_cubo = None  # Cubo de agregados de la versión actual del dataset
 
 # Decorador para verificar si el análisis ha sido realizado
 def require_analysis(f):
@@ -63,12 +85,91 @@ def require_analysis(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def olvidar_reportes_eliminados(area, nombres):
+    """Los reportes eliminados por retención dejan de figurar en el caché"""
+    if area == 'reportes':
+        cache_reportes.olvidar(nombres)
+
+def iniciar_servicios():
+    """Crea los módulos de análisis, carga los modelos y arranca los ejecutores en segundo plano.
+
+    Solo se llama en el proceso principal: los procesos de los pools importan este módulo
+    como '__mp_main__' y no deben repetir la carga de modelos ni arrancar hilos.
+    """
+    global prediccion_ia, ajuste_prediccion, sistema_alertas, historial_notificaciones, filtros_avanzados
+    global modulo_emisiones, opciones_isolation_forest, procesador_lote, analizador_secuencias, gestor_reportes
+    global almacen_artefactos, directorio_reportes, cache_reportes, generador_lote_reportes, cache_cubos
+    global puntuador_anomalias
+
+    prediccion_ia = PrediccionConsumo(RegistroModelos(
+        app.config['PREDICTION_MODELS_DIR'],
+        max_versiones=app.config['PREDICTION_MODEL_VERSIONS'],
+        compacto=app.config['PREDICTION_COMPACT_MODEL']
+    ), estimadores_incrementales=app.config['PREDICTION_INCREMENTAL_TREES'],
+       actualizaciones_antes_de_completo=app.config['PREDICTION_FULL_REFIT_EVERY'])
+    prediccion_ia.cargar_modelo()  # La última versión registrada queda disponible tras un reinicio
+    ajuste_prediccion = AjusteModeloPrediccion(
+        prediccion_ia,
+        max_workers=app.config['PREDICTION_TUNING_WORKERS'],
+        presupuesto=app.config['PREDICTION_TUNING_BUDGET']
+    )
+    sistema_alertas = SistemaAlertas()
+    historial_notificaciones = GestorHistorialNotificaciones()
+    filtros_avanzados = FiltrosAvanzados()
+    modulo_emisiones = CalculadorEmisiones()
+    opciones_isolation_forest = {
+        'tamano_muestra': app.config['ANOMALY_FIT_SAMPLE_SIZE'],
+        'tamano_bloque': app.config['ANOMALY_SCORE_CHUNK_SIZE'],
+        'n_jobs': app.config['ANOMALY_N_JOBS']
+    }
+    procesador_lote = ProcesadorAnomaliasLote(
+        max_workers=app.config['ANOMALY_BATCH_WORKERS'],
+        detector=app.config['ANOMALY_DETECTOR'],
+        umbral_isolation_forest=app.config['ANOMALY_IF_MIN_ROWS'],
+        opciones_isolation_forest=opciones_isolation_forest
+    )
+    analizador_secuencias = AnalizadorSecuencias()
+    gestor_reportes = GestorReportes()
+
+    # Archivos cargados, reportes y exportaciones con presupuesto de espacio y antigüedad máxima
+    almacen_artefactos = AlmacenArtefactos(
+        app.config['UPLOAD_FOLDER'],
+        max_bytes=app.config['ARTIFACT_STORE_MAX_MB'] * 1024 * 1024 if app.config['ARTIFACT_STORE_MAX_MB'] else None,
+        max_edad=app.config['ARTIFACT_MAX_AGE_HOURS'] * 3600 if app.config['ARTIFACT_MAX_AGE_HOURS'] else None,
+        al_eliminar=olvidar_reportes_eliminados
+    )
+    directorio_reportes = almacen_artefactos.ruta('reportes')
+    cache_reportes = CacheReportes(directorio_reportes, almacen=almacen_artefactos)
+    generador_lote_reportes = GeneradorLoteReportes(
+        cache_reportes, modulo_emisiones,
+        directorio=directorio_reportes,
+        max_workers=app.config['REPORT_BATCH_WORKERS'],
+        almacen=almacen_artefactos
+    )
+    if app.config['ARTIFACT_SWEEP_INTERVAL'] > 0:
+        almacen_artefactos.iniciar_barrido(app.config['ARTIFACT_SWEEP_INTERVAL'])
+    configurar_render_graficos(
+        max_workers=app.config['CHART_RENDER_WORKERS'] if app.config['CHART_RENDER_WORKERS'] >= 0 else None,
+        perfil=app.config['CHART_OUTPUT_PROFILE']
+    )
+    cache_cubos = CacheCubos()
+    puntuador_anomalias = PuntuadorAnomalias()
+    puntuador_anomalias.cargar_modelos()  # Los modelos de referencia quedan residentes en memoria
+
 # Inicializar módulos
-prediccion_ia = PrediccionConsumo()
-sistema_alertas = SistemaAlertas()
-historial_notificaciones = GestorHistorialNotificaciones()
-filtros_avanzados = FiltrosAvanzados()
-modulo_emisiones = CalculadorEmisiones()
+if es_proceso_principal():
+    iniciar_servicios()
+
+def aplicar_resultados_lote(df_origen, resultados):
+    """Incorpora las anomalías del procesamiento en lote al dataset global"""
+    global global_df
+    
+    # Si mientras tanto se cargó otro archivo, descartar los resultados
+    if global_df is not df_origen:
+        return
+    
+    # Reemplazo atómico del DataFrame para no exponer columnas a medio escribir
+    global_df = df_origen.assign(**{col: resultados[col] for col in COLUMNAS_ANOMALIA})
 
 # Ruta de login
 @app.route('/login')
@@ -134,7 +235,7 @@ def historial():
 @app.route('/upload', methods=['POST'])
 @login_required
 def upload_file():
-    global global_df
+    global global_df, global_cubo
     
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
@@ -145,25 +246,37 @@ def upload_file():
     
     if file:
         filename = file.filename
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepath = almacen_artefactos.ruta('cargas', filename)
         file.save(filepath)
+        almacen_artefactos.registrar('cargas', filename)
         
         try:
             # Cargar y procesar datos
+            global_cubo = None
             global_df = pd.read_excel(filepath)
             global_df = procesar_datos(global_df)
             
             if global_df is None or global_df.empty:
                 return jsonify({'error': 'Error procesando el archivo'}), 500
+            
+            # Secuencia de vales por vehículo sobre todo el historial (un solo ordenamiento)
+            global_df = global_df.assign(**analizador_secuencias.analizar(global_df))
+            
+            # Agregados de consumo para las consultas de resumen (se reutilizan si el archivo no cambió)
+            global_cubo = cache_cubos.obtener(global_df, modulo_emisiones)
                 
             # Obtener meses y dependencias disponibles
             meses = sorted(global_df['MES'].dropna().unique().tolist()) if 'MES' in global_df.columns else []
             dependencias = sorted(global_df['UNIDAD_ORGANICA'].dropna().unique().tolist()) if 'UNIDAD_ORGANICA' in global_df.columns else []
             
+            # Detección de anomalías de toda la flota en segundo plano
+            procesador_lote.ejecutar_en_segundo_plano(global_df, aplicar_resultados_lote)
+            
             return jsonify({
                 'success': True,
                 'meses': meses,
-                'dependencias': dependencias
+                'dependencias': dependencias,
+                'lote_anomalias': procesador_lote.obtener_estado()['estado']
             })
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -171,7 +284,7 @@ def upload_file():
 @app.route('/analyze', methods=['POST'])
 @login_required
 def analyze_data():
-    global global_df, global_data_analyzed
+    global global_df, global_data_analyzed, global_cubo
     
     if global_df is None:
         return jsonify({'error': 'No data available'}), 400
@@ -183,6 +296,20 @@ def analyze_data():
     if not mes or not dependencia:
         return jsonify({'error': 'Missing parameters'}), 400
     
+    # Barras del histograma de eficiencia: entero acotado para no reservar arreglos arbitrarios;
+    # el valor configurado solo se usa si el cliente no envía bins
+    bins = data.get('bins')
+    if bins is None:
+        bins = app.config['CHART_HISTOGRAM_BINS']
+    else:
+        try:
+            # Vía str: 12.5 o true no se truncan a un entero, se rechazan
+            bins = int(str(bins).strip())
+        except ValueError:
+            return jsonify({'error': 'bins debe ser un número entero'}), 400
+    if not 1 <= bins <= MAX_BINS_HISTOGRAMA:
+        return jsonify({'error': f'bins debe estar entre 1 y {MAX_BINS_HISTOGRAMA}'}), 400
+    
     try:
         # Aplicar filtros
         df_filtrado = aplicar_filtros(global_df, int(mes), dependencia)
@@ -190,11 +317,43 @@ def analyze_data():
         if df_filtrado.empty:
             return jsonify({'error': 'No data for selected filters'}), 400
         
-        # Detectar anomalías
-        df_anomalias = detectar_anomalias(df_filtrado)
+        # Detectar anomalías (reutilizando el procesamiento en lote si ya cubrió la partición)
+        if all(col in df_filtrado.columns for col in COLUMNAS_ANOMALIA) and df_filtrado['ANOMALIA'].notna().all():
+            df_anomalias = df_filtrado
+        else:
+            df_anomalias = detectar_anomalias(
+                df_filtrado,
+                detector=app.config['ANOMALY_DETECTOR'],
+                umbral_isolation_forest=app.config['ANOMALY_IF_MIN_ROWS'],
+                opciones_isolation_forest=opciones_isolation_forest
+            )
+        
+        # Perfil de salida de los gráficos (resolución/formato); por defecto el configurado
+        perfil = data.get('perfil_graficos') or app.config['CHART_OUTPUT_PROFILE']
+        if perfil not in PERFILES_SALIDA:
+            return jsonify({'error': f'Perfil de gráficos no válido: {perfil}'}), 400
+        
+        # Formato del reporte: PDF completo, o HTML/JSON con los mismos datos sin dibujar gráficos
+        formato = data.get('formato_reporte') or 'pdf'
+        if formato not in FORMATOS_REPORTE:
+            return jsonify({'error': f'Formato de reporte no válido: {formato}'}), 400
         
-        # Generar reporte
-        report_filename = generar_reporte_anomalias(df_anomalias, mes, dependencia)
+        # Un reporte con las mismas entradas ya generado se retorna de inmediato; si no,
+        # se genera en segundo plano y el cliente consulta su estado con report_id
+        clave_reporte = CacheReportes.clave('anomalias', df_anomalias, mes=mes, dependencia=dependencia,
+                                            perfil=perfil, formato=formato, limites=limites_graficos)
+        archivo_cache = cache_reportes.obtener(clave_reporte)
+        if archivo_cache:
+            report_id = gestor_reportes.registrar_completado(
+                archivo_cache, mes=mes, dependencia=dependencia, perfil=perfil, formato=formato, cache=True
+            )
+        else:
+            report_id = gestor_reportes.solicitar(
+                cache_reportes.generar, clave_reporte,
+                generar_reporte_anomalias, df_anomalias.copy(), mes, dependencia, global_cubo, perfil, formato,
+                directorio_reportes, limites_graficos,
+                mes=mes, dependencia=dependencia, perfil=perfil, formato=formato, cache=False
+            )
         
         # MARCAR QUE LOS DATOS HAN SIDO ANALIZADOS
         global_data_analyzed = True
@@ -207,26 +366,53 @@ def analyze_data():
         )
         
         # Calcular estadísticas (convertimos explícitamente a float/int)
+        filtros_cubo = {'MES': int(mes), 'UNIDAD_ORGANICA': dependencia}
+        if global_cubo is not None:
+            totales = global_cubo.consultar(filtros=filtros_cubo, medidas=['CANTIDAD_GALONES', 'KM_RECORRIDO', 'TOTAL_CONSUMO'])
+        else:
+            totales = df_filtrado[['CANTIDAD_GALONES', 'KM_RECORRIDO', 'TOTAL_CONSUMO']].sum()
         stats = {
             'total_registros': int(len(df_filtrado)),
-            'total_galones': float(df_filtrado['CANTIDAD_GALONES'].sum()),
-            'total_km': float(df_filtrado['KM_RECORRIDO'].sum()),
-            'total_consumo': float(df_filtrado['TOTAL_CONSUMO'].sum()),
+            'total_galones': float(totales['CANTIDAD_GALONES']),
+            'total_km': float(totales['KM_RECORRIDO']),
+            'total_consumo': float(totales['TOTAL_CONSUMO']),
             'total_anomalias': int(df_anomalias['ANOMALIA'].sum() if 'ANOMALIA' in df_anomalias else 0)
         }
         
         # Preparar datos para gráficos
         graficos = {}
         
-        # Gráfico de eficiencia
+        # Gráfico de eficiencia: histograma calculado en el servidor; la serie completa solo si se pide
         if 'EFICIENCIA' in df_filtrado.columns:
-            graficos['eficiencia'] = df_filtrado['EFICIENCIA'].dropna().astype(float).tolist()
+            graficos['eficiencia'] = histograma(df_filtrado['EFICIENCIA'], bins=bins)
+            if data.get('incluir_series'):
+                graficos['eficiencia_valores'] = df_filtrado['EFICIENCIA'].dropna().astype(float).tolist()
+        
+        # Dispersión eficiencia vs consumo (agregada en celdas si supera el máximo de puntos)
+        if 'EFICIENCIA' in df_filtrado.columns and 'TOTAL_CONSUMO' in df_filtrado.columns:
+            graficos['eficiencia_consumo'] = reducir_dispersion(
+                df_filtrado['EFICIENCIA'], df_filtrado['TOTAL_CONSUMO'],
+                max_puntos=limites_graficos.max_puntos_dispersion, celdas=limites_graficos.celdas_dispersion
+            )
+        
+        # Tendencia diaria de consumo reducida con LTTB
+        if 'FECHA_INGRESO_VALE' in df_filtrado.columns and 'TOTAL_CONSUMO' in df_filtrado.columns:
+            fechas = pd.to_datetime(df_filtrado['FECHA_INGRESO_VALE'], errors='coerce').dt.normalize()
+            tendencia = reducir_serie(df_filtrado.groupby(fechas)['TOTAL_CONSUMO'].sum(), limites_graficos.max_puntos_linea)
+            graficos['tendencia_diaria'] = {
+                'labels': tendencia.index.strftime('%Y-%m-%d').tolist(),
+                'data': tendencia.astype(float).tolist()
+            }
         
         # Gráfico de consumo por día
         if 'DIA_SEMANA' in df_filtrado.columns and 'TOTAL_CONSUMO' in df_filtrado.columns:
             dias = {0: 'Lun', 1: 'Mar', 2: 'Mie', 3: 'Jue', 4: 'Vie', 5: 'Sab', 6: 'Dom'}
-            df_filtrado['DIA_NOMBRE'] = df_filtrado['DIA_SEMANA'].map(dias)
-            consumo_diario = df_filtrado.groupby('DIA_NOMBRE')['TOTAL_CONSUMO'].sum()
+            if global_cubo is not None:
+                consumo_diario = global_cubo.serie('TOTAL_CONSUMO', 'DIA_SEMANA', filtros_cubo)
+                consumo_diario.index = consumo_diario.index.map(dias)
+            else:
+                df_filtrado['DIA_NOMBRE'] = df_filtrado['DIA_SEMANA'].map(dias)
+                consumo_diario = df_filtrado.groupby('DIA_NOMBRE')['TOTAL_CONSUMO'].sum()
             consumo_diario = consumo_diario.reindex(['Lun', 'Mar', 'Mie', 'Jue', 'Vie', 'Sab', 'Dom'], fill_value=0)
             graficos['consumo_diario'] = {
                 'labels': consumo_diario.index.tolist(),
@@ -237,30 +423,132 @@ def analyze_data():
             'success': True,
             'stats': stats,
             'graficos': graficos,
-            'report_filename': report_filename
+            'report_id': report_id,
+            'report_status_url': url_for('estado_reporte', report_id=report_id)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/download/<filename>')
+@app.route('/reportes/estado/<report_id>', methods=['GET'])
 @login_required
-def download_report(filename):
+def estado_reporte(report_id):
+    estado = gestor_reportes.obtener_estado(report_id)
+    if estado is None:
+        return jsonify({'error': 'Reporte no encontrado'}), 404
+    
+    respuesta = {'success': True, 'reporte': estado}
+    if estado['estado'] == 'completado':
+        respuesta['download_url'] = url_for('download_report', filename=estado['archivo'])
+    return jsonify(respuesta)
+
+@app.route('/reportes/lote', methods=['POST'])
+@login_required
+def iniciar_lote_reportes():
+    global global_df
+    
+    if global_df is None:
+        return jsonify({'error': 'No hay datos disponibles'}), 400
+    
+    data = request.json or {}
     try:
-        # Asegurarse de que la carpeta uploads existe
-        uploads_dir = os.path.join(os.getcwd(), app.config['UPLOAD_FOLDER'])
-        file_path = os.path.join(uploads_dir, filename)
+        # Un mes o un rango de meses; por defecto todas las dependencias con datos
+        if data.get('mes'):
+            meses = [int(data['mes'])]
+        elif data.get('mes_inicio') and data.get('mes_fin'):
+            meses = list(range(int(data['mes_inicio']), int(data['mes_fin']) + 1))
+        else:
+            return jsonify({'error': 'Indique mes o mes_inicio y mes_fin'}), 400
         
-        # Verificar que el archivo existe
-        if not os.path.exists(file_path):
-            return jsonify({'error': 'File not found'}), 404
-            
-        # Enviar el archivo con el tipo MIME correcto
-        return send_file(
-            file_path,
+        perfil = data.get('perfil_graficos') or app.config['CHART_OUTPUT_PROFILE']
+        if perfil not in PERFILES_SALIDA:
+            return jsonify({'error': f'Perfil de gráficos no válido: {perfil}'}), 400
+        formato = data.get('formato_reporte') or 'pdf'
+        if formato not in FORMATOS_REPORTE:
+            return jsonify({'error': f'Formato de reporte no válido: {formato}'}), 400
+        
+        lote_id = generador_lote_reportes.iniciar(
+            global_df, meses,
+            dependencias=data.get('dependencias'),
+            tipos=data.get('tipos'),
+            cubo=global_cubo,
+            perfil=perfil,
+            formato=formato,
+            opciones_anomalias={
+                'detector': app.config['ANOMALY_DETECTOR'],
+                'umbral_isolation_forest': app.config['ANOMALY_IF_MIN_ROWS'],
+                'opciones_isolation_forest': opciones_isolation_forest
+            },
+            limites=limites_graficos
+        )
+        if lote_id is None:
+            return jsonify({'error': 'No hay datos para los meses seleccionados'}), 400
+        
+        estado = generador_lote_reportes.obtener_estado(lote_id)
+        return jsonify({
+            'success': True,
+            'lote_id': lote_id,
+            'total_reportes': estado['total'],
+            'status_url': url_for('estado_lote_reportes', lote_id=lote_id),
+            'zip_url': url_for('descargar_lote_reportes', lote_id=lote_id)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/reportes/lote/estado/<lote_id>', methods=['GET'])
+@login_required
+def estado_lote_reportes(lote_id):
+    estado = generador_lote_reportes.obtener_estado(lote_id)
+    if estado is None:
+        return jsonify({'error': 'Lote no encontrado'}), 404
+    return jsonify({'success': True, 'lote': estado})
+
+@app.route('/reportes/lote/<lote_id>/zip', methods=['GET'])
+@login_required
+def descargar_lote_reportes(lote_id):
+    estado = generador_lote_reportes.obtener_estado(lote_id)
+    if estado is None:
+        return jsonify({'error': 'Lote no encontrado'}), 404
+    
+    # El zip se envía a medida que terminan los reportes, sin esperar al lote completo
+    meses = '-'.join(str(m) for m in (estado['meses'][0], estado['meses'][-1])) if len(estado['meses']) > 1 else str(estado['meses'][0])
+    return Response(
+        generador_lote_reportes.stream_zip(lote_id),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=reportes_mes{meses}.zip'}
+    )
+
+def enviar_reporte(filename, download_name):
+    """Envía un reporte (PDF, HTML o JSON según su extensión); los del caché usan su clave
+    de contenido como ETag.
+
+    send_from_directory responde 304 a If-None-Match y 206 a peticiones Range. El archivo
+    queda protegido de la retención hasta que termina el envío.
+    """
+    if not almacen_artefactos.adquirir('reportes', filename):
+        return jsonify({'error': 'Archivo no encontrado'}), 404
+    try:
+        respuesta = send_from_directory(
+            os.path.join(os.getcwd(), directorio_reportes),
+            filename,
             as_attachment=True,
-            download_name=f"Reporte_Anomalias_{filename}",
-            mimetype='application/pdf'
+            download_name=download_name,
+            etag=cache_reportes.etag(filename) or True,
+            conditional=True
         )
+    except Exception:
+        almacen_artefactos.liberar('reportes', filename)
+        raise
+    # El cuerpo del archivo se entrega tal cual al servidor (direct_passthrough), así que
+    # la liberación se engancha al cierre de su iterador y no a Response.close
+    respuesta.response = ClosingIterator(respuesta.response, lambda: almacen_artefactos.liberar('reportes', filename))
+    return respuesta
+
+@app.route('/download/<filename>')
+@login_required
+def download_report(filename):
+    try:
+        # Enviar el archivo con el tipo MIME correcto (con ETag y soporte de Range)
+        return enviar_reporte(filename, f"Reporte_Anomalias_{filename}")
     except Exception as e:
         app.logger.error(f"Error downloading file: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -269,6 +557,107 @@ def download_report(filename):
 # NUEVAS RUTAS PARA MÓDULOS
 # ===============================
 
+# DETECCIÓN DE ANOMALÍAS EN LOTE
+@app.route('/anomalias/lote/estado', methods=['GET'])
+@login_required
+def estado_anomalias_lote():
+    try:
+        return jsonify({
+            'success': True,
+            'lote': procesador_lote.obtener_estado()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# PUNTUACIÓN DE VALES CONTRA MODELOS DE REFERENCIA
+@app.route('/anomalias/referencia/entrenar', methods=['POST'])
+@login_required
+def entrenar_referencia_anomalias():
+    global global_df
+    
+    if global_df is None:
+        return jsonify({'error': 'No hay datos disponibles. Primero carga un archivo.'}), 400
+    
+    data = request.json or {}
+    try:
+        dependencia = data.get('dependencia')
+        mes = data.get('mes')
+        
+        # Sin dependencia se entrenan las referencias de todas las dependencias
+        if dependencia:
+            resumen = puntuador_anomalias.entrenar_referencia(global_df, dependencia, mes)
+            if resumen is None:
+                return jsonify({'error': 'Datos insuficientes para entrenar el modelo de referencia'}), 400
+            modelos = {dependencia: resumen}
+        else:
+            modelos = puntuador_anomalias.entrenar_todas(global_df, mes)
+        
+        return jsonify({
+            'success': True,
+            'modelos': modelos,
+            'mensaje': f'{len(modelos)} modelo(s) de referencia entrenado(s)'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/anomalias/referencia/listar', methods=['GET'])
+@login_required
+def listar_referencias_anomalias():
+    try:
+        return jsonify({
+            'success': True,
+            'modelos': puntuador_anomalias.listar_modelos()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/anomalias/puntuar', methods=['POST'])
+@login_required
+def puntuar_anomalias():
+    global global_df
+    
+    data = request.json or {}
+    try:
+        dependencia = data.get('dependencia')
+        if not dependencia:
+            return jsonify({'error': 'Missing parameters'}), 400
+        
+        if puntuador_anomalias.obtener_modelo(dependencia) is None:
+            return jsonify({'error': f'No hay modelo de referencia para {dependencia}'}), 404
+        
+        # Uno o varios vales en JSON
+        vales = data.get('vales') or ([data['vale']] if data.get('vale') else None)
+        if vales:
+            resultado = puntuador_anomalias.puntuar_vales(vales, dependencia)
+            return jsonify({
+                'success': True,
+                **resultado
+            })
+        
+        # Un mes completo del dataset cargado contra el modelo de referencia
+        mes = data.get('mes')
+        if not mes:
+            return jsonify({'error': 'Missing parameters'}), 400
+        if global_df is None:
+            return jsonify({'error': 'No hay datos disponibles. Primero carga un archivo.'}), 400
+        
+        df_filtrado = aplicar_filtros(global_df, int(mes), dependencia)
+        if df_filtrado.empty:
+            return jsonify({'error': 'No data for selected filters'}), 400
+        
+        resultado = puntuador_anomalias.puntuar_dataframe(df_filtrado, dependencia)
+        distribucion = resultado['NIVEL_RIESGO'].astype(str).value_counts()
+        
+        return jsonify({
+            'success': True,
+            'total_registros': int(len(resultado)),
+            'total_anomalias': int(resultado['ANOMALIA'].sum()),
+            'distribucion_riesgo': {k: int(v) for k, v in distribucion.items()},
+            'modelo': puntuador_anomalias.obtener_modelo(dependencia).resumen()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # PREDICCIÓN CON IA
 @app.route('/prediccion/entrenar', methods=['POST'])
 @login_required
@@ -279,12 +668,59 @@ def entrenar_modelo():
     if global_df is None:
         return jsonify({'error': 'No hay datos disponibles. Primero carga un archivo.'}), 400
     
+    data = request.get_json(silent=True) or {}
     try:
-        resultado = prediccion_ia.entrenar_modelo(global_df)
+        modo = data.get('modo', 'auto')
+        if modo not in MODOS_ENTRENAMIENTO:
+            return jsonify({'error': f'Modo no válido. Opciones: {", ".join(MODOS_ENTRENAMIENTO)}'}), 400
+        resultado = prediccion_ia.entrenar_modelo(global_df, modo=modo)
+        if resultado is None:
+            return jsonify({'error': 'No hay datos suficientes para entrenar el modelo'}), 400
+        if resultado['reutilizado']:
+            mensaje = 'Modelo reutilizado (mismos datos)'
+        elif resultado['modo'] == 'incremental':
+            mensaje = 'Modelo actualizado con los registros nuevos'
+        else:
+            mensaje = 'Modelo entrenado exitosamente'
         return jsonify({
             'success': True,
             'metricas': resultado['metricas'],
-            'mensaje': 'Modelo entrenado exitosamente'
+            'version': resultado['version'],
+            'reutilizado': resultado['reutilizado'],
+            'modo': resultado['modo'],
+            'mensaje': mensaje
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/prediccion/ajustar', methods=['POST'])
+@login_required
+@require_analysis
+def ajustar_modelo_prediccion():
+    """Inicia la búsqueda de hiperparámetros en segundo plano (el modelo actual sigue en uso)"""
+    global global_df
+    
+    if global_df is None:
+        return jsonify({'error': 'No hay datos disponibles. Primero carga un archivo.'}), 400
+    
+    try:
+        if ajuste_prediccion.ejecutar_en_segundo_plano(global_df) is None:
+            return jsonify({'error': 'Ya hay una búsqueda de hiperparámetros en curso'}), 409
+        return jsonify({
+            'success': True,
+            'ajuste': ajuste_prediccion.obtener_estado()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/prediccion/ajustar/estado', methods=['GET'])
+@login_required
+def estado_ajuste_prediccion():
+    try:
+        return jsonify({
+            'success': True,
+            'ajuste': ajuste_prediccion.obtener_estado(),
+            'version_en_uso': prediccion_ia.version
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -307,9 +743,9 @@ def predecir_consumo():
         if tipo_prediccion == 'semanal':
             prediccion = prediccion_ia.predecir_consumo_semanal(global_df, placa=placa, dependencia=dependencia)
         elif tipo_prediccion == 'mensual':
-            prediccion = prediccion_ia.predecir_consumo_mensual(global_df, dependencia=dependencia)
+            prediccion = prediccion_ia.predecir_consumo_mensual(global_df, dependencia=dependencia, cubo=global_cubo)
         elif tipo_prediccion == 'anual':
-            prediccion = prediccion_ia.predecir_consumo_anual(global_df, dependencia=dependencia)
+            prediccion = prediccion_ia.predecir_consumo_anual(global_df, dependencia=dependencia, cubo=global_cubo)
         else:
             prediccion = prediccion_ia.predecir_consumo_semanal(global_df, placa=placa, dependencia=dependencia)
         
@@ -320,6 +756,98 @@ def predecir_consumo():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/prediccion/lote', methods=['POST'])
+@login_required
+@require_analysis
+def predecir_consumo_lote():
+    """Pronóstico diario de varias placas y/o dependencias ('todas' = toda la flota) en una sola pasada"""
+    global global_df
+    
+    if global_df is None:
+        return jsonify({'error': 'No hay datos disponibles. Primero carga un archivo.'}), 400
+    
+    data = request.json or {}
+    try:
+        placas = data.get('placas')
+        dependencias = data.get('dependencias')
+        if placas is None and dependencias is None:
+            return jsonify({'error': 'Indica placas y/o dependencias (lista o "todas")'}), 400
+        dias = int(data.get('dias', 7))
+        if not 1 <= dias <= MAX_DIAS_PRONOSTICO:
+            return jsonify({'error': f'dias debe estar entre 1 y {MAX_DIAS_PRONOSTICO}'}), 400
+        if not prediccion_ia.modelo_entrenado:
+            return jsonify({'error': 'Primero entrena el modelo de predicción'}), 400
+        
+        prediccion = prediccion_ia.predecir_consumo_lote(global_df, placas=placas, dependencias=dependencias, dias=dias)
+        if prediccion is None:
+            return jsonify({'error': 'No se pudo generar el pronóstico'}), 500
+        return jsonify({
+            'success': True,
+            'prediccion': prediccion
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/prediccion/modelo/rendimiento', methods=['GET'])
+@login_required
+@require_analysis
+def rendimiento_modelo_prediccion():
+    """Tamaño en disco, tiempo de carga y latencia de predicción del modelo en uso, por formato"""
+    global global_df
+    
+    if global_df is None:
+        return jsonify({'error': 'No hay datos disponibles. Primero carga un archivo.'}), 400
+    
+    try:
+        if not prediccion_ia.modelo_entrenado:
+            return jsonify({'error': 'Primero entrena el modelo de predicción'}), 400
+        rendimiento = prediccion_ia.medir_inferencia(global_df)
+        if rendimiento is None:
+            return jsonify({'error': 'No se pudo medir el modelo'}), 500
+        return jsonify({
+            'success': True,
+            'rendimiento': rendimiento
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/prediccion/series', methods=['POST'])
+@login_required
+@require_analysis
+def predecir_series():
+    """Pronóstico por series de tiempo (Holt-Winters o estacional ingenuo) de placas y/o dependencias"""
+    global global_df
+    
+    if global_df is None:
+        return jsonify({'error': 'No hay datos disponibles. Primero carga un archivo.'}), 400
+    
+    data = request.json or {}
+    try:
+        placas = data.get('placas')
+        dependencias = data.get('dependencias')
+        if placas is None and dependencias is None:
+            return jsonify({'error': 'Indica placas y/o dependencias (lista o "todas")'}), 400
+        frecuencia = data.get('frecuencia', 'diaria')
+        if frecuencia not in FRECUENCIAS:
+            return jsonify({'error': f'Frecuencia no válida. Opciones: {", ".join(FRECUENCIAS)}'}), 400
+        metodo = data.get('metodo', 'holt_winters')
+        if metodo not in METODOS_PRONOSTICO:
+            return jsonify({'error': f'Método no válido. Opciones: {", ".join(METODOS_PRONOSTICO)}'}), 400
+        horizonte = int(data.get('horizonte', 7 if frecuencia == 'diaria' else 3))
+        if not 1 <= horizonte <= MAX_HORIZONTE[frecuencia]:
+            return jsonify({'error': f'horizonte debe estar entre 1 y {MAX_HORIZONTE[frecuencia]}'}), 400
+        
+        prediccion = prediccion_ia.predecir_series(global_df, placas=placas, dependencias=dependencias,
+                                                   frecuencia=frecuencia, horizonte=horizonte, metodo=metodo)
+        if prediccion is None:
+            return jsonify({'error': 'No se pudo generar el pronóstico'}), 500
+        return jsonify({
+            'success': True,
+            'prediccion': prediccion
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/prediccion/analizar-tendencias', methods=['POST'])
 @login_required
 @require_analysis
@@ -332,7 +860,7 @@ def analizar_tendencias():
     data = request.json
     try:
         # Usar análisis de patrones en lugar de tendencias
-        patrones = prediccion_ia.analizar_patrones(global_df)
+        patrones = prediccion_ia.analizar_patrones(global_df, cubo=global_cubo)
         return jsonify({
             'success': True,
             'tendencias': patrones
@@ -527,10 +1055,11 @@ def exportar_datos_filtrados():
         # Generar nombre de archivo único
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         nombre_archivo = f'datos_filtrados_{timestamp}.xlsx'
-        ruta_archivo = os.path.join('uploads', nombre_archivo)
+        ruta_archivo = almacen_artefactos.ruta('exportaciones', nombre_archivo)
         
         # Exportar a Excel
         datos_filtrados.to_excel(ruta_archivo, index=False)
+        almacen_artefactos.registrar('exportaciones', nombre_archivo)
         
         return jsonify({
             'success': True,
@@ -567,7 +1096,9 @@ def calcular_emisiones():
         
         # Calcular emisiones
         emisiones = modulo_emisiones.calcular_emisiones_dataframe(df_filtrado)
-        estadisticas = modulo_emisiones.generar_estadisticas_emisiones(df_filtrado)
+        estadisticas = modulo_emisiones.generar_estadisticas_emisiones(
+            df_filtrado, global_cubo, {'PLACA': placa, 'UNIDAD_ORGANICA': dependencia}
+        )
         
         return jsonify({
             'success': True,
@@ -596,7 +1127,9 @@ def calcular_emisiones_flota():
             df_filtrado = df_filtrado[df_filtrado['UNIDAD_ORGANICA'] == dependencia]
         
         # Calcular huella de carbono de la flota
-        huella_carbono = modulo_emisiones.calcular_huella_carbono_flota(df_filtrado)
+        huella_carbono = modulo_emisiones.calcular_huella_carbono_flota(
+            df_filtrado, global_cubo, {'UNIDAD_ORGANICA': dependencia}
+        )
         
         return jsonify({
             'success': True,
@@ -626,12 +1159,28 @@ def generar_reporte_emisiones():
         if mes:
             df_filtrado = df_filtrado[df_filtrado['MES'] == int(mes)]
         
-        # Generar reporte PDF
-        archivo = modulo_emisiones.generar_reporte_emisiones_pdf(df_filtrado, mes, dependencia)
+        # Generar reporte (PDF por defecto, o HTML/JSON)
+        perfil = data.get('perfil_graficos') or app.config['CHART_OUTPUT_PROFILE']
+        if perfil not in PERFILES_SALIDA:
+            return jsonify({'error': f'Perfil de gráficos no válido: {perfil}'}), 400
+        formato = data.get('formato_reporte') or 'pdf'
+        if formato not in FORMATOS_REPORTE:
+            return jsonify({'error': f'Formato de reporte no válido: {formato}'}), 400
+        clave_reporte = CacheReportes.clave('emisiones', df_filtrado, mes=mes, dependencia=dependencia,
+                                            perfil=perfil, formato=formato, limites=limites_graficos)
+        archivo = cache_reportes.obtener(clave_reporte)
+        en_cache = archivo is not None
+        if not en_cache:
+            archivo = cache_reportes.generar(
+                clave_reporte, modulo_emisiones.generar_reporte_emisiones, df_filtrado, mes, dependencia, perfil,
+                None, None, formato, directorio_reportes, limites_graficos
+            )
         
         return jsonify({
             'success': True,
             'archivo': archivo,
+            'cache': en_cache,
+            'download_url': url_for('download_reporte_emisiones', filename=archivo) if archivo else None,
             'mensaje': 'Reporte de emisiones generado exitosamente'
         })
     except Exception as e:
@@ -641,19 +1190,8 @@ def generar_reporte_emisiones():
 @login_required
 def download_reporte_emisiones(filename):
     try:
-        # Usar la misma lógica que download_report pero para reportes de emisiones
-        uploads_dir = os.path.join(os.getcwd(), 'reports')
-        file_path = os.path.join(uploads_dir, filename)
-        
-        if not os.path.exists(file_path):
-            return jsonify({'error': 'Archivo no encontrado'}), 404
-            
-        return send_file(
-            file_path,
-            as_attachment=True,
-            download_name=f"Reporte_Emisiones_{filename}",
-            mimetype='application/pdf'
-        )
+        # Los reportes de emisiones se guardan junto a los de anomalías
+        return enviar_reporte(filename, f"Reporte_Emisiones_{filename}")
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -703,6 +1241,15 @@ def obtener_estado_analisis():
         'mensaje': 'Análisis completado' if global_data_analyzed else 'Análisis pendiente'
     })
 
+@app.route('/almacen/estado', methods=['GET'])
+@login_required
+def estado_almacen_artefactos():
+    """Espacio usado por cargas, reportes y exportaciones y límites de retención"""
+    return jsonify({
+        'success': True,
+        'almacen': almacen_artefactos.obtener_estado()
+    })
+
 @app.route('/resumen-sistema', methods=['GET'])
 @login_required
 def resumen_sistema():
@@ -0,0 +1,224 @@
+"""
+Representación compacta de ensambles de árboles para inferencia vectorizada con NumPy
+"""
+import os
+import json
+import shutil
+import numpy as np
+
+EULER_GAMMA = 0.5772156649015329
+
+# Registros recorridos a la vez al predecir con el bosque de regresión (acota la memoria de los índices)
+TAMANO_BLOQUE_PREDICCION = 10000
+
+
+def longitud_camino_promedio(n):
+    """Longitud promedio de camino de una búsqueda fallida en un BST con n elementos"""
+    n = np.asarray(n, dtype=np.float64)
+    resultado = np.zeros_like(n)
+    resultado[n == 2] = 1.0
+    mayores = n > 2
+    resultado[mayores] = (2.0 * (np.log(n[mayores] - 1.0) + EULER_GAMMA)
+                          - 2.0 * (n[mayores] - 1.0) / n[mayores])
+    return resultado
+
+
+def _aplanar_arboles(arboles, features_por_arbol):
+    """Concatena los arreglos de todos los árboles en arreglos contiguos.
+
+    Las hojas apuntan a sí mismas para poder recorrer todos los árboles
+    el mismo número de pasos sin ramificaciones en Python. Los hijos se
+    intercalan (izquierdo, derecho) en un solo arreglo: la rama de cada paso
+    es hijos[2 * nodo + va_a_la_derecha].
+    """
+    izquierdos, derechos, features, umbrales, profundidades, muestras, valores, raices = [], [], [], [], [], [], [], []
+    base = 0
+    for arbol, features_arbol in zip(arboles, features_por_arbol):
+        t = arbol.tree_
+        n_nodos = t.node_count
+        izq = t.children_left.astype(np.int64)
+        der = t.children_right.astype(np.int64)
+        es_hoja = izq == -1
+        nodos = np.arange(n_nodos)
+
+        # Profundidad de cada nodo (los hijos siempre tienen índice mayor que el padre)
+        profundidad = np.zeros(n_nodos, dtype=np.int64)
+        for nodo in range(n_nodos):
+            if not es_hoja[nodo]:
+                profundidad[izq[nodo]] = profundidad[nodo] + 1
+                profundidad[der[nodo]] = profundidad[nodo] + 1
+
+        feature = np.where(es_hoja, 0, t.feature)
+        if features_arbol is not None:
+            feature = np.asarray(features_arbol)[feature]
+
+        izquierdos.append(np.where(es_hoja, nodos, izq) + base)
+        derechos.append(np.where(es_hoja, nodos, der) + base)
+        features.append(feature)
+        umbrales.append(np.where(es_hoja, np.inf, t.threshold))
+        profundidades.append(profundidad)
+        muestras.append(t.n_node_samples)
+        valores.append(t.value[:, 0, 0])
+        raices.append(base)
+        base += n_nodos
+
+    return {
+        'hijos': np.stack([np.concatenate(izquierdos), np.concatenate(derechos)], axis=1).astype(np.int32).ravel(),
+        'feature': np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+        'umbral': np.ascontiguousarray(np.concatenate(umbrales), dtype=np.float64),
+        'profundidad': np.concatenate(profundidades),
+        'muestras': np.concatenate(muestras),
+        'valor': np.concatenate(valores),
+        'raices': np.asarray(raices, dtype=np.int32),
+        'max_profundidad': int(max(np.max(p) for p in profundidades))
+    }
+
+
+def recorrer_hojas(arreglos, X):
+    """Retorna el índice de hoja alcanzado por cada muestra en cada árbol, forma (n_muestras, n_arboles)"""
+    # Los árboles de sklearn comparan en float32
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    n_muestras, n_features = X.shape
+    valores_x = X.ravel()
+    inicio_fila = (np.arange(n_muestras, dtype=np.int64) * n_features)[:, None]
+    nodos = np.broadcast_to(arreglos['raices'], (n_muestras, len(arreglos['raices'])))
+    for _ in range(arreglos['max_profundidad']):
+        # take sobre arreglos planos evita la indexación avanzada en dos dimensiones
+        valores = valores_x.take(inicio_fila + arreglos['feature'].take(nodos))
+        derecha = ~(valores <= arreglos['umbral'].take(nodos))
+        nodos = arreglos['hijos'].take(2 * nodos + derecha)
+    return nodos
+
+
+class BosqueAislamientoCompacto:
+    """IsolationForest entrenado convertido a arreglos planos.
+
+    Reproduce score_samples/decision_function de sklearn recorriendo todos
+    los árboles a la vez, sin el bucle por estimador de sklearn.
+    """
+
+    def __init__(self, iso_forest):
+        arreglos = _aplanar_arboles(iso_forest.estimators_, iso_forest.estimators_features_)
+        self.hijos = arreglos['hijos']
+        self.feature = arreglos['feature']
+        self.umbral = arreglos['umbral']
+        self.raices = arreglos['raices']
+        self.max_profundidad = arreglos['max_profundidad']
+
+        # Aporte de cada hoja a la longitud de camino: profundidad + c(n muestras de la hoja)
+        self.longitud_hoja = (arreglos['profundidad'] + longitud_camino_promedio(arreglos['muestras'])).astype(np.float64)
+        self.denominador = len(iso_forest.estimators_) * float(longitud_camino_promedio([iso_forest.max_samples_])[0])
+        self.offset = float(iso_forest.offset_)
+        self.n_features = int(iso_forest.n_features_in_)
+
+    def _arreglos(self):
+        return {
+            'hijos': self.hijos, 'feature': self.feature, 'umbral': self.umbral,
+            'raices': self.raices, 'max_profundidad': self.max_profundidad
+        }
+
+    def score_samples(self, X):
+        hojas = recorrer_hojas(self._arreglos(), X)
+        profundidades = self.longitud_hoja[hojas].sum(axis=1)
+        return -(2.0 ** (-profundidades / self.denominador))
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+def _umbral_float32(umbral):
+    """Umbrales en float32 redondeados hacia abajo.
+
+    sklearn compara X en float32 contra umbrales float64; con el mayor float32 que no
+    supera cada umbral, `x <= umbral` da el mismo resultado para todo x en float32.
+    """
+    umbral32 = umbral.astype(np.float32)
+    return np.where(umbral32 > umbral, np.nextafter(umbral32, np.float32(-np.inf)), umbral32)
+
+
+class BosqueRegresionCompacto:
+    """RandomForestRegressor entrenado convertido a arreglos planos int32/float32.
+
+    Cada nodo ocupa 20 bytes (hijos, feature, umbral y valor) en arreglos contiguos que
+    se guardan como .npy; al cargarlos con mmap los procesos que sirven el mismo modelo
+    comparten las páginas del archivo en lugar de deserializar cada uno su copia de los
+    árboles. predict recorre todos los árboles a la vez y promedia los valores de las
+    hojas, igual que sklearn (salvo el redondeo a float32 de los valores).
+    """
+
+    # Arreglos que se guardan en disco, uno por archivo .npy
+    _ARREGLOS = ['hijos', 'feature', 'umbral', 'valor', 'raices']
+
+    def __init__(self, hijos, feature, umbral, valor, raices, max_profundidad, n_features):
+        self.hijos = hijos
+        self.feature = feature
+        self.umbral = umbral
+        self.valor = valor
+        self.raices = raices
+        self.max_profundidad = max_profundidad
+        self.n_features = n_features
+
+    @staticmethod
+    def admite(modelo):
+        """True si el modelo es un bosque de regresión de una salida ya entrenado"""
+        estimadores = getattr(modelo, 'estimators_', None)
+        return (bool(estimadores) and all(hasattr(e, 'tree_') for e in estimadores)
+                and getattr(modelo, 'n_outputs_', 1) == 1 and not hasattr(modelo, 'classes_'))
+
+    @classmethod
+    def desde_modelo(cls, bosque):
+        arreglos = _aplanar_arboles(bosque.estimators_, [None] * len(bosque.estimators_))
+        return cls(
+            hijos=arreglos['hijos'],
+            feature=arreglos['feature'],
+            umbral=_umbral_float32(arreglos['umbral']),
+            valor=arreglos['valor'].astype(np.float32),
+            raices=arreglos['raices'],
+            max_profundidad=arreglos['max_profundidad'],
+            n_features=int(bosque.n_features_in_)
+        )
+
+    @property
+    def n_arboles(self):
+        return len(self.raices)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, nombre).nbytes for nombre in self._ARREGLOS)
+
+    def _arreglos(self):
+        return {
+            'hijos': self.hijos, 'feature': self.feature, 'umbral': self.umbral,
+            'raices': self.raices, 'max_profundidad': self.max_profundidad
+        }
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        prediccion = np.empty(len(X), dtype=np.float64)
+        for inicio in range(0, len(X), TAMANO_BLOQUE_PREDICCION):
+            hojas = recorrer_hojas(self._arreglos(), X[inicio:inicio + TAMANO_BLOQUE_PREDICCION])
+            prediccion[inicio:inicio + len(hojas)] = self.valor[hojas].mean(axis=1, dtype=np.float64)
+        return prediccion
+
+    def guardar(self, directorio):
+        """Escribe los arreglos como .npy (cargables con mmap) y los metadatos como JSON"""
+        temporal = directorio + '.tmp'
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        for nombre in self._ARREGLOS:
+            np.save(os.path.join(temporal, f'{nombre}.npy'), getattr(self, nombre))
+        with open(os.path.join(temporal, 'metadatos.json'), 'w', encoding='utf-8') as f:
+            json.dump({'max_profundidad': self.max_profundidad, 'n_features': self.n_features}, f)
+        shutil.rmtree(directorio, ignore_errors=True)
+        os.replace(temporal, directorio)
+
+    @classmethod
+    def cargar(cls, directorio, mmap_mode='r'):
+        with open(os.path.join(directorio, 'metadatos.json'), 'r', encoding='utf-8') as f:
+            metadatos = json.load(f)
+        arreglos = {nombre: np.load(os.path.join(directorio, f'{nombre}.npy'), mmap_mode=mmap_mode)
+                    for nombre in cls._ARREGLOS}
+        return cls(max_profundidad=metadatos['max_profundidad'], n_features=metadatos['n_features'], **arreglos)
@@ -0,0 +1,131 @@
+"""
+Caché de reportes generados, direccionado por el contenido de sus entradas
+"""
+import os
+import json
+import hashlib
+import threading
+import pandas as pd
+
+# Versión de las plantillas de reporte; incrementarla invalida los reportes ya generados
+VERSION_PLANTILLA_REPORTES = {
+    'anomalias': 2,
+    'emisiones': 1
+}
+
+ARCHIVO_INDICE = '.cache_reportes.json'
+
+
+def huella_dataframe(df):
+    """Huella del contenido completo de un DataFrame (valores, columnas y orden de filas)"""
+    huella = hashlib.sha1(str((df.shape, list(df.columns))).encode())
+    if not df.empty:
+        huella.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return huella.hexdigest()
+
+
+class CacheReportes:
+    """Índice clave -> archivo de los reportes guardados en `directorio`.
+
+    La clave es un hash del tipo de reporte, la versión de su plantilla, la huella de
+    los datos de entrada y los parámetros; pedir dos veces el mismo reporte retorna el
+    archivo existente. El índice se guarda junto a los reportes para sobrevivir reinicios.
+    Con un AlmacenArtefactos, los reportes generados se registran en su área 'reportes'
+    y cada acierto del caché cuenta como uso para la política de retención.
+    """
+
+    def __init__(self, directorio='uploads', almacen=None):
+        self.directorio = directorio
+        self.almacen = almacen
+        self._lock = threading.Lock()
+        self._locks_clave = {}
+        self.indice = self._cargar_indice()
+
+    def _ruta_indice(self):
+        return os.path.join(self.directorio, ARCHIVO_INDICE)
+
+    def _cargar_indice(self):
+        try:
+            with open(self._ruta_indice(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _guardar_indice(self):
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = self._ruta_indice() + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.indice, f)
+        os.replace(temporal, self._ruta_indice())
+
+    @staticmethod
+    def clave(tipo, df, **parametros):
+        """Clave del reporte `tipo` generado a partir de df con los parámetros indicados"""
+        contenido = {
+            'tipo': tipo,
+            'plantilla': VERSION_PLANTILLA_REPORTES.get(tipo, 0),
+            'datos': huella_dataframe(df),
+            'parametros': {k: str(v) for k, v in sorted(parametros.items())}
+        }
+        return hashlib.sha1(json.dumps(contenido, sort_keys=True).encode()).hexdigest()
+
+    def obtener(self, clave):
+        """Nombre del archivo en caché para la clave, o None si no existe o fue eliminado"""
+        with self._lock:
+            archivo = self.indice.get(clave)
+            if archivo and not os.path.exists(os.path.join(self.directorio, archivo)):
+                del self.indice[clave]
+                archivo = None
+        if archivo and self.almacen is not None:
+            self.almacen.tocar('reportes', archivo)
+        return archivo
+
+    def registrar(self, clave, archivo):
+        with self._lock:
+            self.indice[clave] = archivo
+            self._guardar_indice()
+        if self.almacen is not None:
+            self.almacen.registrar('reportes', archivo)
+
+    def olvidar(self, archivos):
+        """Quita del índice las claves de archivos eliminados del directorio"""
+        archivos = set(archivos)
+        with self._lock:
+            claves = [clave for clave, nombre in self.indice.items() if nombre in archivos]
+            for clave in claves:
+                del self.indice[clave]
+            if claves:
+                self._guardar_indice()
+
+    def etag(self, archivo):
+        """ETag de un archivo del caché (su clave de contenido), o None si no está indexado"""
+        with self._lock:
+            for clave, nombre in self.indice.items():
+                if nombre == archivo:
+                    return clave
+        return None
+
+    def generar(self, clave, funcion, *args):
+        """Retorna el archivo en caché o ejecuta funcion(*args), que debe retornar el nombre del archivo.
+
+        Solicitudes simultáneas de la misma clave esperan a la primera en lugar de regenerar.
+        """
+        # Cada clave guarda [lock, solicitudes que lo usan]; la entrada se elimina con la última
+        with self._lock:
+            entrada = self._locks_clave.setdefault(clave, [threading.Lock(), 0])
+            entrada[1] += 1
+
+        try:
+            with entrada[0]:
+                archivo = self.obtener(clave)
+                if archivo:
+                    return archivo
+                archivo = funcion(*args)
+                if archivo:
+                    self.registrar(clave, archivo)
+                return archivo
+        finally:
+            with self._lock:
+                entrada[1] -= 1
+                if entrada[1] == 0:
+                    del self._locks_clave[clave]
@@ -0,0 +1,220 @@
+"""
+Almacén de características de predicción: la matriz de cada versión del dataset se calcula una vez
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Versión del cálculo de características; incrementarla invalida las matrices guardadas
+VERSION_CARACTERISTICAS = 1
+
+# Columnas de origen que determinan la matriz
+COLUMNAS_ORIGEN = ['FECHA_INGRESO_VALE', 'PLACA', 'TIPO_COMBUSTIBLE', 'UNIDAD_ORGANICA',
+                   'KM_RECORRIDO', 'CANTIDAD_GALONES', 'PRECIO', 'TOTAL_CONSUMO', 'EFICIENCIA']
+
+# Características del modelo, en el orden de las columnas de la matriz
+FEATURES_PREDICCION = [
+    'dia_mes', 'dia_semana', 'mes', 'trimestre',
+    'tipo_combustible_num', 'unidad_organica_num',
+    'KM_RECORRIDO', 'CANTIDAD_GALONES', 'PRECIO',
+    'km_promedio', 'consumo_historico'
+]
+
+# Columnas categóricas codificadas (código = posición en la lista de categorías; -1 = sin valor)
+CATEGORICAS = {
+    'tipo_combustible_num': 'TIPO_COMBUSTIBLE',
+    'unidad_organica_num': 'UNIDAD_ORGANICA'
+}
+
+# Versiones de la matriz conservadas en memoria y en disco
+MAX_MATRICES_EN_MEMORIA = 2
+MAX_MATRICES_GUARDADAS = 5
+
+
+def version_caracteristicas(df):
+    """Huella de las columnas de origen de df (valores y orden de filas)"""
+    columnas = [c for c in COLUMNAS_ORIGEN if c in df.columns]
+    huella = hashlib.sha1(str((VERSION_CARACTERISTICAS, len(df), columnas)).encode())
+    if columnas:
+        huella.update(pd.util.hash_pandas_object(df[columnas], index=False).to_numpy().tobytes())
+    return huella.hexdigest()[:16]
+
+
+def _media_por_grupo(codigos, valores, n_grupos):
+    """Media de valores (ignorando NaN) del grupo de cada fila; NaN sin grupo o sin valores"""
+    validos = (codigos >= 0) & ~np.isnan(valores)
+    sumas = np.bincount(codigos[validos], weights=valores[validos], minlength=n_grupos)
+    conteos = np.bincount(codigos[validos], minlength=n_grupos)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        medias = np.append(sumas / conteos, np.nan)
+    return medias[np.where(codigos >= 0, codigos, n_grupos)]
+
+
+class MatrizCaracteristicas:
+    """Características de predicción de un dataset como un arreglo float32 contiguo.
+
+    X tiene una fila por registro y una columna por característica disponible (NaN donde
+    falta el dato); y es TOTAL_CONSUMO. Las columnas categóricas guardan códigos estables
+    (la posición en `categorias`), y placa/eficiencia/anio acompañan a la matriz para los
+    pronósticos por entidad y el análisis de patrones.
+    """
+
+    # Arreglos que se guardan en disco, uno por archivo .npy
+    _ARREGLOS = ['X', 'y', 'placa', 'eficiencia', 'anio']
+
+    def __init__(self, version, X, y, features, categorias, placas, placa, eficiencia, anio):
+        self.version = version
+        self.X = X
+        self.y = y
+        self.features = features
+        self.categorias = categorias
+        self.placas = placas
+        self.placa = placa
+        self.eficiencia = eficiencia
+        self.anio = anio
+
+    @classmethod
+    def construir(cls, df, version=None):
+        n = len(df)
+        columnas = {}
+        anio = np.full(n, -1, dtype=np.int32)
+
+        # Componentes de la fecha (una sola conversión)
+        if 'FECHA_INGRESO_VALE' in df.columns:
+            fechas = pd.to_datetime(df['FECHA_INGRESO_VALE'], errors='coerce')
+            columnas['dia_mes'] = fechas.dt.day.to_numpy(dtype=np.float32, na_value=np.nan)
+            columnas['dia_semana'] = fechas.dt.dayofweek.to_numpy(dtype=np.float32, na_value=np.nan)
+            columnas['mes'] = fechas.dt.month.to_numpy(dtype=np.float32, na_value=np.nan)
+            columnas['trimestre'] = fechas.dt.quarter.to_numpy(dtype=np.float32, na_value=np.nan)
+            anio = fechas.dt.year.fillna(-1).to_numpy(dtype=np.int32)
+
+        # Códigos de categoría sobre las categorías ordenadas del dataset
+        categorias = {}
+        for feature, columna in CATEGORICAS.items():
+            if columna in df.columns:
+                categoricas = pd.Categorical(df[columna])
+                categorias[columna] = [str(c) for c in categoricas.categories]
+                columnas[feature] = categoricas.codes.astype(np.float32)
+
+        for columna in ['KM_RECORRIDO', 'CANTIDAD_GALONES', 'PRECIO']:
+            if columna in df.columns:
+                columnas[columna] = pd.to_numeric(df[columna], errors='coerce').to_numpy(dtype=np.float32)
+
+        # Promedios por vehículo con un solo agrupamiento de las placas
+        placas = []
+        placa = np.full(n, -1, dtype=np.int32)
+        consumo = (pd.to_numeric(df['TOTAL_CONSUMO'], errors='coerce').to_numpy(dtype=np.float64)
+                   if 'TOTAL_CONSUMO' in df.columns else np.full(n, np.nan))
+        if 'PLACA' in df.columns:
+            categoricas = pd.Categorical(df['PLACA'])
+            placas = [str(p) for p in categoricas.categories]
+            placa = categoricas.codes.astype(np.int32)
+            if 'KM_RECORRIDO' in df.columns:
+                columnas['km_promedio'] = _media_por_grupo(
+                    placa, columnas['KM_RECORRIDO'].astype(np.float64), len(placas)).astype(np.float32)
+            if 'TOTAL_CONSUMO' in df.columns:
+                columnas['consumo_historico'] = _media_por_grupo(placa, consumo, len(placas)).astype(np.float32)
+
+        features = [f for f in FEATURES_PREDICCION if f in columnas]
+        X = np.empty((n, len(features)), dtype=np.float32)
+        for i, feature in enumerate(features):
+            X[:, i] = columnas[feature]
+        eficiencia = (pd.to_numeric(df['EFICIENCIA'], errors='coerce').to_numpy(dtype=np.float32)
+                      if 'EFICIENCIA' in df.columns else np.full(n, np.nan, dtype=np.float32))
+
+        return cls(version or version_caracteristicas(df), X, consumo, features, categorias,
+                   placas, placa, eficiencia, anio)
+
+    def columna(self, feature):
+        return self.X[:, self.features.index(feature)]
+
+    def codigos(self, columna, valores):
+        """Códigos de los valores de una columna categórica ('PLACA' o las de CATEGORICAS)"""
+        categorias = self.placas if columna == 'PLACA' else self.categorias.get(columna, [])
+        posicion = {c: i for i, c in enumerate(categorias)}
+        return [posicion[str(v)] for v in valores if str(v) in posicion]
+
+    def entrenamiento(self):
+        """(X, y) para ajustar el modelo: los datos faltantes se completan con 0"""
+        return np.nan_to_num(self.X, nan=0.0), np.nan_to_num(self.y, nan=0.0)
+
+    def guardar(self, directorio):
+        """Escribe los arreglos como .npy (cargables con mmap) y los metadatos como JSON"""
+        temporal = directorio + '.tmp'
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        for nombre in self._ARREGLOS:
+            np.save(os.path.join(temporal, f'{nombre}.npy'), getattr(self, nombre))
+        with open(os.path.join(temporal, 'metadatos.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'features': self.features,
+                       'categorias': self.categorias, 'placas': self.placas}, f)
+        shutil.rmtree(directorio, ignore_errors=True)
+        os.replace(temporal, directorio)
+
+    @classmethod
+    def cargar(cls, directorio):
+        with open(os.path.join(directorio, 'metadatos.json'), 'r', encoding='utf-8') as f:
+            metadatos = json.load(f)
+        arreglos = {nombre: np.load(os.path.join(directorio, f'{nombre}.npy'), mmap_mode='r')
+                    for nombre in cls._ARREGLOS}
+        return cls(metadatos['version'], features=metadatos['features'], categorias=metadatos['categorias'],
+                   placas=metadatos['placas'], **arreglos)
+
+
+class AlmacenCaracteristicas:
+    """Matrices de características por versión del dataset, en memoria y en `directorio`.
+
+    La primera solicitud de una versión la calcula y la guarda; las siguientes (también
+    tras un reinicio) la leen de memoria o del disco con mmap, sin recalcular.
+    """
+
+    def __init__(self, directorio='models/prediccion/caracteristicas', max_en_memoria=MAX_MATRICES_EN_MEMORIA,
+                 max_guardadas=MAX_MATRICES_GUARDADAS):
+        self.directorio = directorio
+        self.max_en_memoria = max_en_memoria
+        self.max_guardadas = max_guardadas
+        self._matrices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, df, version=None):
+        """Matriz de características de df (version: huella ya calculada de df, opcional)"""
+        version = version or version_caracteristicas(df)
+        with self._lock:
+            if version in self._matrices:
+                self._matrices.move_to_end(version)
+                return self._matrices[version]
+
+        ruta = os.path.join(self.directorio, version)
+        matriz = None
+        if os.path.exists(os.path.join(ruta, 'metadatos.json')):
+            try:
+                matriz = MatrizCaracteristicas.cargar(ruta)
+            except Exception as e:
+                print(f"Error cargando características {version}: {e}")
+        if matriz is None:
+            matriz = MatrizCaracteristicas.construir(df, version)
+            try:
+                os.makedirs(self.directorio, exist_ok=True)
+                matriz.guardar(ruta)
+                self._depurar()
+            except OSError as e:
+                print(f"Error guardando características {version}: {e}")
+
+        with self._lock:
+            self._matrices[version] = matriz
+            while len(self._matrices) > self.max_en_memoria:
+                self._matrices.popitem(last=False)
+        return matriz
+
+    def _depurar(self):
+        """Conserva en disco solo las max_guardadas matrices escritas más recientemente"""
+        versiones = [os.path.join(self.directorio, nombre) for nombre in os.listdir(self.directorio)
+                     if not nombre.endswith('.tmp')]
+        versiones.sort(key=os.path.getmtime, reverse=True)
+        for ruta in versiones[self.max_guardadas:]:
+            shutil.rmtree(ruta, ignore_errors=True)
@@ -0,0 +1,236 @@
+"""
+Contexto de reporte: agregados de una selección calculados una sola vez y compartidos por
+gráficos, tablas y recomendaciones
+"""
+import numpy as np
+import pandas as pd
+from .analisis_secuencias import AnalizadorSecuencias, COLUMNAS_SECUENCIA
+from .reduccion_datos import reducir_serie, LIMITES_POR_DEFECTO
+
+# Nombres de DIA_SEMANA (0 = lunes) en el orden en que se muestran
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+DIAS_FIN_DE_SEMANA = ['Sábado', 'Domingo']
+
+# Filas de las tablas de vehículos de los reportes
+TOP_VEHICULOS = 10
+
+# Niveles de riesgo de menor a mayor (categorías de clasificar_nivel_riesgo)
+NIVELES_RIESGO = ['Bajo', 'Moderado', 'Alto', 'Critico']
+
+# Recomendaciones fijas del reporte de emisiones
+RECOMENDACIONES_EMISIONES = [
+    'Implementar programa de mantenimiento preventivo para mejorar eficiencia',
+    'Considerar renovación de vehículos con altas emisiones por kilómetro',
+    'Optimizar rutas para reducir kilómetros innecesarios',
+    'Capacitar conductores en técnicas de conducción eco-eficiente',
+    'Evaluar uso de combustibles alternativos o vehículos híbridos',
+    'Implementar sistema de monitoreo continuo de emisiones',
+    'Compensar huella de carbono mediante programas de reforestación'
+]
+
+
+def _nivel_mas_frecuente(df):
+    """Nivel de riesgo más frecuente por placa (en empate el de menor riesgo, como Series.mode sobre la categoría)"""
+    conteos = df.groupby(['PLACA', 'NIVEL_RIESGO'], observed=True).size().reset_index(name='CANTIDAD')
+    conteos['NIVEL_RIESGO'] = conteos['NIVEL_RIESGO'].astype(str)
+    # Los empates se resuelven por el orden de los niveles, no alfabéticamente
+    orden = conteos['NIVEL_RIESGO'].map({nivel: i for i, nivel in enumerate(NIVELES_RIESGO)})
+    conteos['ORDEN'] = orden.fillna(len(NIVELES_RIESGO))
+    conteos = conteos.sort_values(['PLACA', 'CANTIDAD', 'ORDEN', 'NIVEL_RIESGO'], ascending=[True, False, True, True])
+    return conteos.drop_duplicates('PLACA').set_index('PLACA')['NIVEL_RIESGO']
+
+
+class ContextoReporte:
+    """Agregados del reporte de anomalías de un mes y dependencia.
+
+    construir() recorre el DataFrame una vez por agregado; los totales por día y por
+    vehículo se leen del cubo si se indica. Los atributos ausentes en los datos quedan en None.
+    limites (LimitesGraficos) acota los puntos de la tendencia y de las dispersiones dibujadas.
+    """
+
+    def __init__(self, mes, dependencia, limites=None):
+        self.mes = mes
+        self.dependencia = dependencia
+        self.limites = limites or LIMITES_POR_DEFECTO
+        self.total_registros = 0
+        self.total_consumo = 0
+        self.total_galones = 0
+        self.total_km = 0
+        self.total_anomalias = 0
+        self.porcentaje_anomalias = 0
+        self.eficiencia = None
+        self.eficiencia_promedio = 0
+        self.consumo_diario = None
+        self.consumo_fin_de_semana = 0
+        self.riesgo = None
+        self.dispersion = None
+        self.consumo_temporal = None
+        self.top_consumo_vehiculos = None
+        self.vehiculos_anomalias = None
+        self.secuencia = None
+        self.total_inconsistencias = 0
+        self.resumen_secuencia = None
+        self.vales_anomalos = None
+
+    @classmethod
+    def construir(cls, df, mes, dependencia, cubo=None, limites=None):
+        contexto = cls(mes, dependencia, limites)
+        filtros_cubo = {'MES': int(mes), 'UNIDAD_ORGANICA': dependencia}
+        columnas = df.columns
+
+        # Totales del resumen ejecutivo
+        contexto.total_registros = len(df)
+        contexto.total_consumo = df['TOTAL_CONSUMO'].sum() if 'TOTAL_CONSUMO' in columnas else 0
+        contexto.total_galones = df['CANTIDAD_GALONES'].sum() if 'CANTIDAD_GALONES' in columnas else 0
+        contexto.total_km = df['KM_RECORRIDO'].sum() if 'KM_RECORRIDO' in columnas else 0
+        contexto.total_anomalias = df['ANOMALIA'].sum() if 'ANOMALIA' in columnas else 0
+        if contexto.total_registros > 0:
+            contexto.porcentaje_anomalias = contexto.total_anomalias / contexto.total_registros * 100
+
+        # Eficiencia: valores del histograma y estadísticos
+        if 'EFICIENCIA' in columnas:
+            valores = df['EFICIENCIA'].dropna().to_numpy(dtype=float)
+            contexto.eficiencia_promedio = df['EFICIENCIA'].mean()
+            if len(valores):
+                contexto.eficiencia = {
+                    'valores': valores,
+                    'min': valores.min(),
+                    'max': valores.max(),
+                    'mean': valores.mean(),
+                    'std': valores.std(ddof=1) if len(valores) > 1 else np.nan
+                }
+
+        # Consumo por día de la semana (solo los días con registros, en orden de la semana)
+        if 'DIA_SEMANA' in columnas and 'TOTAL_CONSUMO' in columnas:
+            if cubo is not None:
+                consumo_diario = cubo.serie('TOTAL_CONSUMO', 'DIA_SEMANA', filtros_cubo)
+            else:
+                consumo_diario = df.groupby('DIA_SEMANA')['TOTAL_CONSUMO'].sum()
+            consumo_diario = consumo_diario[consumo_diario.index.isin(range(7))].sort_index()
+            consumo_diario.index = [DIAS_SEMANA[int(dia)] for dia in consumo_diario.index]
+            contexto.consumo_diario = consumo_diario
+            contexto.consumo_fin_de_semana = consumo_diario.reindex(DIAS_FIN_DE_SEMANA, fill_value=0).sum()
+
+        # Cantidad y consumo por nivel de riesgo (orden de value_counts)
+        if 'NIVEL_RIESGO' in columnas:
+            niveles = df['NIVEL_RIESGO'].astype(object)
+            consumo = df['TOTAL_CONSUMO'] if 'TOTAL_CONSUMO' in columnas else pd.Series(0, index=df.index)
+            riesgo = consumo.groupby(niveles).agg(['size', 'sum'])
+            riesgo.columns = ['CANTIDAD', 'CONSUMO']
+            contexto.riesgo = riesgo.sort_values('CANTIDAD', ascending=False, kind='stable')
+
+        # Dispersión eficiencia vs consumo
+        if 'EFICIENCIA' in columnas and 'TOTAL_CONSUMO' in columnas:
+            anomalia = df['ANOMALIA'].to_numpy() if 'ANOMALIA' in columnas else np.zeros(len(df))
+            contexto.dispersion = {
+                'x': df['EFICIENCIA'].to_numpy(dtype=float),
+                'y': df['TOTAL_CONSUMO'].to_numpy(dtype=float),
+                'anomalo': anomalia == 1,
+                'normal': anomalia == 0
+            }
+
+        # Tendencia diaria (reducida con LTTB)
+        if 'FECHA_INGRESO_VALE' in columnas and 'TOTAL_CONSUMO' in columnas:
+            fechas = pd.to_datetime(df['FECHA_INGRESO_VALE'])
+            consumo_temporal = df['TOTAL_CONSUMO'].groupby(fechas.dt.normalize()).sum()
+            if len(consumo_temporal) > 1:
+                contexto.consumo_temporal = reducir_serie(consumo_temporal, contexto.limites.max_puntos_linea)
+
+        # Vehículos: mayor consumo y anomalías por placa
+        if 'PLACA' in columnas:
+            if cubo is not None:
+                consumo_por_vehiculo = cubo.serie('TOTAL_CONSUMO', 'PLACA', filtros_cubo)
+            else:
+                consumo_por_vehiculo = df.groupby('PLACA')['TOTAL_CONSUMO'].sum()
+            contexto.top_consumo_vehiculos = consumo_por_vehiculo.sort_values(ascending=False).head(TOP_VEHICULOS)
+
+            if 'ANOMALIA' in columnas:
+                anomalos = df[df['ANOMALIA'] == 1]
+                vehiculos = anomalos.groupby('PLACA').agg(
+                    ANOMALIA=('ANOMALIA', 'count'),
+                    TOTAL_CONSUMO=('TOTAL_CONSUMO', 'sum'),
+                    EFICIENCIA=('EFICIENCIA', 'mean')
+                )
+                vehiculos['NIVEL_RIESGO'] = _nivel_mas_frecuente(anomalos).reindex(vehiculos.index).fillna('N/A')
+                contexto.vehiculos_anomalias = vehiculos.sort_values('ANOMALIA', ascending=False).head(TOP_VEHICULOS)
+
+        # Todos los vales anómalos, del mayor al menor score (anexo del reporte)
+        if 'ANOMALIA' in columnas:
+            vales = df[df['ANOMALIA'] == 1]
+            if 'SCORE_ANOMALIA' in columnas:
+                vales = vales.sort_values('SCORE_ANOMALIA', ascending=False, kind='stable')
+            contexto.vales_anomalos = vales
+
+        # Inconsistencias de secuencia (reutiliza las columnas del procesamiento en lote si existen)
+        analizador = AnalizadorSecuencias()
+        if all(c in columnas for c in COLUMNAS_SECUENCIA):
+            secuencia = df[COLUMNAS_SECUENCIA]
+        else:
+            secuencia = analizador.analizar(df)
+        contexto.secuencia = secuencia
+        contexto.total_inconsistencias = int(secuencia['INCONSISTENCIA_SECUENCIA'].sum())
+        if contexto.total_inconsistencias > 0:
+            contexto.resumen_secuencia = analizador.resumen_por_vehiculo(df, secuencia).head(TOP_VEHICULOS)
+
+        return contexto
+
+    def recomendaciones(self):
+        """Recomendaciones según el porcentaje de anomalías, la eficiencia y el uso en fines de semana"""
+        recomendaciones = []
+        
+        if self.porcentaje_anomalias > 10:
+            recomendaciones.append('URGENTE: Implementar programa de mantenimiento preventivo')
+            recomendaciones.append('Revisar procedimientos de carga de combustible')
+            recomendaciones.append('Capacitar a conductores en manejo eficiente')
+        
+        if self.eficiencia_promedio < 8:
+            recomendaciones.append('Optimizar rutas para mejorar eficiencia')
+            recomendaciones.append('Revisar estado mecánico de vehículos')
+        
+        if self.consumo_diario is not None and self.consumo_fin_de_semana > self.total_consumo * 0.3:
+            recomendaciones.append('Evaluar el uso de vehículos en fines de semana')
+        
+        if self.total_inconsistencias > 0:
+            recomendaciones.append('Auditar los vales con inconsistencias en la secuencia de cargas')
+        
+        recomendaciones.append('Implementar sistema de monitoreo continuo')
+        recomendaciones.append('Generar reportes mensuales de seguimiento')
+        return recomendaciones
+
+
+class ContextoEmisiones:
+    """Agregados del reporte de emisiones: las emisiones por registro se calculan una sola vez
+    y las estadísticas (del detalle o del cubo) alimentan tanto los gráficos como el texto."""
+
+    def __init__(self, df_emisiones, estadisticas, limites=None):
+        self.df_emisiones = df_emisiones
+        self.estadisticas = estadisticas
+        self.limites = limites or LIMITES_POR_DEFECTO
+
+    @classmethod
+    def construir(cls, calculador, df, cubo=None, filtros=None, limites=None):
+        df_emisiones = calculador.calcular_emisiones_dataframe(df)
+        estadisticas = calculador.generar_estadisticas_emisiones(df, cubo, filtros, df_emisiones=df_emisiones)
+        return cls(df_emisiones, estadisticas, limites)
+
+    def emisiones_por_combustible(self):
+        por_combustible = self.estadisticas.get('por_tipo_combustible', {})
+        return pd.Series(por_combustible.get(('EMISIONES_CO2_KG', 'sum'), {}), dtype=float)
+
+    def top_vehiculos(self):
+        return pd.Series(self.estadisticas.get('top_vehiculos_emisiones', {}), dtype=float)
+
+    def distribucion_niveles(self):
+        return pd.Series(self.estadisticas.get('distribucion_niveles', {}), dtype='int64')
+
+    def equivalencias(self):
+        """Equivalencias ambientales del total de emisiones"""
+        total_co2 = self.estadisticas.get('total_emisiones_kg', 0)
+        return {
+            'arboles_necesarios': total_co2 / 22,  # Un árbol absorbe ~22 kg CO2/año
+            'km_auto_particular': total_co2 / 0.2,  # Auto particular ~0.2 kg CO2/km
+            'impacto': 'ALTO' if total_co2 > 1000 else 'MEDIO' if total_co2 > 500 else 'BAJO'
+        }
+
+    def recomendaciones(self):
+        return list(RECOMENDACIONES_EMISIONES)
@@ -0,0 +1,161 @@
+"""
+Cubo de agregados de consumo construido una vez por versión del dataset
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Dimensiones y medidas del cubo
+DIMENSIONES_CUBO = ['ANIO', 'MES', 'UNIDAD_ORGANICA', 'PLACA', 'DIA_SEMANA', 'TIPO_COMBUSTIBLE']
+MEDIDAS_CUBO = ['CANTIDAD_GALONES', 'KM_RECORRIDO', 'TOTAL_CONSUMO', 'EMISIONES_CO2_KG', 'EFICIENCIA', 'EMISIONES_POR_KM']
+
+# Columnas de origen que determinan el contenido del cubo
+COLUMNAS_VERSION = ['FECHA_INGRESO_VALE', 'UNIDAD_ORGANICA', 'PLACA', 'TIPO_COMBUSTIBLE',
+                    'CANTIDAD_GALONES', 'KM_RECORRIDO', 'TOTAL_CONSUMO', 'EFICIENCIA']
+
+# Versiones de cubo conservadas en memoria
+MAX_CUBOS_EN_CACHE = 4
+
+
+def calcular_version_dataset(df):
+    """Huella del contenido del dataset (columnas de origen del cubo), estable entre cargas del mismo archivo"""
+    columnas = [c for c in COLUMNAS_VERSION if c in df.columns]
+    huella = hashlib.sha1(str((len(df), columnas)).encode())
+    if columnas:
+        huella.update(pd.util.hash_pandas_object(df[columnas], index=False).to_numpy().tobytes())
+    return huella.hexdigest()[:16]
+
+
+class CuboConsumo:
+    """Sumas y conteos de las medidas por cada combinación de dimensiones presente en los datos.
+
+    La media de una medida se obtiene como suma / conteo, igual que el mean de pandas sobre
+    las filas originales, así que las consultas reproducen los groupby sobre el detalle.
+    """
+
+    def __init__(self, celdas, version, registros):
+        self.celdas = celdas
+        self.version = version
+        self.registros = registros
+
+    @classmethod
+    def construir(cls, df, calculador_emisiones=None, version=None):
+        """Agrega df por DIMENSIONES_CUBO; las emisiones se calculan con calculador_emisiones si se indica"""
+        base = pd.DataFrame(index=df.index)
+        fechas = pd.to_datetime(df['FECHA_INGRESO_VALE'], errors='coerce') if 'FECHA_INGRESO_VALE' in df.columns else None
+        base['ANIO'] = fechas.dt.year if fechas is not None else np.nan
+        base['MES'] = fechas.dt.month if fechas is not None else np.nan
+        base['DIA_SEMANA'] = fechas.dt.dayofweek if fechas is not None else np.nan
+        for dimension in ['UNIDAD_ORGANICA', 'PLACA', 'TIPO_COMBUSTIBLE']:
+            base[dimension] = df[dimension] if dimension in df.columns else None
+
+        for medida in ['CANTIDAD_GALONES', 'KM_RECORRIDO', 'TOTAL_CONSUMO', 'EFICIENCIA']:
+            base[medida] = pd.to_numeric(df[medida], errors='coerce') if medida in df.columns else np.nan
+        if calculador_emisiones is not None:
+            emisiones = calculador_emisiones.calcular_emisiones_vectorizado(
+                base['CANTIDAD_GALONES'], base['TIPO_COMBUSTIBLE'])
+            base['EMISIONES_CO2_KG'] = emisiones
+            base['EMISIONES_POR_KM'] = np.where(base['KM_RECORRIDO'] > 0, emisiones / base['KM_RECORRIDO'], 0)
+        else:
+            base['EMISIONES_CO2_KG'] = np.nan
+            base['EMISIONES_POR_KM'] = np.nan
+
+        agrupado = base.groupby(DIMENSIONES_CUBO, dropna=False, sort=False, observed=True)
+        celdas = agrupado[MEDIDAS_CUBO].agg(['sum', 'count'])
+        celdas.columns = [f'{medida}_{agregado.upper()}' for medida, agregado in celdas.columns]
+        celdas['REGISTROS'] = agrupado.size()
+        celdas = celdas.reset_index()
+
+        return cls(celdas, version or calcular_version_dataset(df), len(df))
+
+    def _filtrar(self, filtros):
+        celdas = self.celdas
+        for dimension, valor in (filtros or {}).items():
+            if valor is None:
+                continue
+            if isinstance(valor, (list, tuple, set)):
+                celdas = celdas[celdas[dimension].isin(list(valor))]
+            else:
+                celdas = celdas[celdas[dimension] == valor]
+        return celdas
+
+    def _totales(self, por, filtros, medidas):
+        """Suma de las columnas SUM/COUNT de las celdas filtradas por las dimensiones `por`"""
+        columnas = [f'{m}_SUM' for m in medidas] + [f'{m}_COUNT' for m in medidas] + ['REGISTROS']
+        celdas = self._filtrar(filtros)
+        if por:
+            return celdas.groupby(por, sort=True)[columnas].sum()
+        return celdas[columnas].sum().to_frame().T
+
+    @staticmethod
+    def _medida(totales, medida, agregacion):
+        if agregacion == 'mean':
+            return totales[f'{medida}_SUM'] / totales[f'{medida}_COUNT'].replace(0, np.nan)
+        if agregacion == 'count':
+            return totales[f'{medida}_COUNT']
+        return totales[f'{medida}_SUM']
+
+    def consultar(self, por=None, filtros=None, medidas=None, agregacion='sum'):
+        """Roll-up de las celdas filtradas agrupado por las dimensiones `por`.
+
+        agregacion: 'sum', 'mean' o 'count' por medida; la columna REGISTROS siempre se incluye.
+        Sin `por` retorna una Serie con el total de la selección.
+        """
+        medidas = medidas or MEDIDAS_CUBO
+        por = [por] if isinstance(por, str) else por
+        totales = self._totales(por, filtros, medidas)
+
+        resultado = pd.DataFrame(index=totales.index)
+        for medida in medidas:
+            resultado[medida] = self._medida(totales, medida, agregacion)
+        resultado['REGISTROS'] = totales['REGISTROS']
+
+        return resultado if por else resultado.iloc[0]
+
+    def agregar(self, por, filtros=None, agregaciones=None):
+        """Equivalente a df.groupby(por).agg(agregaciones) con columnas (medida, agregación)"""
+        agregaciones = agregaciones or {}
+        por = [por] if isinstance(por, str) else por
+        totales = self._totales(por, filtros, list(agregaciones))
+        resultado = pd.DataFrame({
+            (medida, funcion): self._medida(totales, medida, funcion)
+            for medida, funciones in agregaciones.items() for funcion in funciones
+        })
+        resultado.columns = pd.MultiIndex.from_tuples(resultado.columns)
+        return resultado
+
+    def serie(self, medida, por, filtros=None, agregacion='sum'):
+        """Atajo para una sola medida agrupada por una dimensión"""
+        return self.consultar(por, filtros, [medida], agregacion)[medida]
+
+    def resumen(self):
+        return {
+            'version': self.version,
+            'registros': int(self.registros),
+            'celdas': int(len(self.celdas))
+        }
+
+
+class CacheCubos:
+    """Cubos por versión del dataset; una misma carga reutiliza el cubo ya construido"""
+
+    def __init__(self, max_cubos=MAX_CUBOS_EN_CACHE):
+        self.max_cubos = max_cubos
+        self._cubos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, df, calculador_emisiones=None):
+        version = calcular_version_dataset(df)
+        with self._lock:
+            if version in self._cubos:
+                self._cubos.move_to_end(version)
+                return self._cubos[version]
+
+        cubo = CuboConsumo.construir(df, calculador_emisiones, version)
+        with self._lock:
+            self._cubos[version] = cubo
+            while len(self._cubos) > self.max_cubos:
+                self._cubos.popitem(last=False)
+        return cubo
@@ -0,0 +1,167 @@
+"""
+Detectores de anomalías intercambiables: nivel rápido (estadística robusta) e IsolationForest
+"""
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from .analisis_combustible import (
+    COLUMNAS_ANOMALIA, clasificar_nivel_riesgo, detectar_anomalias_isolation_forest
+)
+
+# Particiones con al menos esta cantidad de registros usan IsolationForest en modo 'auto'
+UMBRAL_ISOLATION_FOREST = 200
+
+# Variables evaluadas por el detector robusto
+FEATURES_ROBUSTAS = ['CANTIDAD_GALONES', 'TOTAL_CONSUMO', 'KM_RECORRIDO', 'EFICIENCIA', 'COSTO_POR_KM']
+
+
+def _mediana_por_grupo(codigos, valores, n_grupos):
+    """Mediana de valores por grupo con un solo ordenamiento (los NaN se ignoran)"""
+    orden = np.lexsort((valores, codigos))  # Por grupo y luego por valor; NaN al final de cada grupo
+    ordenados = valores[orden]
+    conteo = np.bincount(codigos[~np.isnan(valores)], minlength=n_grupos)
+    inicio = np.searchsorted(codigos[orden], np.arange(n_grupos), side='left')
+
+    bajo = np.minimum(inicio + np.maximum(conteo - 1, 0) // 2, len(valores) - 1)
+    alto = np.minimum(inicio + conteo // 2, len(valores) - 1)
+    mediana = (ordenados[bajo] + ordenados[alto]) / 2.0
+    mediana[conteo == 0] = np.nan
+    return mediana, conteo
+
+
+def z_robusto_por_grupo(codigos, matriz, n_grupos):
+    """Z-score robusto 0.6745*(x - mediana)/MAD de cada columna de matriz dentro de cada grupo.
+
+    Todas las columnas se procesan juntas desplazando el código de grupo por columna.
+    Si el MAD es 0 se usa 1.2533 * desviación absoluta media (Iglewicz y Hoaglin).
+    Retorna (z, conteo) con forma (n_registros, n_columnas).
+    """
+    n, n_columnas = matriz.shape
+    codigos_ext = (codigos[:, None] + np.arange(n_columnas)[None, :] * n_grupos).ravel()
+    valores = matriz.ravel()
+    total_grupos = n_grupos * n_columnas
+
+    mediana, conteo = _mediana_por_grupo(codigos_ext, valores, total_grupos)
+    desviacion = np.abs(valores - mediana[codigos_ext])
+    mad, _ = _mediana_por_grupo(codigos_ext, desviacion, total_grupos)
+
+    validos = ~np.isnan(desviacion)
+    suma_desviacion = np.bincount(codigos_ext[validos], weights=desviacion[validos], minlength=total_grupos)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        desviacion_media = suma_desviacion / conteo
+        z = np.where(mad[codigos_ext] > 0,
+                     0.6745 * (valores - mediana[codigos_ext]) / mad[codigos_ext],
+                     (valores - mediana[codigos_ext]) / (1.253314 * desviacion_media[codigos_ext]))
+    z[~np.isfinite(z)] = np.nan
+    return z.reshape(n, n_columnas), conteo[codigos_ext].reshape(n, n_columnas)
+
+
+class DetectorAnomalias(ABC):
+    """Interfaz común de los detectores que entrega seleccionar_detector"""
+    nombre = 'base'
+
+    @abstractmethod
+    def detectar(self, df):
+        """Retorna df con ANOMALIA, SCORE_ANOMALIA y NIVEL_RIESGO"""
+
+
+class DetectorRobusto(DetectorAnomalias):
+    """Nivel rápido: z-scores robustos (mediana/MAD) por PLACA y por dependencia.
+
+    Cada valor se compara con la historia de su propio vehículo cuando éste tiene
+    suficientes registros; si no, con su dependencia y, en último caso, con todo el conjunto.
+    El score es (|z| - umbral) / (|z| + umbral): positivo solo para anomalías, como
+    el score de IsolationForest, y acotado en (-1, 1) para los mismos niveles de riesgo.
+    """
+    nombre = 'robusto'
+
+    def __init__(self, umbral_z=3.5, min_registros_grupo=5, features=None):
+        self.umbral_z = umbral_z
+        self.min_registros_grupo = min_registros_grupo
+        self.features = features or FEATURES_ROBUSTAS
+
+    def _codigos(self, df, columna):
+        if columna not in df.columns:
+            return np.zeros(len(df), dtype=np.int64), 1
+        codigos, categorias = pd.factorize(df[columna], use_na_sentinel=True)
+        codigos = codigos.astype(np.int64)
+        # Los valores faltantes forman su propio grupo
+        codigos[codigos < 0] = len(categorias)
+        return codigos, len(categorias) + 1
+
+    def calcular_z(self, df):
+        """Retorna la matriz de z robustos (n_registros, n_features) eligiendo el nivel de referencia"""
+        features = [f for f in self.features if f in df.columns]
+        if not features:
+            return np.full((len(df), 0), np.nan), features
+
+        matriz = df[features].to_numpy(dtype=np.float64, na_value=np.nan)
+        z = np.full(matriz.shape, np.nan)
+
+        # De la referencia más general a la más específica; cada nivel sobrescribe al anterior
+        niveles = [(None, 0)]
+        niveles.append(('UNIDAD_ORGANICA', self.min_registros_grupo))
+        niveles.append(('PLACA', self.min_registros_grupo))
+        for columna, minimo in niveles:
+            if columna is None:
+                codigos, n_grupos = np.zeros(len(df), dtype=np.int64), 1
+            elif columna in df.columns:
+                codigos, n_grupos = self._codigos(df, columna)
+            else:
+                continue
+            z_nivel, conteo = z_robusto_por_grupo(codigos, matriz, n_grupos)
+            usar = (conteo >= max(minimo, 1)) & ~np.isnan(z_nivel)
+            z[usar] = z_nivel[usar]
+
+        return z, features
+
+    def detectar(self, df):
+        df = df.drop(columns=[c for c in COLUMNAS_ANOMALIA if c in df.columns])
+        if df.empty:
+            return df
+
+        z, _ = self.calcular_z(df)
+        if z.shape[1]:
+            z_max = np.nanmax(np.where(np.isnan(z), -np.inf, np.abs(z)), axis=1)
+            z_max[~np.isfinite(z_max)] = 0.0
+        else:
+            z_max = np.zeros(len(df))
+
+        score = (z_max - self.umbral_z) / (z_max + self.umbral_z)
+        df['ANOMALIA'] = (z_max > self.umbral_z).astype(int)
+        df['SCORE_ANOMALIA'] = score
+        df['NIVEL_RIESGO'] = clasificar_nivel_riesgo(df['SCORE_ANOMALIA'])
+        return df
+
+
+class DetectorIsolationForest(DetectorAnomalias):
+    """Nivel completo: IsolationForest de 150 árboles sobre la partición.
+
+    tamano_muestra acota los registros usados para el ajuste, tamano_bloque los
+    registros puntuados a la vez y n_jobs los árboles ajustados en paralelo.
+    """
+    nombre = 'isolation_forest'
+
+    def __init__(self, tamano_muestra=None, tamano_bloque=None, n_jobs=None):
+        self.tamano_muestra = tamano_muestra
+        self.tamano_bloque = tamano_bloque
+        self.n_jobs = n_jobs
+
+    def detectar(self, df):
+        return detectar_anomalias_isolation_forest(df, self.tamano_muestra, self.tamano_bloque, self.n_jobs)
+
+
+DETECTORES = {
+    DetectorRobusto.nombre: DetectorRobusto,
+    DetectorIsolationForest.nombre: DetectorIsolationForest
+}
+
+
+def seleccionar_detector(n_registros, modo='auto', umbral_isolation_forest=UMBRAL_ISOLATION_FOREST,
+                         opciones_isolation_forest=None):
+    """Retorna el detector a usar: el solicitado explícitamente o, en 'auto', según el tamaño"""
+    if modo == DetectorRobusto.nombre:
+        return DetectorRobusto()
+    if modo == DetectorIsolationForest.nombre or n_registros >= umbral_isolation_forest:
+        return DetectorIsolationForest(**(opciones_isolation_forest or {}))
+    return DetectorRobusto()
@@ -0,0 +1,81 @@
+"""
+Generación de reportes en segundo plano con seguimiento de estado por identificador
+"""
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Estados conservados para consulta; los más antiguos se descartan
+MAX_REPORTES_REGISTRADOS = 200
+
+
+class GestorReportes:
+    """Cola de generación de reportes.
+
+    Por defecto usa un solo hilo: los gráficos se dibujan con pyplot, que no es
+    seguro entre hilos, y así los reportes se generan uno tras otro sin bloquear
+    las peticiones que los solicitan.
+    """
+
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='reportes')
+        self._lock = threading.Lock()
+        self.reportes = OrderedDict()
+
+    def _actualizar(self, report_id, **cambios):
+        with self._lock:
+            if report_id in self.reportes:
+                self.reportes[report_id].update(cambios)
+
+    def _ejecutar(self, report_id, funcion, args):
+        inicio = time.perf_counter()
+        self._actualizar(report_id, estado='generando')
+        try:
+            archivo = funcion(*args)
+            if not archivo:
+                raise RuntimeError('No se pudo generar el reporte')
+            self._actualizar(report_id, estado='completado', archivo=archivo)
+        except Exception as e:
+            print(f"Error generando reporte {report_id}: {e}")
+            self._actualizar(report_id, estado='error', error=str(e))
+        finally:
+            self._actualizar(report_id,
+                             fin=datetime.now().isoformat(),
+                             duracion=round(time.perf_counter() - inicio, 3))
+
+    def _registrar(self, **estado):
+        report_id = uuid.uuid4().hex
+        with self._lock:
+            self.reportes[report_id] = {
+                'report_id': report_id,
+                'estado': 'en_cola',
+                'archivo': None,
+                'error': None,
+                'solicitado': datetime.now().isoformat(),
+                'fin': None,
+                'duracion': None,
+                **estado
+            }
+            while len(self.reportes) > MAX_REPORTES_REGISTRADOS:
+                self.reportes.popitem(last=False)
+        return report_id
+
+    def solicitar(self, funcion, *args, **metadatos):
+        """Encola funcion(*args), que debe retornar el nombre del archivo generado; retorna el id del reporte"""
+        report_id = self._registrar(**metadatos)
+        self._executor.submit(self._ejecutar, report_id, funcion, args)
+        return report_id
+
+    def registrar_completado(self, archivo, **metadatos):
+        """Registra un reporte ya disponible (por ejemplo desde el caché) sin encolar trabajo"""
+        return self._registrar(estado='completado', archivo=archivo,
+                               fin=datetime.now().isoformat(), duracion=0.0, **metadatos)
+
+    def obtener_estado(self, report_id):
+        """Retorna una copia del estado del reporte o None si no existe"""
+        with self._lock:
+            estado = self.reportes.get(report_id)
+            return dict(estado) if estado is not None else None
@@ -0,0 +1,208 @@
+"""
+Generación en lote de los reportes de un mes (o rango de meses) para todas las dependencias
+"""
+import os
+import time
+import uuid
+import zipfile
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from .analisis_combustible import detectar_anomalias, generar_reporte_anomalias, COLUMNAS_ANOMALIA
+from .cache_reportes import CacheReportes
+
+TIPOS_REPORTE = ['anomalias', 'emisiones']
+
+# Trabajos en lote conservados para consulta
+MAX_LOTES_REGISTRADOS = 20
+
+# Tamaño de los bloques en que se envía el zip
+TAMANO_BLOQUE_ZIP = 1024 * 1024
+
+
+class _SalidaZip:
+    """Destino de escritura sin posicionamiento: zipfile escribe aquí y el generador vacía los bytes"""
+
+    def __init__(self):
+        self._partes = []
+        self._escritos = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._escritos += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._escritos
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+class GeneradorLoteReportes:
+    """Genera los reportes de anomalías y emisiones de cada (MES, UNIDAD_ORGANICA) de un rango de meses.
+
+    El dataset se particiona una sola vez y las particiones se procesan en paralelo; las
+    anomalías se reutilizan del procesamiento en lote cuando ya cubrió la partición, los
+    agregados salen del cubo y cada reporte pasa por el caché, así que un reporte ya
+    generado (en otro lote o desde /analyze) no se vuelve a dibujar.
+    """
+
+    def __init__(self, cache_reportes, calculador_emisiones, directorio='uploads', max_workers=4, almacen=None):
+        self.cache_reportes = cache_reportes
+        self.calculador_emisiones = calculador_emisiones
+        self.directorio = directorio
+        self.almacen = almacen
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='lote_reportes')
+        self._lock = threading.Lock()
+        self.lotes = OrderedDict()
+
+    def _particiones(self, df, meses, dependencias=None):
+        seleccion = df[df['MES'].isin(meses)]
+        if dependencias:
+            seleccion = seleccion[seleccion['UNIDAD_ORGANICA'].isin(dependencias)]
+        return [((int(mes), dependencia), grupo.copy())
+                for (mes, dependencia), grupo in seleccion.groupby(['MES', 'UNIDAD_ORGANICA'], sort=True)]
+
+    def _actualizar(self, lote_id, indice, **cambios):
+        with self._lock:
+            lote = self.lotes.get(lote_id)
+            if lote is None:
+                return
+            lote['reportes'][indice].update(cambios)
+            if cambios.get('estado') in ('completado', 'error'):
+                lote['terminados'] += 1
+                if lote['terminados'] == lote['total']:
+                    lote['estado'] = 'completado'
+                    lote['fin'] = datetime.now().isoformat()
+
+    def _generar(self, lote_id, indice, tipo, mes, dependencia, df, cubo, perfil, formato, opciones_anomalias, limites):
+        inicio = time.perf_counter()
+        self._actualizar(lote_id, indice, estado='generando')
+        try:
+            if tipo == 'anomalias':
+                if not (all(c in df.columns for c in COLUMNAS_ANOMALIA) and df['ANOMALIA'].notna().all()):
+                    df = detectar_anomalias(df, **opciones_anomalias)
+                clave = CacheReportes.clave('anomalias', df, mes=mes, dependencia=dependencia, perfil=perfil, formato=formato,
+                                            limites=limites)
+                archivo = self.cache_reportes.generar(
+                    clave, generar_reporte_anomalias, df, mes, dependencia, cubo, perfil, formato, self.directorio, limites)
+            else:
+                clave = CacheReportes.clave('emisiones', df, mes=mes, dependencia=dependencia, perfil=perfil, formato=formato,
+                                            limites=limites)
+                archivo = self.cache_reportes.generar(
+                    clave, self.calculador_emisiones.generar_reporte_emisiones, df, mes, dependencia, perfil,
+                    cubo, {'MES': mes, 'UNIDAD_ORGANICA': dependencia}, formato, self.directorio, limites)
+            if not archivo:
+                raise RuntimeError('No se pudo generar el reporte')
+            self._actualizar(lote_id, indice, estado='completado', archivo=archivo,
+                             duracion=round(time.perf_counter() - inicio, 3))
+            return indice
+        except Exception as e:
+            print(f"Error en reporte de lote {tipo} {mes}/{dependencia}: {e}")
+            self._actualizar(lote_id, indice, estado='error', error=str(e),
+                             duracion=round(time.perf_counter() - inicio, 3))
+            return indice
+
+    def iniciar(self, df, meses, dependencias=None, tipos=None, cubo=None, perfil=None, formato='pdf',
+                opciones_anomalias=None, limites=None):
+        """Encola los reportes de todas las particiones y retorna el id del lote (None si no hay datos).
+
+        limites (LimitesGraficos) acota los puntos de los gráficos; None usa los valores por defecto.
+        """
+        tipos = [t for t in (tipos or TIPOS_REPORTE) if t in TIPOS_REPORTE]
+        particiones = self._particiones(df, meses, dependencias)
+        if not particiones or not tipos:
+            return None
+
+        lote_id = uuid.uuid4().hex
+        reportes = [{'tipo': tipo, 'mes': mes, 'dependencia': dependencia, 'registros': int(len(grupo)),
+                     'estado': 'en_cola', 'archivo': None, 'error': None, 'duracion': None}
+                    for (mes, dependencia), grupo in particiones for tipo in tipos]
+        with self._lock:
+            self.lotes[lote_id] = {
+                'lote_id': lote_id,
+                'estado': 'procesando',
+                'meses': [int(m) for m in meses],
+                'perfil': perfil,
+                'formato': formato,
+                'total': len(reportes),
+                'terminados': 0,
+                'inicio': datetime.now().isoformat(),
+                'fin': None,
+                'reportes': reportes,
+                'futuros': []
+            }
+            while len(self.lotes) > MAX_LOTES_REGISTRADOS:
+                self.lotes.popitem(last=False)
+
+        futuros = []
+        indice = 0
+        for (mes, dependencia), grupo in particiones:
+            for tipo in tipos:
+                futuros.append(self._executor.submit(
+                    self._generar, lote_id, indice, tipo, mes, dependencia, grupo, cubo, perfil, formato,
+                    opciones_anomalias or {}, limites))
+                indice += 1
+        with self._lock:
+            self.lotes[lote_id]['futuros'] = futuros
+        return lote_id
+
+    def obtener_estado(self, lote_id):
+        """Copia del estado del lote con el progreso de cada reporte, o None si no existe"""
+        with self._lock:
+            lote = self.lotes.get(lote_id)
+            if lote is None:
+                return None
+            estado = {k: v for k, v in lote.items() if k != 'futuros'}
+            estado['reportes'] = [dict(r) for r in lote['reportes']]
+            return estado
+
+    def _protegido(self, archivo):
+        if self.almacen is not None:
+            return self.almacen.usando('reportes', archivo)
+        return nullcontext(os.path.exists(os.path.join(self.directorio, archivo)))
+
+    def stream_zip(self, lote_id):
+        """Generador con los bytes de un zip que incluye cada reporte en cuanto termina.
+
+        Los PDF ya vienen comprimidos, así que se guardan sin recomprimir; el zip se arma
+        sobre un destino sin posicionamiento, por lo que nunca se mantiene completo en memoria.
+        """
+        with self._lock:
+            lote = self.lotes.get(lote_id)
+            futuros = list(lote['futuros']) if lote else []
+            reportes = lote['reportes'] if lote else []
+
+        salida = _SalidaZip()
+        with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for futuro in as_completed(futuros):
+                with self._lock:
+                    reporte = dict(reportes[futuro.result()])
+                if reporte['estado'] != 'completado':
+                    continue
+                ruta = os.path.join(self.directorio, reporte['archivo'])
+                nombre = f"{reporte['tipo']}/mes{reporte['mes']:02d}_{reporte['archivo']}"
+                # El archivo no se elimina por retención mientras se copia al zip
+                with self._protegido(reporte['archivo']) as disponible:
+                    if not disponible:
+                        continue
+                    with open(ruta, 'rb') as origen, zf.open(nombre, 'w') as destino:
+                        while True:
+                            bloque = origen.read(TAMANO_BLOQUE_ZIP)
+                            if not bloque:
+                                break
+                            destino.write(bloque)
+                            datos = salida.vaciar()
+                            if datos:
+                                yield datos
+        # Directorio central del zip
+        yield salida.vaciar()
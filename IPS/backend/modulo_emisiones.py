@@ -8,6 +8,73 @@ import seaborn as sns
 from fpdf import FPDF
 import os
 from datetime import datetime
+from .contexto_reporte import ContextoEmisiones
+from .reportes_ligeros import datos_reporte_emisiones, guardar_reporte_ligero
+from .reduccion_datos import graficar_dispersion
+from .render_graficos import renderizar
+
+
+def _grafico_emisiones_combustible(combustibles, valores):
+    plt.figure(figsize=(10, 6))
+    bars = plt.bar(combustibles, valores, 
+                  color='lightgreen', alpha=0.8, edgecolor='darkgreen')
+    plt.xlabel('Tipo de Combustible')
+    plt.ylabel('Emisiones de CO₂ (kg)')
+    plt.title('Emisiones de CO₂ por Tipo de Combustible')
+    plt.xticks(rotation=45)
+    
+    # Agregar valores en las barras
+    for bar, valor in zip(bars, valores):
+        plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(valores)*0.01, 
+                f'{valor:.1f} kg', ha='center', va='bottom')
+    
+    plt.grid(True, alpha=0.3)
+
+def _grafico_emisiones_eficiencia(eficiencia, emisiones_por_km, max_puntos=None, celdas=None):
+    plt.figure(figsize=(10, 6))
+    graficar_dispersion(plt.gca(), eficiencia, emisiones_por_km, max_puntos=max_puntos, celdas=celdas,
+                        alpha=0.6, color='red', s=50)
+    plt.xlabel('Eficiencia (km/gal)')
+    plt.ylabel('Emisiones por km (kg CO₂/km)')
+    plt.title('Relación entre Eficiencia y Emisiones por Kilómetro')
+    
+    # Línea de tendencia (ajustada con todos los pares válidos, dibujada entre los extremos)
+    validos = np.isfinite(eficiencia) & np.isfinite(emisiones_por_km)
+    if validos.sum() > 1:
+        z = np.polyfit(eficiencia[validos], emisiones_por_km[validos], 1)
+        p = np.poly1d(z)
+        extremos = np.array([eficiencia[validos].min(), eficiencia[validos].max()])
+        plt.plot(extremos, p(extremos), "r--", alpha=0.8)
+    
+    plt.grid(True, alpha=0.3)
+
+def _grafico_top_vehiculos_emisiones(placas, valores):
+    plt.figure(figsize=(12, 8))
+    bars = plt.barh(range(len(placas)), valores, color='orange', alpha=0.8)
+    plt.yticks(range(len(placas)), placas)
+    plt.xlabel('Emisiones de CO₂ (kg)')
+    plt.title('Top 10 Vehículos con Mayores Emisiones de CO₂')
+    plt.gca().invert_yaxis()
+    
+    # Agregar valores
+    for bar, valor in zip(bars, valores):
+        plt.text(bar.get_width() + max(valores)*0.01, 
+                bar.get_y() + bar.get_height()/2, 
+                f'{valor:.1f} kg', va='center')
+    
+    plt.grid(True, alpha=0.3)
+
+def _grafico_distribucion_emisiones(niveles, conteos):
+    plt.figure(figsize=(8, 8))
+    colors = ['#90EE90', '#FFD700', '#FFA500', '#FF6347']  # Verde, amarillo, naranja, rojo
+    wedges, texts, autotexts = plt.pie(conteos, labels=niveles, 
+                                      autopct='%1.1f%%', colors=colors, startangle=90)
+    
+    for autotext in autotexts:
+        autotext.set_color('white')
+        autotext.set_fontweight('bold')
+    
+    plt.title('Distribución de Vehículos por Nivel de Emisiones', fontweight='bold')
 
 class CalculadorEmisiones:
     def __init__(self):
@@ -74,17 +141,34 @@ class CalculadorEmisiones:
             print(f"Error calculando emisiones: {e}")
             return 0
     
+    def calcular_emisiones_vectorizado(self, galones, tipos_combustible):
+        """Calcula las emisiones de CO2 de arreglos de galones y tipos de combustible (mismas reglas que por registro)"""
+        galones = pd.to_numeric(pd.Series(galones), errors='coerce').to_numpy(dtype=np.float64)
+        tipos = pd.Series(tipos_combustible, dtype=object).reset_index(drop=True)
+        
+        # Normalizar una vez por tipo distinto en lugar de una vez por registro
+        codigos, unicos = pd.factorize(tipos, use_na_sentinel=True)
+        factores_unicos = np.array([
+            self.factores_emision.get(self.normalizar_tipo_combustible(t), self.factores_emision['DEFAULT'])
+            for t in unicos
+        ] + [self.factores_emision['DEFAULT']], dtype=np.float64)
+        factores = factores_unicos[np.where(codigos < 0, len(unicos), codigos)]
+        
+        with np.errstate(invalid='ignore'):
+            emisiones = galones * factores * self.factor_combustion_completa * self.factor_correccion_altitud
+            emisiones = np.where(np.isnan(galones) | (galones <= 0), 0.0, emisiones)
+        return np.round(emisiones, 3)
+    
     def calcular_emisiones_dataframe(self, df):
         """Calcula las emisiones para todo el DataFrame"""
         df_emisiones = df.copy()
         
         try:
             # Calcular emisiones por registro
-            df_emisiones['EMISIONES_CO2_KG'] = df_emisiones.apply(
-                lambda row: self.calcular_emisiones_registro(
-                    row.get('CANTIDAD_GALONES', 0),
-                    row.get('TIPO_COMBUSTIBLE', 'DEFAULT')
-                ), axis=1
+            galones = df_emisiones['CANTIDAD_GALONES'] if 'CANTIDAD_GALONES' in df_emisiones.columns else 0
+            tipos = df_emisiones['TIPO_COMBUSTIBLE'] if 'TIPO_COMBUSTIBLE' in df_emisiones.columns else 'DEFAULT'
+            df_emisiones['EMISIONES_CO2_KG'] = self.calcular_emisiones_vectorizado(
+                np.broadcast_to(galones, len(df_emisiones)), np.broadcast_to(tipos, len(df_emisiones))
             )
             
             # Calcular emisiones por kilómetro
@@ -95,22 +179,44 @@ class CalculadorEmisiones:
             )
             
             # Clasificar nivel de emisiones
-            df_emisiones['NIVEL_EMISIONES'] = pd.cut(
-                df_emisiones['EMISIONES_POR_KM'],
-                bins=[0, 0.5, 1.0, 2.0, float('inf')],
-                labels=['Bajo', 'Moderado', 'Alto', 'Muy Alto'],
-                include_lowest=True
-            )
+            df_emisiones['NIVEL_EMISIONES'] = self.clasificar_nivel_emisiones(df_emisiones['EMISIONES_POR_KM'])
             
         except Exception as e:
             print(f"Error calculando emisiones del DataFrame: {e}")
         
         return df_emisiones
     
-    def generar_estadisticas_emisiones(self, df):
-        """Genera estadísticas detalladas de emisiones"""
+    def _emisiones_por_registro(self, df):
+        """Emisiones y emisiones por km de cada registro sin copiar el DataFrame"""
+        galones = df['CANTIDAD_GALONES'] if 'CANTIDAD_GALONES' in df.columns else pd.Series(0, index=df.index)
+        tipos = df['TIPO_COMBUSTIBLE'] if 'TIPO_COMBUSTIBLE' in df.columns else pd.Series('DEFAULT', index=df.index)
+        emisiones = pd.Series(self.calcular_emisiones_vectorizado(galones, tipos), index=df.index)
+        km = df['KM_RECORRIDO']
+        por_km = pd.Series(np.where(km > 0, emisiones / km, 0), index=df.index)
+        return emisiones, por_km
+    
+    def clasificar_nivel_emisiones(self, emisiones_por_km):
+        """Clasifica las emisiones por km en niveles"""
+        return pd.cut(
+            emisiones_por_km,
+            bins=[0, 0.5, 1.0, 2.0, float('inf')],
+            labels=['Bajo', 'Moderado', 'Alto', 'Muy Alto'],
+            include_lowest=True
+        )
+    
+    def generar_estadisticas_emisiones(self, df, cubo=None, filtros=None, df_emisiones=None):
+        """Genera estadísticas detalladas de emisiones.
+        
+        Con un cubo de consumo, los totales y agrupaciones se leen de él (filtros = selección
+        aplicada a df); del detalle solo se calculan máximo, mínimo y distribución por nivel.
+        df_emisiones: resultado de calcular_emisiones_dataframe(df) si ya se calculó.
+        """
         try:
-            df_emisiones = self.calcular_emisiones_dataframe(df)
+            if cubo is not None:
+                return self._estadisticas_desde_cubo(df, cubo, filtros, df_emisiones)
+            
+            if df_emisiones is None:
+                df_emisiones = self.calcular_emisiones_dataframe(df)
             
             estadisticas = {
                 'total_emisiones_kg': df_emisiones['EMISIONES_CO2_KG'].sum(),
@@ -154,115 +260,107 @@ class CalculadorEmisiones:
             print(f"Error generando estadísticas de emisiones: {e}")
             return {}
     
-    def crear_graficos_emisiones(self, df, dependencia=None, mes=None):
-        """Crea gráficos relacionados con emisiones"""
-        graficos = {}
-        df_emisiones = self.calcular_emisiones_dataframe(df)
+    def _estadisticas_desde_cubo(self, df, cubo, filtros, df_emisiones=None):
+        """Estadísticas de emisiones con los agregados del cubo de consumo"""
+        total = cubo.consultar(filtros=filtros, medidas=['EMISIONES_CO2_KG', 'EMISIONES_POR_KM'], agregacion='sum')
+        promedio = cubo.consultar(filtros=filtros, medidas=['EMISIONES_CO2_KG', 'EMISIONES_POR_KM'], agregacion='mean')
+        if df_emisiones is not None:
+            emisiones, por_km = df_emisiones['EMISIONES_CO2_KG'], df_emisiones['EMISIONES_POR_KM']
+        else:
+            emisiones, por_km = self._emisiones_por_registro(df)
+        
+        estadisticas = {
+            'total_emisiones_kg': total['EMISIONES_CO2_KG'],
+            'total_emisiones_toneladas': total['EMISIONES_CO2_KG'] / 1000,
+            'promedio_emisiones_por_viaje': promedio['EMISIONES_CO2_KG'],
+            'promedio_emisiones_por_km': promedio['EMISIONES_POR_KM'],
+            'max_emisiones_registro': emisiones.max(),
+            'min_emisiones_registro': emisiones.min()
+        }
+        
+        estadisticas['por_tipo_combustible'] = cubo.agregar('TIPO_COMBUSTIBLE', filtros, {
+            'EMISIONES_CO2_KG': ['sum', 'mean', 'count'],
+            'CANTIDAD_GALONES': ['sum']
+        }).round(3).to_dict()
         
-        # Crear directorio temporal
-        temp_dir = 'temp_graficos_emisiones'
-        os.makedirs(temp_dir, exist_ok=True)
+        if 'UNIDAD_ORGANICA' in df.columns:
+            estadisticas['por_dependencia'] = cubo.agregar('UNIDAD_ORGANICA', filtros, {
+                'EMISIONES_CO2_KG': ['sum', 'mean'],
+                'CANTIDAD_GALONES': ['sum']
+            }).round(3).to_dict()
         
-        plt.style.use('seaborn-v0_8')
+        if 'PLACA' in df.columns:
+            top_vehiculos_emisiones = cubo.serie('EMISIONES_CO2_KG', 'PLACA', filtros).sort_values(ascending=False).head(10)
+            estadisticas['top_vehiculos_emisiones'] = top_vehiculos_emisiones.to_dict()
+        
+        estadisticas['distribucion_niveles'] = self.clasificar_nivel_emisiones(por_km).value_counts().to_dict()
+        return estadisticas
+    
+    def crear_graficos_emisiones(self, df, dependencia=None, mes=None, perfil=None, contexto=None, limites=None):
+        """Crea gráficos relacionados con emisiones en memoria, dibujados en paralelo
+        (los datos se leen del ContextoEmisiones, que se construye aquí con `limites` si no se indica)"""
+        tareas = {}
         
         try:
+            contexto = contexto or ContextoEmisiones.construir(self, df, limites=limites)
+            df_emisiones = contexto.df_emisiones
+            
             # 1. Gráfico de emisiones por tipo de combustible
-            plt.figure(figsize=(10, 6))
-            emisiones_combustible = df_emisiones.groupby('TIPO_COMBUSTIBLE')['EMISIONES_CO2_KG'].sum()
-            
-            bars = plt.bar(emisiones_combustible.index, emisiones_combustible.values, 
-                          color='lightgreen', alpha=0.8, edgecolor='darkgreen')
-            plt.xlabel('Tipo de Combustible')
-            plt.ylabel('Emisiones de CO₂ (kg)')
-            plt.title('Emisiones de CO₂ por Tipo de Combustible')
-            plt.xticks(rotation=45)
-            
-            # Agregar valores en las barras
-            for bar, valor in zip(bars, emisiones_combustible.values):
-                plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(emisiones_combustible.values)*0.01, 
-                        f'{valor:.1f} kg', ha='center', va='bottom')
-            
-            plt.grid(True, alpha=0.3)
-            grafico_path = os.path.join(temp_dir, 'emisiones_por_combustible.png')
-            plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            graficos['emisiones_combustible'] = grafico_path
+            emisiones_combustible = contexto.emisiones_por_combustible()
+            tareas['emisiones_combustible'] = (_grafico_emisiones_combustible, {
+                'combustibles': emisiones_combustible.index.tolist(),
+                'valores': emisiones_combustible.to_numpy(dtype=float)
+            })
             
             # 2. Gráfico de emisiones vs eficiencia
             if 'EFICIENCIA' in df_emisiones.columns:
-                plt.figure(figsize=(10, 6))
-                plt.scatter(df_emisiones['EFICIENCIA'], df_emisiones['EMISIONES_POR_KM'], 
-                           alpha=0.6, color='red', s=50)
-                plt.xlabel('Eficiencia (km/gal)')
-                plt.ylabel('Emisiones por km (kg CO₂/km)')
-                plt.title('Relación entre Eficiencia y Emisiones por Kilómetro')
-                
-                # Línea de tendencia
-                z = np.polyfit(df_emisiones['EFICIENCIA'].dropna(), 
-                              df_emisiones['EMISIONES_POR_KM'].dropna(), 1)
-                p = np.poly1d(z)
-                plt.plot(df_emisiones['EFICIENCIA'].dropna(), 
-                        p(df_emisiones['EFICIENCIA'].dropna()), "r--", alpha=0.8)
-                
-                plt.grid(True, alpha=0.3)
-                grafico_path = os.path.join(temp_dir, 'emisiones_vs_eficiencia.png')
-                plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-                plt.close()
-                graficos['emisiones_eficiencia'] = grafico_path
+                tareas['emisiones_eficiencia'] = (_grafico_emisiones_eficiencia, {
+                    'eficiencia': df_emisiones['EFICIENCIA'].to_numpy(dtype=float),
+                    'emisiones_por_km': df_emisiones['EMISIONES_POR_KM'].to_numpy(dtype=float),
+                    'max_puntos': contexto.limites.max_puntos_dispersion, 'celdas': contexto.limites.celdas_dispersion
+                })
             
             # 3. Top 10 vehículos con mayores emisiones
-            if 'PLACA' in df_emisiones.columns:
-                plt.figure(figsize=(12, 8))
-                top_vehiculos = df_emisiones.groupby('PLACA')['EMISIONES_CO2_KG'].sum().sort_values(ascending=False).head(10)
-                
-                bars = plt.barh(range(len(top_vehiculos)), top_vehiculos.values, color='orange', alpha=0.8)
-                plt.yticks(range(len(top_vehiculos)), top_vehiculos.index)
-                plt.xlabel('Emisiones de CO₂ (kg)')
-                plt.title('Top 10 Vehículos con Mayores Emisiones de CO₂')
-                plt.gca().invert_yaxis()
-                
-                # Agregar valores
-                for i, (bar, valor) in enumerate(zip(bars, top_vehiculos.values)):
-                    plt.text(bar.get_width() + max(top_vehiculos.values)*0.01, 
-                            bar.get_y() + bar.get_height()/2, 
-                            f'{valor:.1f} kg', va='center')
-                
-                plt.grid(True, alpha=0.3)
-                grafico_path = os.path.join(temp_dir, 'top_vehiculos_emisiones.png')
-                plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-                plt.close()
-                graficos['top_vehiculos_emisiones'] = grafico_path
+            top_vehiculos = contexto.top_vehiculos()
+            if not top_vehiculos.empty:
+                tareas['top_vehiculos_emisiones'] = (_grafico_top_vehiculos_emisiones, {
+                    'placas': top_vehiculos.index.tolist(), 'valores': top_vehiculos.to_numpy(dtype=float)
+                })
             
             # 4. Distribución de niveles de emisiones
-            if 'NIVEL_EMISIONES' in df_emisiones.columns:
-                plt.figure(figsize=(8, 8))
-                distribucion = df_emisiones['NIVEL_EMISIONES'].value_counts()
-                
-                colors = ['#90EE90', '#FFD700', '#FFA500', '#FF6347']  # Verde, amarillo, naranja, rojo
-                wedges, texts, autotexts = plt.pie(distribucion.values, labels=distribucion.index, 
-                                                  autopct='%1.1f%%', colors=colors, startangle=90)
-                
-                for autotext in autotexts:
-                    autotext.set_color('white')
-                    autotext.set_fontweight('bold')
-                
-                plt.title('Distribución de Vehículos por Nivel de Emisiones', fontweight='bold')
-                grafico_path = os.path.join(temp_dir, 'distribucion_niveles_emisiones.png')
-                plt.savefig(grafico_path, dpi=300, bbox_inches='tight')
-                plt.close()
-                graficos['distribucion_emisiones'] = grafico_path
+            distribucion = contexto.distribucion_niveles()
+            if not distribucion.empty:
+                tareas['distribucion_emisiones'] = (_grafico_distribucion_emisiones, {
+                    'niveles': distribucion.index.tolist(), 'conteos': distribucion.to_numpy()
+                })
             
+            return renderizar(tareas, perfil)
         except Exception as e:
             print(f"Error creando gráficos de emisiones: {e}")
-        
-        return graficos
+            return {}
     
-    def generar_reporte_emisiones_pdf(self, df, mes, dependencia):
-        """Genera un reporte PDF específico de emisiones"""
+    def generar_reporte_emisiones(self, df, mes, dependencia, perfil=None, cubo=None, filtros=None, formato='pdf',
+                                  directorio='uploads', limites=None):
+        """Genera el reporte de emisiones en PDF o, con formato 'html'/'json', sin dibujar gráficos en el servidor"""
+        if formato == 'pdf':
+            return self.generar_reporte_emisiones_pdf(df, mes, dependencia, perfil, cubo, filtros, directorio, limites)
         try:
-            df_emisiones = self.calcular_emisiones_dataframe(df)
-            estadisticas = self.generar_estadisticas_emisiones(df)
-            graficos = self.crear_graficos_emisiones(df_emisiones, dependencia, mes)
+            contexto = ContextoEmisiones.construir(self, df, cubo, filtros, limites)
+            return guardar_reporte_ligero(datos_reporte_emisiones(contexto, mes, dependencia), 'reporte_emisiones', formato,
+                                          directorio)
+        except Exception as e:
+            print(f"Error generando reporte de emisiones {formato}: {e}")
+            return None
+    
+    def generar_reporte_emisiones_pdf(self, df, mes, dependencia, perfil=None, cubo=None, filtros=None,
+                                      directorio='uploads', limites=None):
+        """Genera un reporte PDF específico de emisiones (perfil: resolución/formato de los gráficos;
+        con cubo y filtros los totales se leen de los agregados de la partición)"""
+        try:
+            # Emisiones y estadísticas calculadas una vez para gráficos y texto
+            contexto = ContextoEmisiones.construir(self, df, cubo, filtros, limites)
+            estadisticas = contexto.estadisticas
+            graficos = self.crear_graficos_emisiones(df, dependencia, mes, perfil, contexto)
             
             # Crear PDF
             pdf = FPDF()
@@ -297,13 +395,10 @@ class CalculadorEmisiones:
             pdf.cell(0, 10, 'EQUIVALENCIAS AMBIENTALES', 0, 1)
             pdf.set_font('Arial', '', 11)
             
-            total_co2 = estadisticas.get("total_emisiones_kg", 0)
-            arboles_necesarios = total_co2 / 22  # Un árbol absorbe ~22 kg CO2/año
-            km_auto_particular = total_co2 / 0.2  # Auto particular ~0.2 kg CO2/km
-            
-            pdf.cell(0, 6, f'• Árboles necesarios para compensar: {arboles_necesarios:.0f} árboles/año', 0, 1)
-            pdf.cell(0, 6, f'• Equivale a recorrer en auto particular: {km_auto_particular:.0f} km', 0, 1)
-            pdf.cell(0, 6, f'• Impacto ambiental: {"ALTO" if total_co2 > 1000 else "MEDIO" if total_co2 > 500 else "BAJO"}', 0, 1)
+            equivalencias = contexto.equivalencias()
+            pdf.cell(0, 6, f'• Árboles necesarios para compensar: {equivalencias["arboles_necesarios"]:.0f} árboles/año', 0, 1)
+            pdf.cell(0, 6, f'• Equivale a recorrer en auto particular: {equivalencias["km_auto_particular"]:.0f} km', 0, 1)
+            pdf.cell(0, 6, f'• Impacto ambiental: {equivalencias["impacto"]}', 0, 1)
             
             # Insertar gráficos
             if 'emisiones_combustible' in graficos:
@@ -325,43 +420,38 @@ class CalculadorEmisiones:
             pdf.ln(5)
             
             pdf.set_font('Arial', '', 11)
-            recomendaciones = [
-                '• Implementar programa de mantenimiento preventivo para mejorar eficiencia',
-                '• Considerar renovación de vehículos con altas emisiones por kilómetro',
-                '• Optimizar rutas para reducir kilómetros innecesarios',
-                '• Capacitar conductores en técnicas de conducción eco-eficiente',
-                '• Evaluar uso de combustibles alternativos o vehículos híbridos',
-                '• Implementar sistema de monitoreo continuo de emisiones',
-                '• Compensar huella de carbono mediante programas de reforestación'
-            ]
-            
-            for rec in recomendaciones:
-                pdf.cell(0, 6, rec, 0, 1)
+            for rec in contexto.recomendaciones():
+                pdf.cell(0, 6, f'• {rec}', 0, 1)
             
             # Guardar archivo
-            os.makedirs('uploads', exist_ok=True)
+            os.makedirs(directorio, exist_ok=True)
             nombre_archivo = f"reporte_emisiones_{dependencia}_mes{mes}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
             nombre_archivo = nombre_archivo.replace(' ', '_').replace('/', '_')
-            ruta_completa = os.path.join('uploads', nombre_archivo)
+            ruta_completa = os.path.join(directorio, nombre_archivo)
             pdf.output(ruta_completa)
             
-            # Limpiar archivos temporales
-            for grafico_path in graficos.values():
-                if os.path.exists(grafico_path):
-                    os.remove(grafico_path)
-            
-            if os.path.exists(temp_dir):
-                os.rmdir(temp_dir)
-            
             return nombre_archivo
             
         except Exception as e:
             print(f"Error generando reporte de emisiones: {e}")
             return None
     
-    def calcular_huella_carbono_flota(self, df):
+    def calcular_huella_carbono_flota(self, df, cubo=None, filtros=None):
         """Calcula la huella de carbono total de la flota"""
         try:
+            if cubo is not None:
+                total = cubo.consultar(filtros=filtros, medidas=['EMISIONES_CO2_KG'])
+                promedio = cubo.consultar(filtros=filtros, medidas=['EFICIENCIA', 'EMISIONES_POR_KM'], agregacion='mean')
+                return {
+                    'total_co2_kg': total['EMISIONES_CO2_KG'],
+                    'total_co2_toneladas': total['EMISIONES_CO2_KG'] / 1000,
+                    'promedio_mensual_kg': total['EMISIONES_CO2_KG'] / 12,  # Estimado anual
+                    'vehiculos_analizados': len(cubo.consultar('PLACA', filtros, ['EMISIONES_CO2_KG'])),
+                    'eficiencia_promedio_flota': promedio['EFICIENCIA'] if 'EFICIENCIA' in df.columns else 0,
+                    'emisiones_por_km_flota': promedio['EMISIONES_POR_KM'],
+                    'fecha_calculo': datetime.now().isoformat()
+                }
+            
             df_emisiones = self.calcular_emisiones_dataframe(df)
             
             huella_carbono = {
@@ -0,0 +1,185 @@
+"""
+Pronóstico de series de tiempo vectorizado: todas las series de placas o dependencias a la vez
+"""
+import itertools
+import numpy as np
+import pandas as pd
+
+METODOS_PRONOSTICO = ['holt_winters', 'estacional_ingenuo']
+
+# Período estacional de cada frecuencia (semana en datos diarios, año en mensuales)
+FRECUENCIAS = {
+    'diaria': 7,
+    'mensual': 12
+}
+
+# Parámetros de suavizamiento probados; cada serie se queda con el de menor error a un paso
+ALPHAS = (0.1, 0.3, 0.6)
+BETAS = (0.02, 0.1)
+GAMMAS = (0.05, 0.3)
+
+# Amortiguación de la tendencia: evita que horizontes largos se disparen
+PHI = 0.9
+
+# Horizonte máximo de cada frecuencia (días o meses)
+MAX_HORIZONTE = {
+    'diaria': 92,
+    'mensual': 24
+}
+
+
+def periodos_registros(matriz, frecuencia):
+    """Período de cada registro de la matriz (día o mes como datetime64; NaT sin fecha)"""
+    anio = matriz.anio.astype(np.int64)
+    mes = np.nan_to_num(matriz.columna('mes'), nan=1).astype(np.int64)
+    validos = (anio > 0) & ~np.isnan(matriz.columna('mes'))
+    meses = (anio - 1970) * 12 + (mes - 1)
+    if frecuencia == 'mensual':
+        periodos = meses.astype('datetime64[M]')
+    else:
+        dia = np.nan_to_num(matriz.columna('dia_mes'), nan=1).astype(np.int64)
+        periodos = meses.astype('datetime64[M]').astype('datetime64[D]') + (dia - 1)
+    return np.where(validos, periodos, np.datetime64('NaT'))
+
+
+def acumular_series(entidades, periodos, valores, n_entidades):
+    """Matriz densa (entidad x período) con la suma de valores; los períodos sin datos quedan en 0.
+
+    Retorna (series, etiquetas de período). Una sola pasada con bincount sobre el índice plano.
+    """
+    validos = (entidades >= 0) & ~np.isnat(periodos) & ~np.isnan(valores)
+    if not validos.any():
+        return np.zeros((n_entidades, 0)), periodos[:0]
+    inicio, fin = periodos[validos].min(), periodos[validos].max()
+    n_periodos = int((fin - inicio).astype(np.int64)) + 1
+    indice = entidades[validos].astype(np.int64) * n_periodos + (periodos[validos] - inicio).astype(np.int64)
+    series = np.bincount(indice, weights=valores[validos], minlength=n_entidades * n_periodos)
+    return series.reshape(n_entidades, n_periodos), inicio + np.arange(n_periodos)
+
+
+def estacional_ingenuo(series, horizonte, m):
+    """Repite el último ciclo estacional (el último valor si hay menos de un ciclo)"""
+    n_periodos = series.shape[1]
+    if n_periodos >= m:
+        ciclo = series[:, n_periodos - m:]
+        return ciclo[:, np.arange(horizonte) % m]
+    return np.repeat(series[:, -1:], horizonte, axis=1)
+
+
+def holt_winters(series, horizonte, m):
+    """Holt-Winters aditivo con tendencia amortiguada, ajustado a todas las series a la vez.
+
+    Se corre una sola pasada por el tiempo con todas las combinaciones de (alpha, beta,
+    gamma) como una dimensión más del arreglo de estado; cada serie usa la combinación
+    con menor error cuadrático a un paso. Con menos de dos ciclos no hay estacionalidad
+    (gamma = 0) y con menos de un ciclo se usa suavizamiento exponencial simple.
+    Retorna (pronóstico, error absoluto medio a un paso de cada serie).
+    """
+    n_series, n_periodos = series.shape
+    estacional = n_periodos >= 2 * m
+    combinaciones = np.array(list(itertools.product(ALPHAS, BETAS if n_periodos >= m else (0.0,),
+                                                    GAMMAS if estacional else (0.0,))))
+    alpha, beta, gamma = (combinaciones[:, i, None] for i in range(3))
+    k = len(combinaciones)
+
+    # Estado inicial a partir del primer (y segundo) ciclo
+    if estacional:
+        primero, segundo = series[:, :m].mean(axis=1), series[:, m:2 * m].mean(axis=1)
+        nivel = np.broadcast_to(primero, (k, n_series)).copy()
+        tendencia = np.broadcast_to((segundo - primero) / m, (k, n_series)).copy()
+        temporada = np.broadcast_to((series[:, :m] - primero[:, None]).T[:, None, :], (m, k, n_series)).copy()
+    else:
+        nivel = np.broadcast_to(series[:, 0], (k, n_series)).copy()
+        tendencia = np.zeros((k, n_series))
+        temporada = np.zeros((m, k, n_series))
+
+    errores_cuadrados = np.zeros((k, n_series))
+    errores_absolutos = np.zeros((k, n_series))
+    for t in range(n_periodos):
+        y = series[:, t]
+        s = temporada[t % m]
+        error = y - (nivel + PHI * tendencia + s)
+        if t >= m or not estacional:
+            errores_cuadrados += error * error
+            errores_absolutos += np.abs(error)
+        nivel_anterior = nivel
+        nivel = alpha * (y - s) + (1 - alpha) * (nivel + PHI * tendencia)
+        tendencia = beta * (nivel - nivel_anterior) + (1 - beta) * PHI * tendencia
+        temporada[t % m] = gamma * (y - nivel) + (1 - gamma) * s
+
+    # Mejor combinación de cada serie
+    mejor = errores_cuadrados.argmin(axis=0)
+    columnas = np.arange(n_series)
+    nivel, tendencia = nivel[mejor, columnas], tendencia[mejor, columnas]
+    temporada = temporada[:, mejor, columnas]
+    evaluados = max(n_periodos - m, 1) if estacional else n_periodos
+
+    pasos = np.arange(1, horizonte + 1)
+    amortiguacion = np.cumsum(PHI ** pasos)
+    pronostico = (nivel[:, None] + tendencia[:, None] * amortiguacion[None, :]
+                  + temporada[(n_periodos + pasos - 1) % m].T)
+    return pronostico, errores_absolutos[mejor, columnas] / evaluados
+
+
+class MotorPronostico:
+    """Pronósticos por entidad (PLACA o UNIDAD_ORGANICA) sobre los acumulados diarios o mensuales.
+
+    Trabaja sobre la matriz del almacén de características: arma una matriz densa
+    entidad x período con un bincount y ajusta todas las series a la vez con NumPy, sin
+    modelo entrenado. Es la alternativa rápida al RandomForest para horizontes largos o
+    para toda la flota.
+    """
+
+    def pronosticar_series(self, series, horizonte, frecuencia='diaria', metodo='holt_winters'):
+        """Pronóstico (series x horizonte, no negativo) y error a un paso de cada serie"""
+        m = FRECUENCIAS[frecuencia]
+        if series.shape[1] == 0:
+            return np.zeros((series.shape[0], horizonte)), np.full(series.shape[0], np.nan)
+        if metodo == 'estacional_ingenuo':
+            pronostico = estacional_ingenuo(series, horizonte, m)
+            # Error del mismo método un ciclo atrás
+            if series.shape[1] > m:
+                error = np.abs(series[:, m:] - series[:, :-m]).mean(axis=1)
+            else:
+                error = np.full(series.shape[0], np.nan)
+        else:
+            pronostico, error = holt_winters(series, horizonte, m)
+        return np.maximum(pronostico, 0), error
+
+    def pronosticar(self, matriz, entidades, etiquetas, frecuencia='diaria', horizonte=7, metodo='holt_winters'):
+        """Pronóstico de cada entidad con registros en la matriz de características.
+
+        entidades: código de entidad de cada registro (-1 = no incluido); etiquetas: nombre de cada código.
+        Retorna {'periodos', 'entidades': {nombre: {'pronostico', 'total', 'error_medio'}}, 'total', ...}.
+        """
+        if metodo not in METODOS_PRONOSTICO:
+            raise ValueError(f"Método de pronóstico no válido: {metodo}")
+        if frecuencia not in FRECUENCIAS:
+            raise ValueError(f"Frecuencia no válida: {frecuencia}")
+
+        periodos = periodos_registros(matriz, frecuencia)
+        series, etiquetas_periodo = acumular_series(entidades, periodos, np.asarray(matriz.y, dtype=np.float64),
+                                                    len(etiquetas))
+        con_datos = np.flatnonzero(series.any(axis=1)) if series.size else np.array([], dtype=np.int64)
+        pronostico, error = self.pronosticar_series(series[con_datos], horizonte, frecuencia, metodo)
+
+        periodos_futuros = []
+        if len(etiquetas_periodo):
+            siguientes = etiquetas_periodo[-1] + np.arange(1, horizonte + 1)
+            formato = '%Y-%m' if frecuencia == 'mensual' else '%Y-%m-%d'
+            periodos_futuros = pd.to_datetime(siguientes).strftime(formato).tolist()
+
+        return {
+            'metodo': metodo,
+            'frecuencia': frecuencia,
+            'periodos': periodos_futuros,
+            'entidades': {
+                etiquetas[codigo]: {
+                    'pronostico': [round(float(v), 2) for v in pronostico[i]],
+                    'total': round(float(pronostico[i].sum()), 2),
+                    'error_medio': None if np.isnan(error[i]) else round(float(error[i]), 2)
+                }
+                for i, codigo in enumerate(con_datos)
+            },
+            'total': round(float(pronostico.sum()), 2)
+        }
@@ -8,181 +8,531 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, r2_score
-import joblib
-import os
 from datetime import datetime, timedelta
+import os
+import copy
+import time
 import warnings
+from collections import namedtuple
+from .registro_modelos import RegistroModelos
+from .caracteristicas_prediccion import AlmacenCaracteristicas, CATEGORICAS, version_caracteristicas
+from .motor_pronostico import MotorPronostico
+from .arboles_compactos import BosqueRegresionCompacto
 warnings.filterwarnings('ignore')
 
+DIAS_SEMANA_PREDICCION = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+# Registros más recientes de cada vehículo o dependencia que describen su uso actual
+REGISTROS_RECIENTES = 30
+
+# Valores que seleccionan todas las placas o dependencias en el pronóstico por lote
+SELECCION_TODAS = ('todas', 'todos', 'all')
+
+# Horizonte máximo del pronóstico diario por lote
+MAX_DIAS_PRONOSTICO = 31
+
+# Parámetros del RandomForest de predicción (forman parte de la versión del modelo)
+PARAMETROS_MODELO = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'random_state': 42
+}
+
+# Modos de entrenamiento: 'auto' actualiza incrementalmente si los datos solo crecieron
+MODOS_ENTRENAMIENTO = ['auto', 'completo']
+
+# Árboles que agrega cada actualización incremental (entrenados solo con los registros nuevos)
+ESTIMADORES_INCREMENTALES = 20
+
+# Actualizaciones incrementales seguidas antes de forzar un reentrenamiento completo
+ACTUALIZACIONES_ANTES_DE_COMPLETO = 4
+
+# Registros nuevos mínimos para una actualización incremental
+MIN_REGISTROS_INCREMENTALES = 20
+
+# Registros usados para medir la latencia de predicción de cada formato del modelo
+REGISTROS_MEDICION = 1000
+
+class PaqueteModelo(namedtuple('PaqueteModelo', [
+        'modelo', 'scaler', 'metricas', 'version', 'features', 'categorias', 'parametros',
+        'version_datos', 'registros', 'actualizaciones'])):
+    """Todo lo que usa una predicción: estimador, scaler, codificación, métricas y versión.
+
+    Es inmutable y nadie modifica sus partes: entrenar arma un paquete nuevo y lo publica
+    con una sola asignación, así que una predicción en curso termina con el paquete que
+    leyó al comenzar, sin mezclar el scaler de una versión con el modelo de otra.
+    version_datos, registros y actualizaciones describen los datos de entrenamiento para
+    decidir si la siguiente actualización puede ser incremental.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def desde_registro(cls, version, modelo, scaler, metadatos):
+        return cls(
+            modelo=modelo,
+            scaler=scaler,
+            metricas=metadatos.get('metricas', {}),
+            version=version,
+            features=metadatos.get('features'),
+            categorias=metadatos.get('categorias', {}),
+            parametros=metadatos.get('parametros') or dict(PARAMETROS_MODELO),
+            version_datos=metadatos.get('version_datos'),
+            registros=metadatos.get('registros', 0),
+            actualizaciones=metadatos.get('actualizaciones', 0)
+        )
+
 class PrediccionConsumo:
-    def __init__(self):
-        self.modelo = None
-        self.scaler = StandardScaler()
-        self.modelo_entrenado = False
-        self.metricas = {}
+    def __init__(self, registro=None, caracteristicas=None, estimadores_incrementales=ESTIMADORES_INCREMENTALES,
+                 actualizaciones_antes_de_completo=ACTUALIZACIONES_ANTES_DE_COMPLETO):
+        # Paquete del modelo en uso (None = sin entrenar); se reemplaza entero, nunca se modifica
+        self.paquete = None
+        self.estimadores_incrementales = estimadores_incrementales
+        self.actualizaciones_antes_de_completo = actualizaciones_antes_de_completo
+        self.registro = registro or RegistroModelos()
+        # Las matrices de características se guardan junto a las versiones del modelo
+        self.caracteristicas = caracteristicas or AlmacenCaracteristicas(
+            os.path.join(self.registro.directorio, 'caracteristicas'))
+        self.motor_series = MotorPronostico()
+    
+    @property
+    def modelo_entrenado(self):
+        return self.paquete is not None
+    
+    @property
+    def version(self):
+        paquete = self.paquete
+        return paquete.version if paquete is not None else None
+    
+    @property
+    def metricas(self):
+        paquete = self.paquete
+        return paquete.metricas if paquete is not None else {}
+    
+    @property
+    def parametros(self):
+        paquete = self.paquete
+        return paquete.parametros if paquete is not None else dict(PARAMETROS_MODELO)
         
     def preparar_datos_prediccion(self, df):
-        """Prepara los datos para entrenamiento del modelo"""
+        """Matriz de características del dataset (se calcula una vez por versión de los datos)"""
         if df.empty:
-            return None, None
+            return None
             
-        # Crear características temporales
-        df['dia_mes'] = pd.to_datetime(df['FECHA_INGRESO_VALE']).dt.day
-        df['dia_semana'] = pd.to_datetime(df['FECHA_INGRESO_VALE']).dt.dayofweek
-        df['mes'] = pd.to_datetime(df['FECHA_INGRESO_VALE']).dt.month
-        df['trimestre'] = pd.to_datetime(df['FECHA_INGRESO_VALE']).dt.quarter
-        
-        # Variables categóricas numéricas
-        df['tipo_combustible_num'] = pd.Categorical(df['TIPO_COMBUSTIBLE']).codes
-        df['unidad_organica_num'] = pd.Categorical(df['UNIDAD_ORGANICA']).codes
+        matriz = self.caracteristicas.obtener(df)
+        if len(matriz.features) < 5:
+            return None
+        return matriz
+    
+    @staticmethod
+    def _resultado_entrenamiento(paquete, reutilizado):
+        return {
+            'metricas': paquete.metricas,
+            'version': paquete.version,
+            'reutilizado': reutilizado,
+            'modo': paquete.metricas.get('modo', 'completo')
+        }
+    
+    def _usar_version(self, version):
+        """Publica una versión del registro como modelo en uso; retorna None si no se pudo cargar"""
+        cargado = self.registro.cargar(version)
+        if cargado is None:
+            return None
+        self.paquete = PaqueteModelo.desde_registro(version, *cargado)
+        return self.paquete
+    
+    def entrenar_modelo(self, df, modo='auto'):
+        """Entrena el modelo de predicción, o reutiliza la versión registrada para los mismos datos.
+
+        Con modo 'auto', si df es el dataset del modelo actual con registros agregados al
+        final, solo se entrenan árboles nuevos con esos registros (warm start); cada
+        actualizaciones_antes_de_completo actualizaciones, o si cambian las características
+        o aparecen categorías nuevas, se reentrena con todo el historial. modo 'completo'
+        fuerza el reentrenamiento completo.
+        Retorna {'metricas', 'version', 'reutilizado', 'modo'}, o None si no hay datos suficientes.
+        """
+        matriz = self.preparar_datos_prediccion(df)
         
-        # Características del vehículo
-        df['km_promedio'] = df.groupby('PLACA')['KM_RECORRIDO'].transform('mean')
-        df['consumo_historico'] = df.groupby('PLACA')['TOTAL_CONSUMO'].transform('mean')
+        if matriz is None or len(matriz.X) < 50:
+            return None
         
-        # Variables objetivo y predictoras
-        features = [
-            'dia_mes', 'dia_semana', 'mes', 'trimestre',
-            'tipo_combustible_num', 'unidad_organica_num',
-            'KM_RECORRIDO', 'CANTIDAD_GALONES', 'PRECIO',
-            'km_promedio', 'consumo_historico'
-        ]
+        # Todo el entrenamiento parte del paquete publicado al comenzar
+        actual = self.paquete
+        if actual is not None and actual.version_datos == matriz.version and modo != 'completo':
+            return self._resultado_entrenamiento(actual, True)
         
-        # Filtrar solo las columnas que existen
-        features_disponibles = [f for f in features if f in df.columns]
+        # Versión del modelo completo para estos datos, características y parámetros
+        parametros = actual.parametros if actual is not None else dict(PARAMETROS_MODELO)
+        version = self.registro.version(matriz.version, matriz.features, parametros)
+        reutilizado = self._reutilizar(version)
+        if reutilizado is not None:
+            return self._resultado_entrenamiento(reutilizado, True)
         
-        if len(features_disponibles) < 5:
-            return None, None
+        inicio = self._inicio_incremental(df, matriz, actual) if modo == 'auto' else None
+        if inicio is not None:
+            # La versión incremental depende también del modelo del que parte
+            version = self.registro.version(matriz.version, matriz.features, dict(parametros, base=actual.version))
+            reutilizado = self._reutilizar(version)
+            if reutilizado is not None:
+                return self._resultado_entrenamiento(reutilizado, True)
+            
+        try:
+            inicio_entrenamiento = time.perf_counter()
+            if inicio is None:
+                modelo, scaler, metricas = self._entrenar_completo(matriz, parametros)
+            else:
+                modelo, scaler, metricas = self._entrenar_incremental(matriz, inicio, actual)
+            modo_usado = 'completo' if inicio is None else 'incremental'
+            duracion = time.perf_counter() - inicio_entrenamiento
+            
+            # Último tiempo de cada modo, para comparar el costo de ambos
+            anteriores = actual.metricas.get('tiempos_entrenamiento', {}) if actual is not None else {}
+            metricas.update({
+                'modo': modo_usado,
+                'tiempo_entrenamiento': round(duracion, 3),
+                'tiempos_entrenamiento': dict(anteriores, **{modo_usado: round(duracion, 3)}),
+                'arboles': len(modelo.estimators_),
+                'registros_entrenamiento': len(matriz.X) - (inicio or 0)
+            })
+            paquete = self.registrar_modelo(version, matriz, modelo, scaler, metricas, parametros, modo=modo_usado,
+                                            base=actual if inicio is not None else None)
+            
+            return self._resultado_entrenamiento(paquete, False)
             
-        X = df[features_disponibles].fillna(0)
-        y = df['TOTAL_CONSUMO'].fillna(0)
+        except Exception as e:
+            print(f"Error entrenando modelo: {e}")
+            return None
+    
+    def registrar_modelo(self, version, matriz, modelo, scaler, metricas, parametros, modo='completo', base=None):
+        """Guarda un modelo entrenado sobre la matriz en el registro y lo publica como modelo en uso.
+
+        base es el paquete del que parte una actualización incremental (conserva su
+        codificación de categorías). El paquete se arma con lo que quedó en el registro
+        (el bosque compacto cargado con mmap, si el registro lo usa) y reemplaza al anterior
+        recién cuando está completo y guardado.
+        """
+        metadatos = {
+            'metricas': metricas,
+            'features': list(base.features if base is not None else matriz.features),
+            'categorias': base.categorias if base is not None else matriz.categorias,
+            'version_datos': matriz.version,
+            'parametros': dict(parametros),
+            'registros': len(matriz.X),
+            'modo': modo,
+            'base': base.version if base is not None else None,
+            'actualizaciones': base.actualizaciones + 1 if base is not None else 0
+        }
         
-        return X, y
+        # Registrar la versión con sus métricas y las categorías de su codificación
+        metadatos = self.registro.guardar(version, modelo, scaler, metadatos)
+        paquete = self._usar_version(version)
+        if paquete is None:
+            paquete = self.paquete = PaqueteModelo.desde_registro(version, modelo, scaler, metadatos)
+        return paquete
     
-    def entrenar_modelo(self, df):
-        """Entrena el modelo de predicción"""
-        X, y = self.preparar_datos_prediccion(df)
+    def _reutilizar(self, version):
+        """Publica una versión ya registrada; retorna su paquete, o None si no existe o no se pudo cargar"""
+        try:
+            if self.registro.existe(version):
+                paquete = self._usar_version(version)
+                if paquete is not None:
+                    self.registro.marcar_ultima(version)
+                return paquete
+        except Exception as e:
+            print(f"Error cargando modelo registrado {version}: {e}")
+        return None
+    
+    def _inicio_incremental(self, df, matriz, actual):
+        """Primer registro nuevo si df solo agrega registros a los datos del paquete actual; si no, None"""
+        if actual is None or not isinstance(actual.modelo, (RandomForestRegressor, BosqueRegresionCompacto)):
+            return None
+        if actual.actualizaciones >= self.actualizaciones_antes_de_completo:
+            return None
+        if list(matriz.features) != list(actual.features or []):
+            return None
+        if not 0 < actual.registros <= len(df) - MIN_REGISTROS_INCREMENTALES:
+            return None
+        # Las categorías nuevas no tienen código en el modelo actual
+        for columna, categorias in matriz.categorias.items():
+            if not set(categorias) <= set(actual.categorias.get(columna, [])):
+                return None
+        if version_caracteristicas(df.iloc[:actual.registros]) != actual.version_datos:
+            return None
+        return actual.registros
+    
+    def _dividir(self, X, y):
+        return train_test_split(X, y, test_size=0.2, random_state=42)
+    
+    def _evaluar(self, modelo, X_test, y_test):
+        y_pred = modelo.predict(X_test)
+        return {
+            'mae': float(mean_absolute_error(y_test, y_pred)),
+            'r2': float(r2_score(y_test, y_pred)),
+            'precision': float(max(0, min(100, modelo.score(X_test, y_test) * 100)))
+        }
+    
+    def _entrenar_completo(self, matriz, parametros):
+        """RandomForest nuevo sobre todo el historial; retorna (modelo, scaler, métricas)"""
+        X, y = matriz.entrenamiento()
         
-        if X is None or len(X) < 50:
-            return False
-            
+        # Dividir datos
+        X_train, X_test, y_train, y_test = self._dividir(X, y)
+        
+        # Escalar datos
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
+        
+        # Entrenar modelo Random Forest para mejor precisión
+        modelo = RandomForestRegressor(n_jobs=-1, **parametros)
+        modelo.fit(X_train_scaled, y_train)
+        
+        return modelo, scaler, self._evaluar(modelo, X_test_scaled, y_test)
+    
+    def _entrenar_incremental(self, matriz, inicio, actual):
+        """Agrega árboles entrenados con los registros desde `inicio` a una copia del modelo de `actual`.
+
+        Los árboles existentes y el scaler no cambian; las métricas se miden sobre los
+        registros nuevos reservados para evaluación.
+        """
+        X, y = matriz.entrenamiento()
+        X, y = X[inicio:], y[inicio:]
+        for feature in CATEGORICAS:
+            if feature in matriz.features:
+                # Códigos en la codificación con que se entrenó el modelo
+                X[:, matriz.features.index(feature)] = self._codigos_modelo(actual, matriz, feature)[inicio:]
+        X_train, X_test, y_train, y_test = self._dividir(X, y)
+        X_train_scaled = actual.scaler.transform(X_train)
+        X_test_scaled = actual.scaler.transform(X_test)
+        
+        # Copia con su propia lista de árboles: el modelo en uso no se modifica
+        estimador = actual.modelo
+        if not isinstance(estimador, RandomForestRegressor):
+            # El paquete sirve el bosque compacto; los árboles nuevos se agregan al de sklearn
+            estimador = self.registro.cargar_estimador(actual.version)
+        modelo = copy.copy(estimador)
+        modelo.estimators_ = list(estimador.estimators_)
+        modelo.set_params(warm_start=True, n_estimators=len(modelo.estimators_) + self.estimadores_incrementales)
+        modelo.fit(X_train_scaled, y_train)
+        modelo.set_params(warm_start=False)
+        
+        return modelo, actual.scaler, self._evaluar(modelo, X_test_scaled, y_test)
+    
+    def medir_inferencia(self, df, registros=REGISTROS_MEDICION):
+        """Tamaño, tiempo de carga y latencia de predicción de cada formato del modelo en uso"""
+        paquete = self.paquete
+        if paquete is None:
+            return None
         try:
-            # Dividir datos
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            
-            # Escalar datos
-            X_train_scaled = self.scaler.fit_transform(X_train)
-            X_test_scaled = self.scaler.transform(X_test)
-            
-            # Entrenar modelo Random Forest para mejor precisión
-            self.modelo = RandomForestRegressor(
-                n_estimators=100,
-                max_depth=10,
-                random_state=42,
-                n_jobs=-1
-            )
-            
-            self.modelo.fit(X_train_scaled, y_train)
-            
-            # Evaluar modelo
-            y_pred = self.modelo.predict(X_test_scaled)
-            
-            self.metricas = {
-                'mae': mean_absolute_error(y_test, y_pred),
-                'r2': r2_score(y_test, y_pred),
-                'precision': max(0, min(100, self.modelo.score(X_test_scaled, y_test) * 100))
+            matriz = self.caracteristicas.obtener(df)
+            X, _ = matriz.entrenamiento()
+            X = paquete.scaler.transform(X[:registros])
+            return {
+                'version': paquete.version,
+                'formato_en_uso': 'compacto' if isinstance(paquete.modelo, BosqueRegresionCompacto) else 'joblib',
+                'formatos': self.registro.medir_formatos(paquete.version, X)
             }
+        except Exception as e:
+            print(f"Error midiendo la inferencia del modelo: {e}")
+            return None
+    
+    def cargar_modelo(self):
+        """Carga la versión más reciente del registro de modelos"""
+        try:
+            version = self.registro.ultima_version()
+            if version is not None:
+                return self._usar_version(version) is not None
+        except Exception as e:
+            print(f"Error cargando modelo de predicción: {e}")
+        return False
+    
+    @staticmethod
+    def _codigos_modelo(paquete, matriz, feature):
+        """Códigos de la matriz traducidos a las categorías con que se entrenó el modelo del paquete"""
+        codigos = matriz.columna(feature)
+        columna = CATEGORICAS[feature]
+        propias = matriz.categorias.get(columna, [])
+        del_modelo = {c: i for i, c in enumerate(paquete.categorias.get(columna, propias))}
+        traduccion = np.array([del_modelo.get(c, -1) for c in propias] + [-1], dtype=np.float32)
+        return traduccion[np.where(codigos >= 0, codigos, len(propias)).astype(np.int64)]
+    
+    def _caracteristicas_entidades(self, paquete, matriz, entidades, etiquetas):
+        """Características de predicción de cada entidad (una fila por entidad).
+
+        entidades es el código de entidad de cada registro de la matriz (-1 = fuera del
+        pronóstico) y etiquetas el nombre de cada código. Como en el pronóstico individual,
+        se usan los últimos REGISTROS_RECIENTES registros de cada una.
+        """
+        columnas = {'ENTIDAD': entidades, 'TOTAL_CONSUMO': matriz.y}
+        for feature in ['KM_RECORRIDO', 'CANTIDAD_GALONES', 'PRECIO']:
+            columnas[feature] = matriz.columna(feature) if feature in matriz.features else np.nan
+        for feature in CATEGORICAS:
+            if feature in matriz.features:
+                columnas[feature] = self._codigos_modelo(paquete, matriz, feature)
+        datos = pd.DataFrame(columnas)
+        datos = datos[datos['ENTIDAD'] >= 0]
+        recientes = datos.groupby('ENTIDAD', sort=False).tail(REGISTROS_RECIENTES)
+        grupos = recientes.groupby('ENTIDAD', sort=False)
+        
+        caracteristicas = grupos[['KM_RECORRIDO', 'CANTIDAD_GALONES', 'PRECIO']].mean()
+        caracteristicas['km_promedio'] = caracteristicas['KM_RECORRIDO']
+        caracteristicas['consumo_historico'] = grupos['TOTAL_CONSUMO'].mean()
+        for c in CATEGORICAS:
+            if c not in recientes.columns:
+                continue
+            # Código más frecuente de cada entidad (el menor en empate, como Series.mode)
+            conteos = recientes.groupby(['ENTIDAD', c], sort=True).size().reset_index(name='n')
+            conteos = conteos.sort_values(['ENTIDAD', 'n', c], ascending=[True, False, True])
+            caracteristicas[c] = conteos.drop_duplicates('ENTIDAD').set_index('ENTIDAD')[c]
+        caracteristicas.index = [etiquetas[codigo] for codigo in caracteristicas.index]
+        return caracteristicas
+    
+    @staticmethod
+    def _pronostico_diario(paquete, caracteristicas, dias, fecha_inicio=None):
+        """Consumo predicho de cada (entidad, día) con una sola llamada a transform y a predict del paquete"""
+        fechas = pd.date_range(pd.Timestamp(fecha_inicio or datetime.now()), periods=dias, freq='D')
+        n_entidades = len(caracteristicas)
+        
+        # Producto entidad x día: las características de la entidad se repiten por cada día
+        matriz = caracteristicas.loc[caracteristicas.index.repeat(dias)].reset_index(drop=True)
+        matriz['dia_mes'] = np.tile(fechas.day, n_entidades)
+        matriz['dia_semana'] = np.tile(fechas.dayofweek, n_entidades)
+        matriz['mes'] = np.tile(fechas.month, n_entidades)
+        matriz['trimestre'] = np.tile(fechas.quarter, n_entidades)
+        
+        features = paquete.features or list(getattr(paquete.scaler, 'feature_names_in_', matriz.columns))
+        X = matriz.reindex(columns=features).fillna(0).to_numpy(dtype=np.float32)
+        consumo = np.maximum(0, paquete.modelo.predict(paquete.scaler.transform(X)))
+        
+        return pd.DataFrame({
+            'ENTIDAD': np.repeat(caracteristicas.index.to_numpy(), dias),
+            'fecha': np.tile(fechas.strftime('%Y-%m-%d'), n_entidades),
+            'dia_semana': np.tile([DIAS_SEMANA_PREDICCION[d] for d in fechas.dayofweek], n_entidades),
+            'consumo_predicho': consumo
+        })
+    
+    @staticmethod
+    def _seleccion(valores, codigos_por_valor, categorias):
+        """Códigos de las entidades a pronosticar: una lista, un valor o 'todas'"""
+        if valores is None or not categorias:
+            return None
+        if isinstance(valores, str) and valores.lower() in SELECCION_TODAS:
+            return list(range(len(categorias)))
+        return codigos_por_valor(valores if isinstance(valores, (list, tuple, set)) else [valores])
+    
+    def _entidades(self, matriz, columna):
+        """(código de entidad por registro, nombres de las entidades) para PLACA o UNIDAD_ORGANICA"""
+        if columna == 'PLACA':
+            return matriz.placa, matriz.placas
+        if 'unidad_organica_num' not in matriz.features:
+            return None, []
+        return matriz.columna('unidad_organica_num').astype(np.int32), matriz.categorias.get(columna, [])
+    
+    def predecir_consumo_lote(self, df, placas=None, dependencias=None, dias=7, fecha_inicio=None):
+        """Predice el consumo diario de varias placas y/o dependencias en una sola pasada.
+
+        placas y dependencias aceptan una lista, un valor o 'todas'. Se arma una matriz con
+        una fila por (entidad, día) y se llama una vez a predict por tipo de entidad.
+        Retorna {'placas': {placa: [días]}, 'dependencias': {dependencia: [días]}, ...}.
+        """
+        # Todo el pronóstico usa el paquete publicado al comenzar
+        paquete = self.paquete
+        if paquete is None:
+            return None
             
-            self.modelo_entrenado = True
-            
-            # Guardar modelo
-            os.makedirs('models', exist_ok=True)
-            joblib.dump(self.modelo, 'models/modelo_prediccion.pkl')
-            joblib.dump(self.scaler, 'models/scaler_prediccion.pkl')
+        try:
+            matriz = self.caracteristicas.obtener(df)
+            resultado = {}
+            for clave, columna, valores in [('placas', 'PLACA', placas), ('dependencias', 'UNIDAD_ORGANICA', dependencias)]:
+                codigos, etiquetas = self._entidades(matriz, columna)
+                seleccion = self._seleccion(valores, lambda v: matriz.codigos(columna, v), etiquetas)
+                if seleccion is None:
+                    continue
+                entidades = np.where(np.isin(codigos, seleccion), codigos, -1)
+                if not (entidades >= 0).any():
+                    resultado[clave] = {}
+                    continue
+                caracteristicas = self._caracteristicas_entidades(paquete, matriz, entidades, etiquetas)
+                diario = self._pronostico_diario(paquete, caracteristicas, dias, fecha_inicio)
+                resultado[clave] = {
+                    entidad: grupo.drop(columns='ENTIDAD').to_dict('records')
+                    for entidad, grupo in diario.groupby('ENTIDAD', sort=False)
+                }
+                resultado[f'total_{clave}'] = float(diario['consumo_predicho'].sum())
             
-            return True
+            resultado['dias'] = dias
+            return resultado
             
         except Exception as e:
-            print(f"Error entrenando modelo: {e}")
-            return False
+            print(f"Error en predicción por lote: {e}")
+            return None
     
-    def cargar_modelo(self):
-        """Carga un modelo previamente entrenado"""
+    def predecir_series(self, df, placas=None, dependencias=None, frecuencia='diaria', horizonte=7,
+                        metodo='holt_winters'):
+        """Pronóstico por series de tiempo de placas y/o dependencias, sin modelo entrenado.
+
+        Ajusta Holt-Winters (o el estacional ingenuo) a los acumulados diarios o mensuales de
+        todas las entidades seleccionadas a la vez. Misma selección que predecir_consumo_lote.
+        """
         try:
-            if os.path.exists('models/modelo_prediccion.pkl'):
-                self.modelo = joblib.load('models/modelo_prediccion.pkl')
-                self.scaler = joblib.load('models/scaler_prediccion.pkl')
-                self.modelo_entrenado = True
-                return True
-        except:
-            pass
-        return False
+            matriz = self.caracteristicas.obtener(df)
+            if 'mes' not in matriz.features or 'dia_mes' not in matriz.features:
+                return None
+            resultado = {}
+            for clave, columna, valores in [('placas', 'PLACA', placas), ('dependencias', 'UNIDAD_ORGANICA', dependencias)]:
+                codigos, etiquetas = self._entidades(matriz, columna)
+                seleccion = self._seleccion(valores, lambda v: matriz.codigos(columna, v), etiquetas)
+                if seleccion is None:
+                    continue
+                entidades = np.where(np.isin(codigos, seleccion), codigos, -1)
+                resultado[clave] = self.motor_series.pronosticar(matriz, entidades, etiquetas, frecuencia,
+                                                                 horizonte, metodo)
+            return resultado
+            
+        except Exception as e:
+            print(f"Error en pronóstico por series: {e}")
+            return None
     
     def predecir_consumo_semanal(self, df, placa=None, dependencia=None):
         """Predice el consumo para la próxima semana"""
-        if not self.modelo_entrenado:
+        paquete = self.paquete
+        if paquete is None:
             return None
             
         try:
             # Filtrar datos si se especifica placa o dependencia
-            df_filtrado = df.copy()
-            if placa:
-                df_filtrado = df_filtrado[df_filtrado['PLACA'] == placa]
-            if dependencia:
-                df_filtrado = df_filtrado[df_filtrado['UNIDAD_ORGANICA'] == dependencia]
+            matriz = self.caracteristicas.obtener(df)
+            seleccion = np.ones(len(matriz.X), dtype=bool)
+            for columna, valor in [('PLACA', placa), ('UNIDAD_ORGANICA', dependencia)]:
+                if valor:
+                    codigos, _ = self._entidades(matriz, columna)
+                    seleccion &= np.isin(codigos, matriz.codigos(columna, [valor])) if codigos is not None else False
                 
-            if df_filtrado.empty:
+            if not seleccion.any():
                 return None
                 
-            # Obtener datos promedio de los últimos registros
-            datos_recientes = df_filtrado.tail(30)
-            
-            predicciones = []
-            fecha_inicio = datetime.now()
-            
-            for i in range(7):  # 7 días
-                fecha_pred = fecha_inicio + timedelta(days=i)
-                
-                # Crear características para predicción
-                features_pred = {
-                    'dia_mes': fecha_pred.day,
-                    'dia_semana': fecha_pred.weekday(),
-                    'mes': fecha_pred.month,
-                    'trimestre': (fecha_pred.month - 1) // 3 + 1,
-                    'tipo_combustible_num': datos_recientes['TIPO_COMBUSTIBLE'].mode().iloc[0] if not datos_recientes.empty else 0,
-                    'unidad_organica_num': datos_recientes['UNIDAD_ORGANICA'].mode().iloc[0] if not datos_recientes.empty else 0,
-                    'KM_RECORRIDO': datos_recientes['KM_RECORRIDO'].mean(),
-                    'CANTIDAD_GALONES': datos_recientes['CANTIDAD_GALONES'].mean(),
-                    'PRECIO': datos_recientes['PRECIO'].mean(),
-                    'km_promedio': datos_recientes['KM_RECORRIDO'].mean(),
-                    'consumo_historico': datos_recientes['TOTAL_CONSUMO'].mean()
-                }
-                
-                # Convertir a DataFrame
-                X_pred = pd.DataFrame([features_pred])
-                
-                # Predecir
-                X_pred_scaled = self.scaler.transform(X_pred.fillna(0))
-                consumo_pred = self.modelo.predict(X_pred_scaled)[0]
-                
-                predicciones.append({
-                    'fecha': fecha_pred.strftime('%Y-%m-%d'),
-                    'dia_semana': ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'][fecha_pred.weekday()],
-                    'consumo_predicho': max(0, consumo_pred)
-                })
-            
-            return predicciones
+            # La selección completa es una sola entidad del pronóstico por lote
+            caracteristicas = self._caracteristicas_entidades(paquete, matriz, np.where(seleccion, 0, -1), ['seleccion'])
+            diario = self._pronostico_diario(paquete, caracteristicas, 7)
+            return diario.drop(columns='ENTIDAD').to_dict('records')
             
         except Exception as e:
             print(f"Error en predicción semanal: {e}")
             return None
     
-    def predecir_consumo_mensual(self, df, dependencia=None):
+    def predecir_consumo_mensual(self, df, dependencia=None, cubo=None):
         """Predice el consumo para el próximo mes"""
         if not self.modelo_entrenado:
             return None
             
         try:
+            if cubo is not None:
+                # Consumo por año y mes leído del cubo de agregados
+                consumo_mensual = cubo.consultar(
+                    ['ANIO', 'MES'], {'UNIDAD_ORGANICA': dependencia},
+                    ['TOTAL_CONSUMO', 'KM_RECORRIDO', 'CANTIDAD_GALONES']
+                ).reset_index()
+                return self._prediccion_mensual(consumo_mensual)
+            
             df_filtrado = df.copy()
             if dependencia:
                 df_filtrado = df_filtrado[df_filtrado['UNIDAD_ORGANICA'] == dependencia]
@@ -198,48 +548,59 @@ class PrediccionConsumo:
                 'CANTIDAD_GALONES': 'sum'
             }).reset_index()
             
-            if len(consumo_mensual) < 3:
-                return None
-                
-            # Tendencia simple
-            consumo_promedio = consumo_mensual['TOTAL_CONSUMO'].mean()
-            tendencia = consumo_mensual['TOTAL_CONSUMO'].pct_change().mean()
-            
-            # Predicción para próximo mes
-            proximo_mes = datetime.now().replace(day=1) + timedelta(days=32)
-            proximo_mes = proximo_mes.replace(day=1)
-            
-            consumo_predicho = consumo_promedio * (1 + tendencia)
-            
-            return {
-                'mes': proximo_mes.strftime('%Y-%m'),
-                'consumo_predicho': max(0, consumo_predicho),
-                'consumo_promedio_historico': consumo_promedio,
-                'tendencia': tendencia * 100,  # En porcentaje
-                'confianza': min(100, self.metricas.get('precision', 70))
-            }
+            return self._prediccion_mensual(consumo_mensual)
             
         except Exception as e:
             print(f"Error en predicción mensual: {e}")
             return None
     
-    def predecir_consumo_anual(self, df, dependencia=None):
+    def _prediccion_mensual(self, consumo_mensual):
+        """Proyecta el próximo mes a partir del consumo mensual histórico ordenado"""
+        if len(consumo_mensual) < 3:
+            return None
+            
+        # Tendencia simple
+        consumo_promedio = consumo_mensual['TOTAL_CONSUMO'].mean()
+        tendencia = consumo_mensual['TOTAL_CONSUMO'].pct_change().mean()
+        
+        # Predicción para próximo mes
+        proximo_mes = datetime.now().replace(day=1) + timedelta(days=32)
+        proximo_mes = proximo_mes.replace(day=1)
+        
+        consumo_predicho = consumo_promedio * (1 + tendencia)
+        
+        return {
+            'mes': proximo_mes.strftime('%Y-%m'),
+            'consumo_predicho': max(0, consumo_predicho),
+            'consumo_promedio_historico': consumo_promedio,
+            'tendencia': tendencia * 100,  # En porcentaje
+            'confianza': min(100, self.metricas.get('precision', 70))
+        }
+    
+    def predecir_consumo_anual(self, df, dependencia=None, cubo=None):
         """Predice el consumo para el próximo año"""
         if not self.modelo_entrenado:
             return None
             
         try:
-            df_filtrado = df.copy()
-            if dependencia:
-                df_filtrado = df_filtrado[df_filtrado['UNIDAD_ORGANICA'] == dependencia]
+            if cubo is not None:
+                # Consumo por mes leído del cubo de agregados
+                consumo_mensual = cubo.serie('TOTAL_CONSUMO', 'MES', {'UNIDAD_ORGANICA': dependencia})
+                consumo_mensual.index = consumo_mensual.index.astype(int)
+                if consumo_mensual.empty:
+                    return None
+            else:
+                df_filtrado = df.copy()
+                if dependencia:
+                    df_filtrado = df_filtrado[df_filtrado['UNIDAD_ORGANICA'] == dependencia]
+                    
+                if df_filtrado.empty:
+                    return None
+                    
+                df_filtrado['fecha'] = pd.to_datetime(df_filtrado['FECHA_INGRESO_VALE'])
                 
-            if df_filtrado.empty:
-                return None
-                
-            df_filtrado['fecha'] = pd.to_datetime(df_filtrado['FECHA_INGRESO_VALE'])
-            
-            # Consumo por mes
-            consumo_mensual = df_filtrado.groupby(df_filtrado['fecha'].dt.month)['TOTAL_CONSUMO'].sum()
+                # Consumo por mes
+                consumo_mensual = df_filtrado.groupby(df_filtrado['fecha'].dt.month)['TOTAL_CONSUMO'].sum()
             
             # Predicción simple basada en patrones estacionales
             consumo_anual_predicho = consumo_mensual.sum() * 12 / len(consumo_mensual)
@@ -267,20 +628,45 @@ class PrediccionConsumo:
             print(f"Error en predicción anual: {e}")
             return None
     
+    @staticmethod
+    def _indice_entero(serie):
+        """Índices de mes/día como enteros, igual que los groupby por componentes de fecha"""
+        serie.index = serie.index.astype(int)
+        return serie
+    
     def obtener_metricas(self):
         """Retorna las métricas del modelo"""
         return self.metricas
     
-    def analizar_patrones(self, df):
+    def analizar_patrones(self, df, cubo=None):
         """Analiza patrones de consumo"""
         try:
-            df['fecha'] = pd.to_datetime(df['FECHA_INGRESO_VALE'])
+            if cubo is not None:
+                # Mismos agregados leídos del cubo (media = suma / conteo de cada celda)
+                return {
+                    'consumo_por_dia_semana': self._indice_entero(cubo.serie('TOTAL_CONSUMO', 'DIA_SEMANA', agregacion='mean')).to_dict(),
+                    'consumo_por_mes': self._indice_entero(cubo.serie('TOTAL_CONSUMO', 'MES', agregacion='mean')).to_dict(),
+                    'eficiencia_por_dependencia': cubo.serie('EFICIENCIA', 'UNIDAD_ORGANICA', agregacion='mean').to_dict(),
+                    'vehiculos_mayor_consumo': cubo.serie('TOTAL_CONSUMO', 'PLACA').sort_values(ascending=False).head(10).to_dict()
+                }
+            
+            # Sin cubo, los mismos agregados salen de la matriz de características (sin tocar df)
+            matriz = self.caracteristicas.obtener(df)
+            consumo = pd.Series(matriz.y)
+            placas = pd.Categorical.from_codes(matriz.placa, matriz.placas) if matriz.placas else None
+            dependencias = (pd.Categorical.from_codes(matriz.columna('unidad_organica_num').astype(np.int32),
+                                                      matriz.categorias['UNIDAD_ORGANICA'])
+                            if 'unidad_organica_num' in matriz.features else None)
             
             patrones = {
-                'consumo_por_dia_semana': df.groupby(df['fecha'].dt.dayofweek)['TOTAL_CONSUMO'].mean().to_dict(),
-                'consumo_por_mes': df.groupby(df['fecha'].dt.month)['TOTAL_CONSUMO'].mean().to_dict(),
-                'eficiencia_por_dependencia': df.groupby('UNIDAD_ORGANICA')['EFICIENCIA'].mean().to_dict(),
-                'vehiculos_mayor_consumo': df.groupby('PLACA')['TOTAL_CONSUMO'].sum().sort_values(ascending=False).head(10).to_dict()
+                'consumo_por_dia_semana': self._indice_entero(consumo.groupby(matriz.columna('dia_semana')).mean()).to_dict(),
+                'consumo_por_mes': self._indice_entero(consumo.groupby(matriz.columna('mes')).mean()).to_dict(),
+                'eficiencia_por_dependencia': (pd.Series(matriz.eficiencia, dtype=np.float64)
+                                               .groupby(dependencias, observed=True).mean().to_dict()
+                                               if dependencias is not None else {}),
+                'vehiculos_mayor_consumo': (consumo.groupby(placas, observed=True).sum()
+                                            .sort_values(ascending=False).head(10).to_dict()
+                                            if placas is not None else {})
             }
             
             return patrones
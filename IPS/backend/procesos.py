@@ -0,0 +1,43 @@
+"""
+Política de creación de procesos de los pools del servidor
+
+Los pools de gráficos, de anomalías en lote y de ajuste de hiperparámetros se crean desde
+hilos del servidor; con 'fork' los procesos heredarían locks tomados por otros hilos. Todos
+usan 'forkserver': cada proceso se bifurca de un servidor de un solo hilo que ya importó
+los módulos de trabajo (PRECARGA_PROCESOS). Donde no existe (Windows) se usa 'spawn'.
+
+En ambos métodos multiprocessing vuelve a importar el script de inicio como '__mp_main__'
+en cada proceso, por eso app.py y run.py solo inician sus servicios en el proceso principal.
+Este módulo no debe tener efectos al importarse.
+"""
+import threading
+import multiprocessing
+
+# Módulos con las funciones que ejecutan los procesos de los pools
+PRECARGA_PROCESOS = [f'{__package__}.{modulo}' for modulo in ('render_graficos', 'anomalias_lote',
+                                                              'ajuste_prediccion')]
+
+_contexto = None
+_lock = threading.Lock()
+
+
+def contexto_procesos():
+    """Contexto de multiprocessing común a todos los pools de procesos"""
+    global _contexto
+    with _lock:
+        if _contexto is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                _contexto = multiprocessing.get_context('forkserver')
+                _contexto.set_forkserver_preload(PRECARGA_PROCESOS)
+            else:
+                _contexto = multiprocessing.get_context('spawn')
+        return _contexto
+
+
+def es_proceso_principal():
+    """False dentro de los procesos de un pool, también mientras importan el script de inicio.
+
+    multiprocessing asigna el nombre del proceso antes de importar '__mp_main__', mientras
+    que parent_process() recién queda disponible después.
+    """
+    return multiprocessing.current_process().name == 'MainProcess'
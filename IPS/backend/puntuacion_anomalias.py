@@ -0,0 +1,275 @@
+"""
+Puntuación de anomalías de vales individuales contra modelos de referencia por dependencia
+"""
+import os
+import re
+import time
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from .analisis_combustible import FEATURES_ANOMALIAS, ajustar_modelo_anomalias, clasificar_nivel_riesgo
+from .arboles_compactos import BosqueAislamientoCompacto
+
+# Con pocos registros el recorrido vectorizado es más rápido; con muchos, el de sklearn
+MAX_REGISTROS_COMPACTO = 512
+
+
+class ModeloReferenciaAnomalias:
+    """Preprocesador + IsolationForest ajustados sobre una partición de referencia"""
+
+    def __init__(self, dependencia, mes, preprocesador, iso_forest, registros):
+        self.dependencia = dependencia
+        self.mes = mes
+        self.preprocesador = preprocesador
+        self.iso_forest = iso_forest
+        self.registros = registros
+        self.fecha_entrenamiento = datetime.now().isoformat()
+        self._preparar_inferencia()
+
+    def _preparar_inferencia(self):
+        """Extrae del preprocesador los parámetros para transformar con NumPy puro"""
+        self.columnas_numericas = []
+        self.columnas_categoricas = []
+        self.media = np.zeros(0)
+        self.escala = np.ones(0)
+        self.categorias = []
+        for nombre, transformador, columnas in self.preprocesador.transformers_:
+            if nombre == 'num' and len(columnas):
+                self.columnas_numericas = list(columnas)
+                self.media = np.asarray(transformador.mean_, dtype=np.float64)
+                self.escala = np.asarray(transformador.scale_, dtype=np.float64)
+            elif nombre == 'cat' and len(columnas):
+                self.columnas_categoricas = list(columnas)
+                self.categorias = [list(c) for c in transformador.categories_]
+        self.bosque_compacto = BosqueAislamientoCompacto(self.iso_forest)
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        estado.pop('bosque_compacto', None)
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self.bosque_compacto = BosqueAislamientoCompacto(self.iso_forest)
+
+    def transformar(self, columnas):
+        """Equivalente a preprocesador.transform sobre un dict columna -> arreglo"""
+        bloques = []
+        if self.columnas_numericas:
+            numericos = np.column_stack([np.asarray(columnas[c], dtype=np.float64) for c in self.columnas_numericas])
+            bloques.append((numericos - self.media) / self.escala)
+        for columna, categorias in zip(self.columnas_categoricas, self.categorias):
+            valores = np.asarray(columnas[columna], dtype=object)
+            bloques.append(np.column_stack([valores == c for c in categorias]).astype(np.float64))
+        return np.hstack(bloques)
+
+    def puntuar(self, columnas):
+        """Retorna (ANOMALIA, SCORE_ANOMALIA) para las columnas dadas"""
+        X = self.transformar(columnas)
+        if len(X) <= MAX_REGISTROS_COMPACTO:
+            decision = self.bosque_compacto.decision_function(X)
+        else:
+            decision = self.iso_forest.decision_function(X)
+        return (decision < 0).astype(int), -decision
+
+    def resumen(self):
+        return {
+            'dependencia': self.dependencia,
+            'mes': self.mes,
+            'registros_entrenamiento': self.registros,
+            'fecha_entrenamiento': self.fecha_entrenamiento,
+            'features': self.columnas_numericas + self.columnas_categoricas
+        }
+
+
+def _a_fecha(valor):
+    """Convierte una fecha de vale (dd/mm/aaaa, ISO o serial de Excel) a Timestamp"""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return pd.Timestamp('1899-12-30') + pd.Timedelta(days=float(valor))
+    if isinstance(valor, str) and re.match(r'^\d{1,2}/\d{1,2}/\d{4}', valor):
+        return pd.to_datetime(valor, format='%d/%m/%Y', errors='coerce')
+    return pd.to_datetime(valor, errors='coerce')
+
+
+def caracteristicas_desde_vales(vales):
+    """Deriva las características del modelo para vales en JSON, con las mismas reglas que procesar_datos"""
+    def numerico(clave):
+        valores = []
+        for vale in vales:
+            valor = vale.get(clave)
+            try:
+                valores.append(float(str(valor).replace(',', '.')) if valor is not None else np.nan)
+            except ValueError:
+                valores.append(np.nan)
+        return np.asarray(valores, dtype=np.float64)
+
+    km = numerico('KM_RECORRIDO')
+    galones = numerico('CANTIDAD_GALONES')
+    precio = numerico('PRECIO')
+    total = numerico('TOTAL_CONSUMO')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eficiencia = np.where(galones > 0, km / galones, np.nan)
+        costo_km = np.where(km > 0, total / km, np.nan)
+    eficiencia[~np.isfinite(eficiencia) | (eficiencia > 100)] = np.nan
+    costo_km[~np.isfinite(costo_km) | (costo_km > 100)] = np.nan
+
+    dia_semana = np.array([
+        _a_fecha(v.get('FECHA_INGRESO_VALE')).dayofweek if v.get('FECHA_INGRESO_VALE') is not None else np.nan
+        for v in vales
+    ], dtype=np.float64)
+
+    return {
+        'TIPO_COMBUSTIBLE': np.array([v.get('TIPO_COMBUSTIBLE') for v in vales], dtype=object),
+        'KM_RECORRIDO': km,
+        'CANTIDAD_GALONES': galones,
+        'PRECIO': precio,
+        'TOTAL_CONSUMO': total,
+        'EFICIENCIA': eficiencia,
+        'COSTO_POR_KM': costo_km,
+        'DIA_SEMANA': dia_semana
+    }
+
+
+class PuntuadorAnomalias:
+    def __init__(self, directorio='models/anomalias'):
+        self.directorio = directorio
+        # dependencia -> modelo; se reemplaza el diccionario completo en cada cambio, así que
+        # las puntuaciones lo leen sin bloqueo y nunca ven un modelo a medio publicar
+        self.modelos = {}
+        self._lock = threading.Lock()
+
+    def _publicar(self, modelos):
+        """Publica modelos nuevos o reemplazados con una sola asignación del diccionario"""
+        with self._lock:
+            self.modelos = {**self.modelos, **modelos}
+
+    def _ruta_modelo(self, dependencia):
+        nombre = re.sub(r'[^a-zA-Z0-9_.-]', '_', str(dependencia))
+        return os.path.join(self.directorio, f'referencia_{nombre}.joblib')
+
+    def entrenar_referencia(self, df, dependencia, mes=None):
+        """Ajusta y guarda el modelo de referencia de una dependencia (por defecto, su último mes)"""
+        try:
+            df_dep = df[df['UNIDAD_ORGANICA'] == dependencia]
+            if mes is None and 'MES' in df_dep.columns and not df_dep['MES'].dropna().empty:
+                mes = int(df_dep['MES'].dropna().max())
+            if mes is not None:
+                mes = int(mes)
+                df_dep = df_dep[df_dep['MES'] == mes]
+
+            features = [f for f in FEATURES_ANOMALIAS if f in df_dep.columns]
+            df_model = df_dep[features].dropna()
+            if len(df_model) < 10:
+                return None
+
+            preprocesador, iso_forest, _ = ajustar_modelo_anomalias(df_model)
+            modelo = ModeloReferenciaAnomalias(dependencia, mes, preprocesador, iso_forest, len(df_model))
+
+            os.makedirs(self.directorio, exist_ok=True)
+            joblib.dump(modelo, self._ruta_modelo(dependencia))
+
+            self._publicar({dependencia: modelo})
+            return modelo.resumen()
+
+        except Exception as e:
+            print(f"Error entrenando modelo de referencia: {e}")
+            return None
+
+    def entrenar_todas(self, df, mes=None):
+        """Ajusta modelos de referencia para todas las dependencias del dataset"""
+        resultados = {}
+        for dependencia in sorted(df['UNIDAD_ORGANICA'].dropna().unique().tolist()):
+            resumen = self.entrenar_referencia(df, dependencia, mes)
+            if resumen is not None:
+                resultados[dependencia] = resumen
+        return resultados
+
+    def cargar_modelos(self):
+        """Carga en memoria los modelos de referencia guardados"""
+        if not os.path.isdir(self.directorio):
+            return 0
+        cargados = {}
+        for archivo in os.listdir(self.directorio):
+            if not archivo.startswith('referencia_') or not archivo.endswith('.joblib'):
+                continue
+            try:
+                modelo = joblib.load(os.path.join(self.directorio, archivo))
+                cargados[modelo.dependencia] = modelo
+            except Exception as e:
+                print(f"Error cargando modelo {archivo}: {e}")
+        self._publicar(cargados)
+        return len(cargados)
+
+    def obtener_modelo(self, dependencia):
+        return self.modelos.get(dependencia)
+
+    def listar_modelos(self):
+        return [modelo.resumen() for modelo in self.modelos.values()]
+
+    def _resultado(self, columnas, modelo):
+        """Puntúa columnas ya derivadas; los registros incompletos quedan como en detectar_anomalias"""
+        n = len(columnas['KM_RECORRIDO'])
+        anomalia = np.zeros(n, dtype=int)
+        score = np.zeros(n, dtype=np.float64)
+
+        usadas = modelo.columnas_numericas + modelo.columnas_categoricas
+        completos = np.ones(n, dtype=bool)
+        for c in usadas:
+            valores = columnas[c]
+            if valores.dtype == object:
+                completos &= np.array([v is not None and v == v for v in valores], dtype=bool)
+            else:
+                completos &= ~np.isnan(valores)
+
+        if completos.any():
+            seleccion = {c: columnas[c][completos] for c in usadas}
+            anomalia[completos], score[completos] = modelo.puntuar(seleccion)
+
+        return anomalia, score
+
+    def puntuar_vales(self, vales, dependencia):
+        """Puntúa uno o varios vales (dicts) contra el modelo de referencia de la dependencia"""
+        modelo = self.obtener_modelo(dependencia)
+        if modelo is None:
+            return None
+
+        inicio = time.perf_counter()
+        columnas = caracteristicas_desde_vales(vales)
+        anomalia, score = self._resultado(columnas, modelo)
+        niveles = clasificar_nivel_riesgo(score).astype(str)
+
+        resultados = [{
+            'ANOMALIA': int(a),
+            'SCORE_ANOMALIA': float(s),
+            'NIVEL_RIESGO': n
+        } for a, s, n in zip(anomalia, score, niveles)]
+
+        return {
+            'resultados': resultados,
+            'modelo': modelo.resumen(),
+            'latencia_ms': round((time.perf_counter() - inicio) * 1000, 3)
+        }
+
+    def puntuar_dataframe(self, df, dependencia):
+        """Puntúa un DataFrame ya procesado (p. ej. un mes recién cargado) en una sola llamada vectorizada"""
+        modelo = self.obtener_modelo(dependencia)
+        if modelo is None:
+            return None
+
+        columnas = {}
+        for c in FEATURES_ANOMALIAS:
+            if c in df.columns:
+                valores = df[c].to_numpy()
+                columnas[c] = valores if c == 'TIPO_COMBUSTIBLE' else valores.astype(np.float64)
+            else:
+                columnas[c] = np.full(len(df), np.nan)
+
+        anomalia, score = self._resultado(columnas, modelo)
+        resultado = pd.DataFrame(index=df.index)
+        resultado['ANOMALIA'] = anomalia
+        resultado['SCORE_ANOMALIA'] = score
+        resultado['NIVEL_RIESGO'] = clasificar_nivel_riesgo(resultado['SCORE_ANOMALIA'])
+        return resultado
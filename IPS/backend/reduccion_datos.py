@@ -0,0 +1,171 @@
+"""
+Reducción de series para gráficos: los datos se resumen antes de enviarlos al navegador o dibujarlos en el PDF
+"""
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# Barras por defecto de los histogramas enviados al cliente
+BINS_HISTOGRAMA = 30
+
+# Barras máximas que un cliente puede pedir para un histograma
+MAX_BINS_HISTOGRAMA = 500
+
+# Cuantiles incluidos en el resumen de cada histograma
+CUANTILES_HISTOGRAMA = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# Puntos máximos de una serie de línea antes de reducirla con LTTB
+MAX_PUNTOS_LINEA = 1000
+
+# Puntos máximos de una dispersión antes de agregarla en celdas
+MAX_PUNTOS_DISPERSION = 5000
+
+# Celdas por eje de la agregación de dispersiones (hexbin en PDF, histograma 2-D en JSON)
+CELDAS_DISPERSION = 40
+
+# Límites de reducción de un reporte; forman parte de la clave del caché de reportes
+LimitesGraficos = namedtuple('LimitesGraficos', ['max_puntos_linea', 'max_puntos_dispersion', 'celdas_dispersion'])
+LIMITES_POR_DEFECTO = LimitesGraficos(MAX_PUNTOS_LINEA, MAX_PUNTOS_DISPERSION, CELDAS_DISPERSION)
+
+
+def _valores_finitos(valores):
+    valores = pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=np.float64)
+    return valores[np.isfinite(valores)]
+
+
+def histograma(valores, bins=None, rango=None):
+    """Histograma y estadísticos de una serie numérica.
+
+    Retorna bordes (bins + 1), conteos por barra, total de valores finitos, media,
+    mínimo, máximo y cuantiles; los valores no numéricos o infinitos se descartan.
+    """
+    valores = _valores_finitos(valores)
+    bins = int(bins or BINS_HISTOGRAMA)
+
+    if len(valores) == 0:
+        return {
+            'edges': [], 'counts': [], 'total': 0,
+            'mean': None, 'min': None, 'max': None, 'quantiles': {}
+        }
+
+    conteos, bordes = np.histogram(valores, bins=bins, range=rango)
+    cuantiles = np.quantile(valores, CUANTILES_HISTOGRAMA)
+
+    return {
+        'edges': bordes.astype(float).tolist(),
+        'counts': conteos.astype(int).tolist(),
+        'total': int(len(valores)),
+        'mean': float(valores.mean()),
+        'min': float(valores.min()),
+        'max': float(valores.max()),
+        'quantiles': {f'p{int(round(q * 100))}': float(v) for q, v in zip(CUANTILES_HISTOGRAMA, cuantiles)}
+    }
+
+
+def indices_lttb(x, y, umbral):
+    """Índices que conserva Largest-Triangle-Three-Buckets para reducir (x, y) a `umbral` puntos.
+
+    x debe estar ordenado. Se conservan el primer y el último punto; de cada cubeta
+    intermedia se elige el punto que forma el triángulo de mayor área con el punto
+    elegido antes y el promedio de la cubeta siguiente, lo que preserva picos y valles.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if umbral is None or umbral >= n or umbral < 3:
+        return np.arange(n)
+
+    # umbral - 2 cubetas entre el primer y el último punto
+    bordes = np.linspace(1, n - 1, umbral - 1).astype(np.int64)
+    seleccion = np.empty(umbral, dtype=np.int64)
+    seleccion[0] = 0
+    seleccion[-1] = n - 1
+    anterior = 0
+
+    for i in range(umbral - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        if i + 2 < len(bordes):
+            siguiente_x = x[fin:bordes[i + 2]].mean()
+            siguiente_y = y[fin:bordes[i + 2]].mean()
+        else:
+            siguiente_x, siguiente_y = x[n - 1], y[n - 1]
+
+        areas = np.abs((x[anterior] - siguiente_x) * (y[inicio:fin] - y[anterior])
+                       - (x[anterior] - x[inicio:fin]) * (siguiente_y - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        seleccion[i + 1] = anterior
+
+    return seleccion
+
+
+def reducir_serie(serie, umbral=None):
+    """Reduce una Serie indexada por fecha o número a lo sumo `umbral` puntos con LTTB"""
+    serie = pd.Series(serie).dropna().sort_index()
+    umbral = umbral or MAX_PUNTOS_LINEA
+    if len(serie) <= umbral:
+        return serie
+
+    indice = serie.index
+    if isinstance(indice, pd.DatetimeIndex) or pd.api.types.is_datetime64_any_dtype(indice):
+        x = indice.asi8.astype(np.float64)
+    else:
+        x = pd.to_numeric(pd.Series(indice), errors='coerce').to_numpy(dtype=np.float64)
+        if np.isnan(x).any():
+            x = np.arange(len(serie), dtype=np.float64)
+    return serie.iloc[indices_lttb(x, serie.to_numpy(dtype=np.float64), umbral)]
+
+
+def indices_muestra(n, max_puntos=None):
+    """Índices equiespaciados para dibujar a lo sumo max_puntos de n (todos si caben)"""
+    max_puntos = max_puntos or MAX_PUNTOS_DISPERSION
+    if n <= max_puntos:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, max_puntos).astype(np.int64))
+
+
+def _pares_finitos(x, y):
+    x = pd.to_numeric(pd.Series(x), errors='coerce').to_numpy(dtype=np.float64)
+    y = pd.to_numeric(pd.Series(y), errors='coerce').to_numpy(dtype=np.float64)
+    validos = np.isfinite(x) & np.isfinite(y)
+    return x[validos], y[validos]
+
+
+def reducir_dispersion(x, y, max_puntos=None, celdas=None):
+    """Datos de una dispersión para el cliente.
+
+    Hasta max_puntos se envían los puntos ('tipo': 'puntos'); por encima se envía un
+    histograma 2-D con el centro y el conteo de cada celda no vacía ('tipo': 'histograma2d').
+    """
+    x, y = _pares_finitos(x, y)
+    max_puntos = max_puntos or MAX_PUNTOS_DISPERSION
+
+    if len(x) <= max_puntos:
+        return {'tipo': 'puntos', 'total': int(len(x)), 'x': x.tolist(), 'y': y.tolist()}
+
+    conteos, bordes_x, bordes_y = np.histogram2d(x, y, bins=celdas or CELDAS_DISPERSION)
+    fila, columna = np.nonzero(conteos)
+    centros_x = (bordes_x[:-1] + bordes_x[1:]) / 2
+    centros_y = (bordes_y[:-1] + bordes_y[1:]) / 2
+    return {
+        'tipo': 'histograma2d',
+        'total': int(len(x)),
+        'x': centros_x[fila].tolist(),
+        'y': centros_y[columna].tolist(),
+        'counts': conteos[fila, columna].astype(int).tolist(),
+        'x_edges': bordes_x.tolist(),
+        'y_edges': bordes_y.tolist()
+    }
+
+
+def graficar_dispersion(ax, x, y, max_puntos=None, celdas=None, **estilo):
+    """Dibuja una dispersión en ax: puntos hasta max_puntos, hexbin con barra de conteos por encima"""
+    x, y = _pares_finitos(x, y)
+    max_puntos = max_puntos or MAX_PUNTOS_DISPERSION
+
+    if len(x) <= max_puntos:
+        return ax.scatter(x, y, **estilo)
+
+    hexagonos = ax.hexbin(x, y, gridsize=celdas or CELDAS_DISPERSION, mincnt=1, cmap='Blues',
+                          label=estilo.get('label'))
+    ax.figure.colorbar(hexagonos, ax=ax, label='Registros')
+    return hexagonos
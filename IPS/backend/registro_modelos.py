@@ -0,0 +1,207 @@
+"""
+Registro versionado de modelos de predicción, direccionado por los datos y características de entrenamiento
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import joblib
+import numpy as np
+from datetime import datetime
+from .arboles_compactos import BosqueRegresionCompacto
+
+# Versión del procedimiento de entrenamiento; incrementarla invalida los modelos registrados
+VERSION_ENTRENAMIENTO = 2
+
+ARCHIVO_MODELO = 'modelo.joblib'
+ARCHIVO_SCALER = 'scaler.joblib'
+ARCHIVO_METADATOS = 'metadatos.json'
+ARCHIVO_ULTIMA = 'ultima.json'
+DIRECTORIO_COMPACTO = 'compacto'
+
+# Predicciones de una fila repetidas al medir la latencia de cada formato
+REPETICIONES_LATENCIA = 20
+
+
+def _bytes_en_disco(ruta):
+    """Tamaño de un archivo, o la suma de los archivos de un directorio"""
+    if os.path.isfile(ruta):
+        return os.path.getsize(ruta)
+    return sum(entrada.stat().st_size for entrada in os.scandir(ruta) if entrada.is_file())
+
+
+class RegistroModelos:
+    """Versiones de un modelo guardadas en `directorio/<version>/`.
+
+    La versión es un hash de la huella de los datos de entrenamiento, las características
+    y los parámetros, así que entrenar dos veces con los mismos datos encuentra la versión
+    existente. Cada versión guarda modelo, scaler y metadatos (métricas, características,
+    fecha); ultima.json apunta a la versión más reciente. Los bosques de regresión se
+    guardan además en formato compacto (compacto/, arreglos .npy) y con compacto=True
+    se sirven desde ahí cargados con mmap, así que los procesos que atienden la misma
+    versión comparten las páginas del archivo; el modelo joblib se sigue guardando para
+    las actualizaciones incrementales. Se conservan las `max_versiones` más recientes.
+    """
+
+    def __init__(self, directorio='models/prediccion', max_versiones=5, compacto=True):
+        self.directorio = directorio
+        self.max_versiones = max_versiones
+        self.compacto = compacto
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version(huella_datos, features, parametros=None):
+        """Versión del modelo entrenado sobre esos datos, con esas características y parámetros"""
+        contenido = {
+            'entrenamiento': VERSION_ENTRENAMIENTO,
+            'datos': huella_datos,
+            'features': list(features),
+            'parametros': {k: str(v) for k, v in sorted((parametros or {}).items())}
+        }
+        return hashlib.sha1(json.dumps(contenido, sort_keys=True).encode()).hexdigest()[:16]
+
+    def _ruta(self, version, archivo=None):
+        ruta = os.path.join(self.directorio, version)
+        return ruta if archivo is None else os.path.join(ruta, archivo)
+
+    def _leer_json(self, ruta):
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _escribir_json(self, ruta, datos):
+        temporal = ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, indent=2)
+        os.replace(temporal, ruta)
+
+    def existe(self, version):
+        return os.path.exists(self._ruta(version, ARCHIVO_METADATOS))
+
+    def metadatos(self, version):
+        return self._leer_json(self._ruta(version, ARCHIVO_METADATOS))
+
+    def guardar(self, version, modelo, scaler, metadatos):
+        """Guarda una versión completa y la marca como la más reciente.
+
+        Los archivos se escriben en un directorio temporal que se renombra al final, así que
+        una versión visible en el registro siempre está completa.
+        """
+        metadatos = dict(metadatos, version=version, fecha_entrenamiento=datetime.now().isoformat())
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = self._ruta(f'.{version}.tmp')
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        joblib.dump(modelo, os.path.join(temporal, ARCHIVO_MODELO))
+        joblib.dump(scaler, os.path.join(temporal, ARCHIVO_SCALER))
+        metadatos['bytes_modelo'] = _bytes_en_disco(os.path.join(temporal, ARCHIVO_MODELO))
+        if BosqueRegresionCompacto.admite(modelo):
+            BosqueRegresionCompacto.desde_modelo(modelo).guardar(os.path.join(temporal, DIRECTORIO_COMPACTO))
+            metadatos['bytes_compacto'] = _bytes_en_disco(os.path.join(temporal, DIRECTORIO_COMPACTO))
+        self._escribir_json(os.path.join(temporal, ARCHIVO_METADATOS), metadatos)
+
+        with self._lock:
+            if self.existe(version):
+                shutil.rmtree(temporal, ignore_errors=True)
+            else:
+                os.replace(temporal, self._ruta(version))
+            self._escribir_json(os.path.join(self.directorio, ARCHIVO_ULTIMA), {'version': version})
+            self._depurar()
+        return metadatos
+
+    def marcar_ultima(self, version):
+        """Marca una versión existente como la que se carga al iniciar"""
+        with self._lock:
+            if self.existe(version):
+                self._escribir_json(os.path.join(self.directorio, ARCHIVO_ULTIMA), {'version': version})
+
+    def cargar(self, version):
+        """Retorna (modelo para predecir, scaler, metadatos) de una versión, o None si no existe.
+
+        El modelo es el bosque compacto si la versión lo tiene (y compacto=True); si no, el
+        estimador de sklearn.
+        """
+        metadatos = self.metadatos(version)
+        if metadatos is None:
+            return None
+        compacto = self._ruta(version, DIRECTORIO_COMPACTO)
+        if self.compacto and os.path.isdir(compacto):
+            modelo = BosqueRegresionCompacto.cargar(compacto)
+        else:
+            modelo = self.cargar_estimador(version)
+        scaler = joblib.load(self._ruta(version, ARCHIVO_SCALER))
+        return modelo, scaler, metadatos
+
+    def cargar_estimador(self, version):
+        """Estimador de sklearn de una versión (el que se puede seguir entrenando)"""
+        return joblib.load(self._ruta(version, ARCHIVO_MODELO), mmap_mode='r')
+
+    def medir_formatos(self, version, X, repeticiones=REPETICIONES_LATENCIA):
+        """Tamaño en disco, tiempo de carga y latencia de predicción de cada formato de una versión.
+
+        X son registros ya escalados; la latencia por registro se mide prediciendo una fila
+        (mediana de `repeticiones`) y prediciendo todo X en una sola llamada.
+        """
+        formatos = {
+            'joblib': (self._ruta(version, ARCHIVO_MODELO), lambda: self.cargar_estimador(version)),
+            'compacto': (self._ruta(version, DIRECTORIO_COMPACTO),
+                         lambda: BosqueRegresionCompacto.cargar(self._ruta(version, DIRECTORIO_COMPACTO)))
+        }
+        resultado = {}
+        for formato, (ruta, cargar) in formatos.items():
+            if not os.path.exists(ruta):
+                continue
+            inicio = time.perf_counter()
+            modelo = cargar()
+            carga = time.perf_counter() - inicio
+
+            modelo.predict(X[:1])
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                modelo.predict(X[:1])
+                tiempos.append(time.perf_counter() - inicio)
+            inicio = time.perf_counter()
+            modelo.predict(X)
+            lote = time.perf_counter() - inicio
+
+            resultado[formato] = {
+                'bytes': _bytes_en_disco(ruta),
+                'carga_ms': round(carga * 1000, 3),
+                'latencia_registro_ms': round(float(np.median(tiempos)) * 1000, 4),
+                'latencia_lote_us_por_registro': round(lote / len(X) * 1e6, 3),
+                'registros_lote': len(X)
+            }
+        return resultado
+
+    def ultima_version(self):
+        ultima = self._leer_json(os.path.join(self.directorio, ARCHIVO_ULTIMA))
+        if ultima and self.existe(ultima.get('version', '')):
+            return ultima['version']
+        return None
+
+    def listar(self):
+        """Metadatos de las versiones registradas, de la más reciente a la más antigua"""
+        if not os.path.isdir(self.directorio):
+            return []
+        versiones = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.startswith('.'):
+                continue
+            metadatos = self.metadatos(nombre)
+            if metadatos is not None:
+                versiones.append(metadatos)
+        return sorted(versiones, key=lambda m: m.get('fecha_entrenamiento', ''), reverse=True)
+
+    def _depurar(self):
+        """Elimina las versiones más antiguas que exceden max_versiones (nunca la más reciente)"""
+        if not self.max_versiones:
+            return
+        ultima = self.ultima_version()
+        for metadatos in self.listar()[self.max_versiones:]:
+            if metadatos['version'] != ultima:
+                shutil.rmtree(self._ruta(metadatos['version']), ignore_errors=True)
@@ -0,0 +1,152 @@
+"""
+Renderizado de gráficos de matplotlib a buffers en memoria para insertarlos en los PDF
+
+Los gráficos de un reporte se dibujan en paralelo en un pool de procesos (pyplot no es
+seguro entre hilos); cada proceso aplica el estilo una sola vez al iniciar. Los procesos
+se crean con la política común de procesos.contexto_procesos.
+"""
+import io
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import matplotlib.pyplot as plt
+from .procesos import contexto_procesos
+
+# Resolución de las imágenes insertadas en los reportes
+DPI_GRAFICOS = 300
+
+# Perfiles de salida: resolución y formato de las imágenes de los reportes
+PERFILES_SALIDA = {
+    'alta': {'formato': 'png', 'dpi': 300},
+    'estandar': {'formato': 'png', 'dpi': 150, 'pil_kwargs': {'optimize': True}},
+    'compacto': {'formato': 'jpeg', 'dpi': 120, 'pil_kwargs': {'quality': 80, 'optimize': True}},
+    'vectorial': {'formato': 'svg'}
+}
+PERFIL_POR_DEFECTO = 'estandar'
+
+# Configuración del pool; se ajusta al iniciar la aplicación con configurar()
+_configuracion = {'max_workers': None, 'perfil': PERFIL_POR_DEFECTO}
+_pool = None
+_lock = threading.Lock()
+_lock_pyplot = threading.Lock()  # Dibujo en el proceso actual: pyplot no es seguro entre hilos
+
+
+def aplicar_estilo():
+    """Estilo común de los gráficos de reportes"""
+    import seaborn as sns
+    plt.style.use('seaborn-v0_8')
+    sns.set_palette("husl")
+
+
+def _iniciar_proceso():
+    import matplotlib
+    matplotlib.use('Agg')
+    aplicar_estilo()
+
+
+def configurar(max_workers=None, perfil=None):
+    """Define procesos del pool (0 = dibujar en el proceso actual) y el perfil de salida por defecto"""
+    global _pool
+    if perfil is not None and perfil not in PERFILES_SALIDA:
+        raise ValueError(f"Perfil de salida desconocido: {perfil}")
+    with _lock:
+        _configuracion['max_workers'] = max_workers
+        if perfil is not None:
+            _configuracion['perfil'] = perfil
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def _obtener_pool():
+    global _pool
+    with _lock:
+        if _configuracion['max_workers'] == 0:
+            return None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_configuracion['max_workers'],
+                                        mp_context=contexto_procesos(),
+                                        initializer=_iniciar_proceso)
+        return _pool
+
+
+def figura_en_memoria(figura=None, perfil=None):
+    """Guarda la figura (por defecto la actual) en un BytesIO según el perfil, la cierra y retorna el buffer.
+
+    FPDF.image acepta el buffer directamente, así cada reporte tiene sus propias imágenes
+    y no se comparten archivos temporales entre reportes concurrentes.
+    """
+    opciones = PERFILES_SALIDA[perfil or _configuracion['perfil']]
+    figura = figura or plt.gcf()
+    buffer = io.BytesIO()
+    extras = {'pil_kwargs': opciones['pil_kwargs']} if 'pil_kwargs' in opciones else {}
+    figura.savefig(buffer, format=opciones['formato'], dpi=opciones.get('dpi', DPI_GRAFICOS),
+                   bbox_inches='tight', **extras)
+    plt.close(figura)
+
+    if opciones['formato'] == 'svg':
+        # FPDF no interpreta el bloque <metadata> que matplotlib agrega al SVG
+        contenido = re.sub(rb'<metadata>.*?</metadata>', b'', buffer.getvalue(), flags=re.S)
+        buffer = io.BytesIO(contenido)
+    buffer.seek(0)
+    return buffer
+
+
+def _dibujar(funcion, datos, perfil):
+    """Ejecuta una función de dibujo y retorna los bytes de la imagen"""
+    funcion(**datos)
+    return figura_en_memoria(perfil=perfil).getvalue()
+
+
+def renderizar(tareas, perfil=None):
+    """Dibuja en paralelo un diccionario nombre -> (funcion, datos) y retorna nombre -> BytesIO.
+
+    Cada función recibe sus datos como argumentos con nombre y dibuja sobre una figura nueva
+    de pyplot; debe ser una función de módulo para poder enviarse a otro proceso. Los gráficos
+    que fallan se omiten del resultado.
+    """
+    perfil = perfil or _configuracion['perfil']
+    if perfil not in PERFILES_SALIDA:
+        raise ValueError(f"Perfil de salida desconocido: {perfil}")
+
+    pool = _obtener_pool() if len(tareas) > 1 else None
+    if pool is not None:
+        try:
+            return _renderizar_en_pool(pool, tareas, perfil)
+        except BrokenProcessPool as e:
+            # Un proceso terminó de forma abrupta: se descarta el pool y se dibuja aquí
+            print(f"Pool de gráficos no disponible, dibujando en el proceso actual: {e}")
+            _descartar_pool(pool)
+
+    graficos = {}
+    with _lock_pyplot:
+        aplicar_estilo()
+        for nombre, (funcion, datos) in tareas.items():
+            try:
+                graficos[nombre] = io.BytesIO(_dibujar(funcion, datos, perfil))
+            except Exception as e:
+                plt.close('all')
+                print(f"Error dibujando gráfico {nombre}: {e}")
+    return graficos
+
+
+def _renderizar_en_pool(pool, tareas, perfil):
+    graficos = {}
+    futuros = {nombre: pool.submit(_dibujar, funcion, datos, perfil) for nombre, (funcion, datos) in tareas.items()}
+    for nombre, futuro in futuros.items():
+        try:
+            graficos[nombre] = io.BytesIO(futuro.result())
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            print(f"Error dibujando gráfico {nombre}: {e}")
+    return graficos
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
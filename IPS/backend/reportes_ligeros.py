@@ -0,0 +1,186 @@
+"""
+Reportes en HTML autocontenido o JSON: los mismos agregados del PDF sin matplotlib ni FPDF
+"""
+import os
+import re
+import json
+from datetime import datetime
+import numpy as np
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from .contexto_reporte import DIAS_SEMANA
+from .reduccion_datos import histograma, reducir_dispersion
+
+FORMATOS_REPORTE = ['pdf', 'html', 'json']
+
+# Plantilla de la página HTML (los gráficos se dibujan en el navegador con SVG)
+PLANTILLA_HTML = 'reporte_ligero.html'
+
+_entorno = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')),
+    autoescape=select_autoescape(['html'])
+)
+
+ETIQUETAS_RESUMEN = {
+    'total_registros': 'Registros analizados',
+    'total_anomalias': 'Anomalías detectadas',
+    'porcentaje_anomalias': 'Porcentaje de anomalías (%)',
+    'total_consumo': 'Consumo total (S/)',
+    'total_galones': 'Galones consumidos',
+    'total_km': 'Kilómetros recorridos',
+    'eficiencia_promedio': 'Eficiencia promedio (km/gal)',
+    'total_inconsistencias': 'Vales con inconsistencias de secuencia',
+    'total_emisiones_kg': 'Emisiones totales (kg CO2)',
+    'total_emisiones_toneladas': 'Emisiones totales (ton CO2)',
+    'promedio_emisiones_por_viaje': 'Promedio por viaje (kg CO2)',
+    'promedio_emisiones_por_km': 'Promedio por km (kg CO2/km)',
+    'arboles_necesarios': 'Árboles necesarios para compensar (por año)',
+    'km_auto_particular': 'Equivalente en auto particular (km)',
+    'impacto': 'Impacto ambiental'
+}
+
+
+def _numero(valor):
+    """Convierte escalares de numpy/pandas a tipos de JSON (NaN -> None)"""
+    if valor is None or isinstance(valor, str):
+        return valor
+    if isinstance(valor, (np.integer, int)) and not isinstance(valor, bool):
+        return int(valor)
+    valor = float(valor)
+    return valor if np.isfinite(valor) else None
+
+
+def _serie(titulo, tipo, serie):
+    return {
+        'titulo': titulo,
+        'tipo': tipo,
+        'labels': [str(etiqueta) for etiqueta in serie.index],
+        'data': [_numero(v) for v in serie.to_numpy()]
+    }
+
+
+def _tabla(titulo, df, columnas):
+    """Tabla {titulo, columnas, filas} con las columnas (título, columna) de df; el índice se incluye como 'index'"""
+    df = df.reset_index().rename(columns={df.index.name or 'index': 'index'})
+    registros = json.loads(df[[c for _, c in columnas]].to_json(orient='records', date_format='iso'))
+    return {
+        'titulo': titulo,
+        'columnas': [titulo_columna for titulo_columna, _ in columnas],
+        'filas': [[registro[c] for _, c in columnas] for registro in registros]
+    }
+
+
+def datos_reporte_anomalias(contexto):
+    """Documento del reporte de anomalías a partir de un ContextoReporte"""
+    resumen = {
+        'total_registros': _numero(contexto.total_registros),
+        'total_anomalias': _numero(int(contexto.total_anomalias)),
+        'porcentaje_anomalias': _numero(contexto.porcentaje_anomalias),
+        'total_consumo': _numero(contexto.total_consumo),
+        'total_galones': _numero(contexto.total_galones),
+        'total_km': _numero(contexto.total_km),
+        'eficiencia_promedio': _numero(contexto.eficiencia_promedio),
+        'total_inconsistencias': _numero(contexto.total_inconsistencias)
+    }
+
+    graficos = {}
+    if contexto.eficiencia is not None:
+        graficos['eficiencia'] = dict(histograma(contexto.eficiencia['valores']),
+                                      titulo='Distribución de eficiencia (km/gal)', tipo='histograma')
+    if contexto.consumo_diario is not None:
+        graficos['consumo_diario'] = _serie('Consumo por día de la semana (S/)', 'barras',
+                                            contexto.consumo_diario.reindex(DIAS_SEMANA, fill_value=0))
+    if contexto.riesgo is not None:
+        graficos['riesgo'] = _serie('Registros por nivel de riesgo', 'barras', contexto.riesgo['CANTIDAD'])
+    if contexto.dispersion is not None:
+        graficos['eficiencia_consumo'] = dict(
+            reducir_dispersion(contexto.dispersion['x'], contexto.dispersion['y'],
+                               contexto.limites.max_puntos_dispersion, contexto.limites.celdas_dispersion),
+            titulo='Eficiencia vs consumo', tipo='dispersion')
+    if contexto.consumo_temporal is not None:
+        tendencia = contexto.consumo_temporal.copy()
+        tendencia.index = tendencia.index.strftime('%Y-%m-%d')
+        graficos['tendencia'] = _serie('Tendencia diaria de consumo (S/)', 'linea', tendencia)
+    if contexto.top_consumo_vehiculos is not None:
+        graficos['top_vehiculos'] = _serie('Top 10 vehículos por consumo (S/)', 'barras_h', contexto.top_consumo_vehiculos)
+
+    tablas = {}
+    if contexto.riesgo is not None:
+        tablas['riesgo'] = _tabla('Anomalías por nivel de riesgo', contexto.riesgo,
+                                  [('Nivel de riesgo', 'index'), ('Cantidad', 'CANTIDAD'), ('Consumo (S/)', 'CONSUMO')])
+    if contexto.vehiculos_anomalias is not None:
+        tablas['vehiculos_anomalias'] = _tabla('Vehículos con anomalías', contexto.vehiculos_anomalias, [
+            ('Placa', 'index'), ('Anomalías', 'ANOMALIA'), ('Consumo total (S/)', 'TOTAL_CONSUMO'),
+            ('Eficiencia (km/gal)', 'EFICIENCIA'), ('Nivel de riesgo', 'NIVEL_RIESGO')])
+    if contexto.resumen_secuencia is not None:
+        tablas['secuencia'] = _tabla('Inconsistencias en la secuencia de cargas', contexto.resumen_secuencia, [
+            ('Placa', 'index'), ('Vales', 'VALES'), ('Cargas seguidas', 'CARGA_RAPIDA'),
+            ('Sobrecarga tanque', 'SOBRECARGA_TANQUE'), ('Km inconsistente', 'KM_INCONSISTENTE'),
+            ('Total inconsistencias', 'INCONSISTENCIA_SECUENCIA')])
+
+    return {
+        'tipo': 'anomalias',
+        'titulo': 'Reporte de análisis de combustible',
+        'mes': _numero(contexto.mes),
+        'dependencia': contexto.dependencia,
+        'generado': datetime.now().isoformat(timespec='seconds'),
+        'resumen': resumen,
+        'graficos': graficos,
+        'tablas': tablas,
+        'recomendaciones': contexto.recomendaciones()
+    }
+
+
+def datos_reporte_emisiones(contexto, mes, dependencia):
+    """Documento del reporte de emisiones a partir de un ContextoEmisiones"""
+    estadisticas = contexto.estadisticas
+    resumen = {clave: _numero(estadisticas.get(clave, 0)) for clave in [
+        'total_emisiones_kg', 'total_emisiones_toneladas', 'promedio_emisiones_por_viaje', 'promedio_emisiones_por_km']}
+    resumen.update({clave: _numero(valor) for clave, valor in contexto.equivalencias().items()})
+
+    graficos = {}
+    por_combustible = contexto.emisiones_por_combustible()
+    if not por_combustible.empty:
+        graficos['emisiones_combustible'] = _serie('Emisiones por tipo de combustible (kg CO2)', 'barras', por_combustible)
+    df_emisiones = contexto.df_emisiones
+    if 'EFICIENCIA' in df_emisiones.columns and 'EMISIONES_POR_KM' in df_emisiones.columns:
+        graficos['emisiones_eficiencia'] = dict(
+            reducir_dispersion(df_emisiones['EFICIENCIA'], df_emisiones['EMISIONES_POR_KM'],
+                               contexto.limites.max_puntos_dispersion, contexto.limites.celdas_dispersion),
+            titulo='Eficiencia vs emisiones por km', tipo='dispersion')
+    top_vehiculos = contexto.top_vehiculos()
+    if not top_vehiculos.empty:
+        graficos['top_vehiculos_emisiones'] = _serie('Top 10 vehículos por emisiones (kg CO2)', 'barras_h', top_vehiculos)
+    distribucion = contexto.distribucion_niveles()
+    if not distribucion.empty:
+        graficos['distribucion_emisiones'] = _serie('Registros por nivel de emisiones', 'barras', distribucion)
+
+    return {
+        'tipo': 'emisiones',
+        'titulo': 'Reporte de emisiones de CO2',
+        'mes': mes,
+        'dependencia': dependencia,
+        'generado': datetime.now().isoformat(timespec='seconds'),
+        'resumen': resumen,
+        'graficos': graficos,
+        'tablas': {},
+        'recomendaciones': contexto.recomendaciones()
+    }
+
+
+def guardar_reporte_ligero(datos, prefijo, formato, directorio='uploads'):
+    """Escribe el documento como JSON o como página HTML y retorna el nombre del archivo"""
+    if formato not in ('html', 'json'):
+        raise ValueError(f"Formato de reporte no válido: {formato}")
+
+    os.makedirs(directorio, exist_ok=True)
+    nombre_archivo = f"{prefijo}_{datos['dependencia']}_mes{datos['mes']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    nombre_archivo = re.sub(r'[^a-zA-Z0-9_.-]', '', nombre_archivo)
+
+    if formato == 'json':
+        contenido = json.dumps(datos, ensure_ascii=False)
+    else:
+        contenido = _entorno.get_template(PLANTILLA_HTML).render(datos=datos, etiquetas=ETIQUETAS_RESUMEN)
+
+    with open(os.path.join(directorio, nombre_archivo), 'w', encoding='utf-8') as f:
+        f.write(contenido)
+    return nombre_archivo
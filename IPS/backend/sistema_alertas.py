@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 from models import db
 from flask_sqlalchemy import SQLAlchemy
 import json
+from .analisis_secuencias import AnalizadorSecuencias, COLUMNAS_SECUENCIA
 
 class SistemaAlertas:
     def __init__(self):
@@ -30,6 +31,10 @@ class SistemaAlertas:
             'consumo_fin_semana': {
                 'habilitado': True,
                 'umbral_porcentaje': 30  # % del consumo total
+            },
+            'inconsistencias_secuencia': {
+                'habilitado': True,
+                'min_inconsistencias': 2  # vales inconsistentes por vehículo
             }
         }
     
@@ -229,6 +234,49 @@ class SistemaAlertas:
         
         return alertas
     
+    def verificar_inconsistencias_secuencia(self, df):
+        """Verifica vehículos con cargas seguidas, sobrecarga de tanque o kilometraje inconsistente"""
+        alertas = []
+        
+        if not self.configuraciones['inconsistencias_secuencia']['habilitado']:
+            return alertas
+            
+        try:
+            if 'PLACA' not in df.columns:
+                return alertas
+                
+            min_inconsistencias = self.configuraciones['inconsistencias_secuencia']['min_inconsistencias']
+            
+            # Reutilizar el análisis de secuencias calculado al cargar el archivo
+            analizador = AnalizadorSecuencias()
+            resultado = df[COLUMNAS_SECUENCIA] if all(c in df.columns for c in COLUMNAS_SECUENCIA) else None
+            resumen = analizador.resumen_por_vehiculo(df, resultado)
+            
+            for placa, fila in resumen.iterrows():
+                cantidad = int(fila['INCONSISTENCIA_SECUENCIA'])
+                if cantidad < min_inconsistencias:
+                    continue
+                    
+                nivel = 'critico' if fila['SOBRECARGA_TANQUE'] > 0 or cantidad >= min_inconsistencias * 3 else 'alto'
+                alertas.append({
+                    'tipo': 'inconsistencias_secuencia',
+                    'nivel': nivel,
+                    'vehiculo': placa,
+                    'mensaje': (f'Vehículo {placa} tiene {cantidad} vales inconsistentes con su secuencia de cargas '
+                                f'({int(fila["CARGA_RAPIDA"])} cargas seguidas, {int(fila["SOBRECARGA_TANQUE"])} sobre la '
+                                f'capacidad del tanque, {int(fila["KM_INCONSISTENTE"])} con kilometraje inconsistente)'),
+                    'cantidad_inconsistencias': cantidad,
+                    'cargas_rapidas': int(fila['CARGA_RAPIDA']),
+                    'sobrecargas_tanque': int(fila['SOBRECARGA_TANQUE']),
+                    'km_inconsistentes': int(fila['KM_INCONSISTENTE']),
+                    'fecha': datetime.now().isoformat()
+                })
+        
+        except Exception as e:
+            print(f"Error verificando inconsistencias de secuencia: {e}")
+        
+        return alertas
+    
     def ejecutar_todas_las_verificaciones(self, df):
         """Ejecuta todas las verificaciones de alertas"""
         todas_alertas = []
@@ -246,6 +294,9 @@ class SistemaAlertas:
             # Verificar consumo fin de semana
             todas_alertas.extend(self.verificar_consumo_fin_semana(df))
             
+            # Verificar inconsistencias en la secuencia de vales por vehículo
+            todas_alertas.extend(self.verificar_inconsistencias_secuencia(df))
+            
             # Ordenar por nivel de prioridad
             prioridad = {'critico': 0, 'alto': 1, 'medio': 2, 'bajo': 3}
             todas_alertas.sort(key=lambda x: prioridad.get(x['nivel'], 3))
@@ -0,0 +1,192 @@
+"""
+Tablas largas en los PDF: anchos de columna medidos una sola vez y filas escritas por página
+"""
+import numpy as np
+import pandas as pd
+
+# Filas que se formatean a la vez
+TAMANO_BLOQUE = 5000
+
+
+def _tabla_anchos(pdf):
+    """Ancho (en milésimas del tamaño de fuente) de cada byte latin-1 de la fuente actual"""
+    anchos = pdf.current_font.cw
+    if isinstance(anchos, dict):
+        return np.array([anchos.get(chr(i), 0) for i in range(256)], dtype=np.float64)
+    # Fuentes TrueType: se mide cada carácter una sola vez
+    factor = 1000 * pdf.k / pdf.font_size_pt
+    return np.array([pdf.get_string_width(chr(i)) * factor if i >= 32 else 0 for i in range(256)], dtype=np.float64)
+
+
+def _texto_latin1(textos):
+    """Reemplaza los caracteres que las fuentes estándar del PDF no pueden escribir"""
+    return textos.str.encode('latin-1', errors='replace').str.decode('latin-1')
+
+
+def _anchos_texto(textos, tabla, escala):
+    """Ancho de cada texto sumando los anchos de sus caracteres, sin medirlos de a uno"""
+    if len(textos) == 0:
+        return np.zeros(0)
+    codificados = textos.str.encode('latin-1', errors='replace')
+    largos = codificados.str.len().to_numpy(dtype=np.int64)
+    caracteres = np.frombuffer(b''.join(codificados), dtype=np.uint8)
+    acumulado = np.concatenate([[0.0], np.cumsum(tabla[caracteres])])
+    fin = np.cumsum(largos)
+    return (acumulado[fin] - acumulado[fin - largos]) * escala
+
+
+def _recortar(texto, ancho_maximo, tabla, escala):
+    anchos = np.cumsum(tabla[np.frombuffer(texto.encode('latin-1', errors='replace'), dtype=np.uint8)]) * escala
+    return texto[:int(np.searchsorted(anchos, ancho_maximo, side='right'))]
+
+
+def formatear_columna(serie, formato=None):
+    """Textos de una columna: formato es una cadena de str.format o una función valor -> texto"""
+    valores = serie[serie.notna()].astype(object)
+    if formato is None:
+        formateados = valores.astype(str)
+    else:
+        formateados = valores.map(formato if callable(formato) else formato.format)
+    textos = pd.Series('', index=serie.index, dtype=object)
+    textos[formateados.index] = formateados
+    return _texto_latin1(textos.astype(str))
+
+
+class TablaPDF:
+    """Tabla de muchas filas sobre un FPDF.
+
+    columnas: lista de (titulo, columna, formato, alineacion) con alineacion 'L', 'C' o 'R'.
+    Los anchos se calculan una vez a partir del texto más ancho de cada columna (sumando
+    anchos de carácter de la fuente, sin medir cada texto) y se ajustan al ancho útil de la
+    página; las filas se escriben con pdf.text y cada página se cuadricula con una línea por
+    fila y por columna, en lugar de una celda por valor.
+    """
+
+    def __init__(self, pdf, columnas, alto_fila=5, tamano_fuente=7, relleno=1.5, fuente='Arial'):
+        self.pdf = pdf
+        self.columnas = columnas
+        self.alto_fila = alto_fila
+        self.tamano_fuente = tamano_fuente
+        self.relleno = relleno
+        self.fuente = fuente
+        self.anchos = None
+
+    def _bloques(self, df):
+        """Textos y anchos de cada columna, por bloques de filas de df"""
+        pdf = self.pdf
+        pdf.set_font(self.fuente, '', self.tamano_fuente)
+        tabla = _tabla_anchos(pdf)
+        escala = self.tamano_fuente / pdf.k / 1000
+        for inicio in range(0, len(df), TAMANO_BLOQUE):
+            bloque = df.iloc[inicio:inicio + TAMANO_BLOQUE]
+            columnas = []
+            for _, columna, formato, _ in self.columnas:
+                textos = formatear_columna(bloque[columna], formato)
+                columnas.append((textos.tolist(), _anchos_texto(textos, tabla, escala)))
+            yield len(bloque), columnas
+
+    def medir(self, df):
+        """Calcula los anchos de columna a partir del texto más ancho de cada una"""
+        pdf = self.pdf
+        pdf.set_font(self.fuente, 'B', self.tamano_fuente)
+        titulos = _texto_latin1(pd.Series([titulo for titulo, _, _, _ in self.columnas]))
+        naturales = _anchos_texto(titulos, _tabla_anchos(pdf), self.tamano_fuente / pdf.k / 1000)
+        for _, columnas in self._bloques(df):
+            for i, (_, anchos) in enumerate(columnas):
+                naturales[i] = max(naturales[i], anchos.max())
+
+        naturales = naturales + 2 * self.relleno
+        disponible = pdf.w - pdf.l_margin - pdf.r_margin
+        self.anchos = naturales * (disponible / naturales.sum())
+        return self.anchos
+
+    def _encabezado(self, y):
+        pdf = self.pdf
+        pdf.set_font(self.fuente, 'B', self.tamano_fuente)
+        pdf.set_fill_color(220, 220, 220)
+        pdf.rect(pdf.l_margin, y, self.anchos.sum(), self.alto_fila, style='DF')
+        x = pdf.l_margin
+        for (titulo, _, _, _), ancho in zip(self.columnas, self.anchos):
+            pdf.text(x + self.relleno, y + self.alto_fila * 0.7, titulo)
+            x += ancho
+        pdf.set_font(self.fuente, '', self.tamano_fuente)
+
+    def _cuadricula(self, y_inicio, filas):
+        pdf = self.pdf
+        x_inicio = pdf.l_margin
+        x_fin = x_inicio + self.anchos.sum()
+        y_fin = y_inicio + filas * self.alto_fila
+        for fila in range(filas + 1):
+            y = y_inicio + fila * self.alto_fila
+            pdf.line(x_inicio, y, x_fin, y)
+        for x in np.concatenate([[x_inicio], x_inicio + np.cumsum(self.anchos)]):
+            pdf.line(x, y_inicio, x, y_fin)
+
+    def _nueva_pagina(self):
+        """Escribe el encabezado en la posición actual y retorna (y de la primera fila, filas que caben)"""
+        pdf = self.pdf
+        y = pdf.get_y()
+        if int((pdf.h - pdf.b_margin - y) // self.alto_fila) < 2:
+            pdf.add_page()
+            y = pdf.get_y()
+        self._encabezado(y)
+        return y + self.alto_fila, int((pdf.h - pdf.b_margin - y) // self.alto_fila) - 1
+
+    def _escribir(self, columnas, desde, hasta, y):
+        """Escribe las filas desde:hasta de un bloque a partir de la altura y"""
+        pdf = self.pdf
+        tabla = _tabla_anchos(pdf)
+        escala = self.tamano_fuente / pdf.k / 1000
+        base_texto = y + self.alto_fila * 0.7
+        x = pdf.l_margin
+        for (_, _, _, alineacion), ancho, (textos, anchos_texto) in zip(self.columnas, self.anchos, columnas):
+            util = ancho - 2 * self.relleno
+            for fila in range(desde, hasta):
+                texto, ancho_texto = textos[fila], anchos_texto[fila]
+                if not texto:
+                    continue
+                if ancho_texto > util:
+                    texto = _recortar(texto, util, tabla, escala)
+                    ancho_texto = util
+                if alineacion == 'R':
+                    x_texto = x + ancho - self.relleno - ancho_texto
+                elif alineacion == 'C':
+                    x_texto = x + (ancho - ancho_texto) / 2
+                else:
+                    x_texto = x + self.relleno
+                pdf.text(x_texto, base_texto + (fila - desde) * self.alto_fila, texto)
+            x += ancho
+
+    def dibujar(self, df):
+        """Escribe todas las filas de df desde la posición actual, agregando páginas según se llenan.
+
+        Las filas se formatean por bloques de TAMANO_BLOQUE, así que la memoria usada no
+        depende del largo de la tabla más allá del propio contenido del PDF.
+        """
+        pdf = self.pdf
+        if len(df) == 0:
+            return
+        if self.anchos is None:
+            self.medir(df)
+        salto_automatico, margen_inferior = pdf.auto_page_break, pdf.b_margin
+        pdf.set_auto_page_break(False, margen_inferior)
+
+        try:
+            y, capacidad = self._nueva_pagina()
+            escritas = 0
+            for filas, columnas in self._bloques(df):
+                desde = 0
+                while desde < filas:
+                    if escritas == capacidad:
+                        self._cuadricula(y - self.alto_fila, escritas + 1)
+                        pdf.add_page()
+                        y, capacidad = self._nueva_pagina()
+                        escritas = 0
+                    hasta = min(filas, desde + capacidad - escritas)
+                    self._escribir(columnas, desde, hasta, y + escritas * self.alto_fila)
+                    escritas += hasta - desde
+                    desde = hasta
+            self._cuadricula(y - self.alto_fila, escritas + 1)
+            pdf.set_y(y + escritas * self.alto_fila)
+        finally:
+            pdf.set_auto_page_break(salto_automatico, margen_inferior)
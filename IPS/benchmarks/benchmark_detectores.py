@@ -0,0 +1,84 @@
+"""
+Compara latencia y concordancia entre el detector robusto y IsolationForest
+
+Uso:
+    python benchmarks/benchmark_detectores.py                 # datos sintéticos
+    python benchmarks/benchmark_detectores.py datos.xlsx      # archivo real
+    python benchmarks/benchmark_detectores.py --registros 200000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.analisis_combustible import procesar_datos
+from backend.detectores_anomalias import DetectorRobusto, DetectorIsolationForest
+
+
+def datos_sinteticos(n, semilla=42):
+    """Flota sintética con la estructura del archivo de vales"""
+    rng = np.random.default_rng(semilla)
+    df = pd.DataFrame({
+        'FECHA_INGRESO_VALE': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n), unit='D'),
+        'UNIDAD_ORGANICA': rng.choice(['GERENCIA_A', 'GERENCIA_B', 'ALCALDIA', 'S.G_DE_CONTROL'], n),
+        'PLACA': rng.choice([f'EGA-{i:03d}' for i in range(300)], n),
+        'TIPO_COMBUSTIBLE': rng.choice(['GASOLINA 90', 'DIESEL B5', 'GLP'], n),
+        'CANTIDAD_GALONES': np.abs(rng.normal(10, 3, n)),
+        'KM_RECORRIDO': np.abs(rng.normal(120, 40, n)),
+        'PRECIO': np.abs(rng.normal(15, 1, n))
+    })
+    df['TOTAL_CONSUMO'] = df['CANTIDAD_GALONES'] * df['PRECIO']
+    return procesar_datos(df)
+
+
+def medir(detector, particiones):
+    """Ejecuta el detector por partición y retorna (resultados, segundos por partición)"""
+    resultados, tiempos = [], []
+    for _, grupo in particiones:
+        inicio = time.perf_counter()
+        resultados.append(detector.detectar(grupo)[['ANOMALIA', 'SCORE_ANOMALIA']])
+        tiempos.append(time.perf_counter() - inicio)
+    return pd.concat(resultados), np.array(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('archivo', nargs='?', help='Archivo Excel de vales (opcional)')
+    parser.add_argument('--registros', type=int, default=20000, help='Registros sintéticos si no hay archivo')
+    args = parser.parse_args()
+
+    df = procesar_datos(pd.read_excel(args.archivo)) if args.archivo else datos_sinteticos(args.registros)
+    particiones = list(df.groupby(['MES', 'UNIDAD_ORGANICA']))
+    print(f"Registros: {len(df)}  Particiones: {len(particiones)}")
+
+    # Pasada única del detector robusto sobre toda la flota
+    inicio = time.perf_counter()
+    robusto_total = DetectorRobusto().detectar(df)
+    print(f"Robusto (pasada única): {time.perf_counter() - inicio:.3f}s")
+
+    robusto, t_robusto = medir(DetectorRobusto(), particiones)
+    forest, t_forest = medir(DetectorIsolationForest(), particiones)
+
+    for nombre, tiempos in [('Robusto', t_robusto), ('IsolationForest', t_forest)]:
+        print(f"{nombre:16s} total {tiempos.sum():8.3f}s  p50 {np.percentile(tiempos, 50) * 1000:8.2f}ms  "
+              f"p99 {np.percentile(tiempos, 99) * 1000:8.2f}ms")
+
+    # Concordancia entre niveles sobre los mismos registros
+    forest = forest.reindex(df.index)
+    for nombre, referencia in [('por partición', robusto.reindex(df.index)), ('pasada única', robusto_total)]:
+        a = referencia['ANOMALIA'] == 1
+        b = forest['ANOMALIA'] == 1
+        union = (a | b).sum()
+        jaccard = (a & b).sum() / union if union else 1.0
+        spearman = referencia['SCORE_ANOMALIA'].corr(forest['SCORE_ANOMALIA'], method='spearman')
+        print(f"Robusto ({nombre}) vs IsolationForest: anomalías {a.sum()} / {b.sum()}  "
+              f"Jaccard {jaccard:.3f}  Spearman {spearman:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,40 @@ class Config:
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
-    
+
+    # Configuración de detección de anomalías en lote
+    ANOMALY_BATCH_WORKERS = int(os.environ.get('ANOMALY_BATCH_WORKERS', 0)) or None  # None = núcleos disponibles
+    ANOMALY_DETECTOR = os.environ.get('ANOMALY_DETECTOR', 'auto')  # auto | robusto | isolation_forest
+    ANOMALY_IF_MIN_ROWS = int(os.environ.get('ANOMALY_IF_MIN_ROWS', 200))  # Tamaño mínimo para IsolationForest en 'auto'
+    ANOMALY_FIT_SAMPLE_SIZE = int(os.environ.get('ANOMALY_FIT_SAMPLE_SIZE', 50000)) or None  # Registros para ajustar; None = todos
+    ANOMALY_SCORE_CHUNK_SIZE = int(os.environ.get('ANOMALY_SCORE_CHUNK_SIZE', 20000)) or None  # Registros puntuados por bloque
+    ANOMALY_N_JOBS = int(os.environ.get('ANOMALY_N_JOBS', -1))  # Hilos para ajustar/puntuar árboles (-1 = todos)
+
+    # Configuración de reportes en lote
+    REPORT_BATCH_WORKERS = int(os.environ.get('REPORT_BATCH_WORKERS', 4))  # Reportes generados a la vez en un lote
+
+    # Configuración de retención de artefactos (cargas, reportes y exportaciones en UPLOAD_FOLDER)
+    ARTIFACT_STORE_MAX_MB = int(os.environ.get('ARTIFACT_STORE_MAX_MB', 500)) or None  # Espacio total de las áreas; None = sin límite
+    ARTIFACT_MAX_AGE_HOURS = int(os.environ.get('ARTIFACT_MAX_AGE_HOURS', 72)) or None  # Horas sin uso antes de eliminar un archivo; None = sin límite
+    ARTIFACT_SWEEP_INTERVAL = int(os.environ.get('ARTIFACT_SWEEP_INTERVAL', 600))  # Segundos entre barridos (0 = sin barrido en segundo plano)
+
+    # Configuración del modelo de predicción
+    PREDICTION_MODELS_DIR = os.environ.get('PREDICTION_MODELS_DIR', 'models/prediccion')  # Registro de versiones del modelo
+    PREDICTION_MODEL_VERSIONS = int(os.environ.get('PREDICTION_MODEL_VERSIONS', 5))  # Versiones conservadas (0 = todas)
+    PREDICTION_COMPACT_MODEL = os.environ.get('PREDICTION_COMPACT_MODEL', '1') == '1'  # Servir el bosque en formato compacto cargado con mmap
+    PREDICTION_INCREMENTAL_TREES = int(os.environ.get('PREDICTION_INCREMENTAL_TREES', 20))  # Árboles agregados por actualización incremental
+    PREDICTION_FULL_REFIT_EVERY = int(os.environ.get('PREDICTION_FULL_REFIT_EVERY', 4))  # Actualizaciones incrementales antes de reentrenar completo (0 = siempre completo)
+    PREDICTION_TUNING_BUDGET = int(os.environ.get('PREDICTION_TUNING_BUDGET', 300))  # Segundos máximos de la búsqueda de hiperparámetros
+    PREDICTION_TUNING_WORKERS = int(os.environ.get('PREDICTION_TUNING_WORKERS', 0)) or None  # None = núcleos disponibles
+
+    # Configuración de gráficos
+    CHART_HISTOGRAM_BINS = int(os.environ.get('CHART_HISTOGRAM_BINS', 30))  # Barras de los histogramas de /analyze
+    CHART_MAX_LINE_POINTS = int(os.environ.get('CHART_MAX_LINE_POINTS', 1000))  # Puntos de línea antes de reducir con LTTB
+    CHART_MAX_SCATTER_POINTS = int(os.environ.get('CHART_MAX_SCATTER_POINTS', 5000))  # Puntos de dispersión antes de agregar en celdas
+    CHART_SCATTER_GRID = int(os.environ.get('CHART_SCATTER_GRID', 40))  # Celdas por eje de las dispersiones agregadas
+    CHART_RENDER_WORKERS = int(os.environ.get('CHART_RENDER_WORKERS', -1))  # Procesos para dibujar gráficos (-1 = núcleos, 0 = sin pool)
+    CHART_OUTPUT_PROFILE = os.environ.get('CHART_OUTPUT_PROFILE', 'estandar')  # alta | estandar | compacto | vectorial
+
     # Configuración de sesiones
     PERMANENT_SESSION_LIFETIME = timedelta(hours=2)
     SESSION_COOKIE_SECURE = True
@@ -189,32 +189,38 @@ function updateResultsUI(data, mes, dependencia) {
         `;
         chartsRow.appendChild(chartDiv);
         
+        // El servidor envía el histograma ya calculado (bordes y conteos por barra)
+        const histograma = graficos.eficiencia;
+        const etiquetas = histograma.counts.map((_, i) =>
+            `${histograma.edges[i].toFixed(1)} - ${histograma.edges[i + 1].toFixed(1)}`
+        );
+        
         new Chart(document.getElementById('efficiencyChart').getContext('2d'), {
             type: 'bar',
             data: {
-                labels: ['MÃ­nimo', 'Promedio', 'MÃ¡ximo'],
+                labels: etiquetas,
                 datasets: [{
-                    label: 'Eficiencia (km/gal)',
-                    data: [
-                        Math.min(...graficos.eficiencia),
-                        graficos.eficiencia.reduce((a, b) => a + b, 0) / graficos.eficiencia.length,
-                        Math.max(...graficos.eficiencia)
-                    ],
-                    backgroundColor: [
-                        'rgba(231, 76, 60, 0.7)',
-                        'rgba(52, 152, 219, 0.7)',
-                        'rgba(46, 204, 113, 0.7)'
-                    ]
+                    label: `Vales (promedio ${histograma.mean !== null ? histograma.mean.toFixed(2) : '-'} km/gal)`,
+                    data: histograma.counts,
+                    backgroundColor: 'rgba(52, 152, 219, 0.7)',
+                    barPercentage: 1.0,
+                    categoryPercentage: 1.0
                 }]
             },
             options: {
                 responsive: true,
                 scales: {
+                    x: {
+                        title: {
+                            display: true,
+                            text: 'KilÃ³metros por galÃ³n'
+                        }
+                    },
                     y: {
                         beginAtZero: true,
                         title: {
                             display: true,
-                            text: 'KilÃ³metros por galÃ³n'
+                            text: 'Cantidad de vales'
                         }
                     }
                 }
@@ -277,6 +283,89 @@ function updateResultsUI(data, mes, dependencia) {
         });
     }
     
+    if (graficos.tendencia_diaria) {
+        const chartDiv = document.createElement('div');
+        chartDiv.className = 'col-md-6';
+        chartDiv.innerHTML = `
+            <div class="card">
+                <div class="card-header">
+                    <i class="fas fa-chart-line me-2"></i>Tendencia de Consumo Diario
+                </div>
+                <div class="card-body">
+                    <div class="chart-container">
+                        <canvas id="trendChart"></canvas>
+                    </div>
+                </div>
+            </div>
+        `;
+        chartsRow.appendChild(chartDiv);
+        
+        // La serie llega reducida con LTTB desde el servidor
+        new Chart(document.getElementById('trendChart').getContext('2d'), {
+            type: 'line',
+            data: {
+                labels: graficos.tendencia_diaria.labels,
+                datasets: [{
+                    label: 'Consumo (S/)',
+                    data: graficos.tendencia_diaria.data,
+                    borderColor: 'rgba(46, 204, 113, 0.8)',
+                    pointRadius: graficos.tendencia_diaria.data.length > 60 ? 0 : 3
+                }]
+            },
+            options: {
+                responsive: true,
+                scales: {
+                    y: { beginAtZero: true }
+                }
+            }
+        });
+    }
+    
+    if (graficos.eficiencia_consumo) {
+        const chartDiv = document.createElement('div');
+        chartDiv.className = 'col-md-6';
+        chartDiv.innerHTML = `
+            <div class="card">
+                <div class="card-header">
+                    <i class="fas fa-braille me-2"></i>Eficiencia vs Consumo
+                </div>
+                <div class="card-body">
+                    <div class="chart-container">
+                        <canvas id="scatterChart"></canvas>
+                    </div>
+                </div>
+            </div>
+        `;
+        chartsRow.appendChild(chartDiv);
+        
+        // Con muchos registros el servidor envía celdas con conteo en lugar de puntos
+        const dispersion = graficos.eficiencia_consumo;
+        const maxConteo = dispersion.counts ? Math.max(...dispersion.counts) : 1;
+        const puntos = dispersion.x.map((x, i) => ({
+            x: x,
+            y: dispersion.y[i],
+            r: dispersion.counts ? 2 + 8 * Math.sqrt(dispersion.counts[i] / maxConteo) : 3
+        }));
+        
+        new Chart(document.getElementById('scatterChart').getContext('2d'), {
+            type: 'bubble',
+            data: {
+                datasets: [{
+                    label: dispersion.tipo === 'histograma2d' ? `Vales agrupados (${dispersion.total})` : 'Vales',
+                    data: puntos,
+                    backgroundColor: 'rgba(52, 152, 219, 0.5)'
+                }]
+            },
+            options: {
+                responsive: true,
+                scales: {
+                    x: { title: { display: true, text: 'Eficiencia (km/gal)' } },
+                    y: { title: { display: true, text: 'Consumo (S/)' } }
+                }
+            }
+        });
+    }
+    
     // SecciÃ³n de anomalÃ­as mejorada
     document.getElementById('anomaliesSummary').innerHTML = `
         <div class="row mb-4">
@@ -387,10 +476,11 @@ function updateResultsUI(data, mes, dependencia) {
             </div>
             <div class="card-body text-center">
                 <p class="mb-3">Descargue el reporte completo con todos los detalles de las anomalÃ­as detectadas</p>
-                <a href="/download/${data.report_filename}" 
-                   class="btn btn-danger btn-lg w-100"
+                <a id="btnDescargarReporte"
+                   class="btn btn-danger btn-lg w-100 disabled"
+                   aria-disabled="true"
                    download="Reporte_Anomalias_${dependencia}_Mes${mes}.pdf">
-                    <i class="fas fa-file-pdf me-2"></i>Descargar PDF
+                    <i class="fas fa-spinner fa-spin me-2"></i>Generando PDF...
                 </a>
                 <small class="text-muted mt-2 d-block">TamaÃ±o aproximado: ${Math.round(stats.total_registros * 0.1)} KB</small>
             </div>
@@ -406,5 +496,35 @@ function updateResultsUI(data, mes, dependencia) {
             </div>
         </div>
         `;
+    
+    // El PDF se genera en segundo plano: consultar su estado hasta que esté listo
+    esperarReporte(data.report_status_url);
+    }
+    
+    // Consulta periódicamente el estado del reporte y habilita la descarga al completarse
+    function esperarReporte(statusUrl, intentos = 0) {
+        const boton = document.getElementById('btnDescargarReporte');
+        if (!boton || !statusUrl) return;
+        
+        fetch(statusUrl)
+            .then(response => response.json())
+            .then(data => {
+                const reporte = data.reporte || {};
+                if (reporte.estado === 'completado') {
+                    boton.href = data.download_url;
+                    boton.classList.remove('disabled');
+                    boton.removeAttribute('aria-disabled');
+                    boton.innerHTML = '<i class="fas fa-file-pdf me-2"></i>Descargar PDF';
+                } else if (reporte.estado === 'error' || !data.success) {
+                    boton.innerHTML = '<i class="fas fa-exclamation-triangle me-2"></i>Error al generar el PDF';
+                } else if (intentos < 300) {
+                    setTimeout(() => esperarReporte(statusUrl, intentos + 1), 1000);
+                }
+            })
+            .catch(() => {
+                if (intentos < 300) {
+                    setTimeout(() => esperarReporte(statusUrl, intentos + 1), 2000);
+                }
+            });
     }
 });
\ No newline at end of file
@@ -7,7 +7,7 @@ import sys
 # Agregar el directorio actual al path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask, render_template, redirect, url_for, request, jsonify, send_file
+from flask import Flask, render_template, redirect, url_for, request, jsonify, send_from_directory
 from flask_login import LoginManager, login_required, current_user
 import pandas as pd
 import numpy as np
@@ -17,6 +17,12 @@ from models import db, User
 from auth import auth_bp
 from config import config
 from backend.analisis_combustible import procesar_datos, aplicar_filtros, detectar_anomalias, generar_reporte_anomalias
+from backend.gestor_reportes import GestorReportes
+from backend.cache_reportes import CacheReportes
+from backend.reduccion_datos import histograma, reducir_dispersion, reducir_serie, MAX_BINS_HISTOGRAMA, LimitesGraficos
+from backend.reportes_ligeros import FORMATOS_REPORTE
+from backend.render_graficos import configurar as configurar_render_graficos, PERFILES_SALIDA
+from backend.procesos import es_proceso_principal
 
 # Crear la aplicación
 app = Flask(__name__, 
@@ -47,9 +53,27 @@ app.json_encoder = json.JSONEncoder(
     default=lambda o: int(o) if isinstance(o, np.integer) else float(o) if isinstance(o, np.floating) else None
 )
 
+# Límites de reducción de los gráficos (JSON de /analyze y reportes)
+limites_graficos = LimitesGraficos(
+    app.config['CHART_MAX_LINE_POINTS'], app.config['CHART_MAX_SCATTER_POINTS'], app.config['CHART_SCATTER_GRID']
+)
+
 # Variable global para almacenar datos
 global_df = None
 
+def iniciar_servicios():
+    """Reportes PDF generados en segundo plano; solo en el proceso principal (ver backend.procesos)"""
+    global gestor_reportes, cache_reportes
+    gestor_reportes = GestorReportes()
+    cache_reportes = CacheReportes(app.config['UPLOAD_FOLDER'])
+    configurar_render_graficos(
+        max_workers=app.config['CHART_RENDER_WORKERS'] if app.config['CHART_RENDER_WORKERS'] >= 0 else None,
+        perfil=app.config['CHART_OUTPUT_PROFILE']
+    )
+
+if es_proceso_principal():
+    iniciar_servicios()
+
 # Ruta de login
 @app.route('/login')
 def login():
@@ -120,6 +144,20 @@ def analyze_data():
     if not mes or not dependencia:
         return jsonify({'error': 'Missing parameters'}), 400
     
+    # Barras del histograma de eficiencia: entero acotado para no reservar arreglos arbitrarios;
+    # el valor configurado solo se usa si el cliente no envía bins
+    bins = data.get('bins')
+    if bins is None:
+        bins = app.config['CHART_HISTOGRAM_BINS']
+    else:
+        try:
+            # Vía str: 12.5 o true no se truncan a un entero, se rechazan
+            bins = int(str(bins).strip())
+        except ValueError:
+            return jsonify({'error': 'bins debe ser un número entero'}), 400
+    if not 1 <= bins <= MAX_BINS_HISTOGRAMA:
+        return jsonify({'error': f'bins debe estar entre 1 y {MAX_BINS_HISTOGRAMA}'}), 400
+    
     try:
         # Aplicar filtros
         df_filtrado = aplicar_filtros(global_df, int(mes), dependencia)
@@ -130,8 +168,27 @@ def analyze_data():
         # Detectar anomalías
         df_anomalias = detectar_anomalias(df_filtrado)
         
-        # Generar reporte
-        report_filename = generar_reporte_anomalias(df_anomalias, mes, dependencia)
+        # Generar reporte en segundo plano (o reutilizar uno idéntico); el cliente consulta su estado con report_id
+        perfil = data.get('perfil_graficos') or app.config['CHART_OUTPUT_PROFILE']
+        if perfil not in PERFILES_SALIDA:
+            return jsonify({'error': f'Perfil de gráficos no válido: {perfil}'}), 400
+        formato = data.get('formato_reporte') or 'pdf'
+        if formato not in FORMATOS_REPORTE:
+            return jsonify({'error': f'Formato de reporte no válido: {formato}'}), 400
+        clave_reporte = CacheReportes.clave('anomalias', df_anomalias, mes=mes, dependencia=dependencia,
+                                            perfil=perfil, formato=formato, limites=limites_graficos)
+        archivo_cache = cache_reportes.obtener(clave_reporte)
+        if archivo_cache:
+            report_id = gestor_reportes.registrar_completado(
+                archivo_cache, mes=mes, dependencia=dependencia, perfil=perfil, formato=formato, cache=True
+            )
+        else:
+            report_id = gestor_reportes.solicitar(
+                cache_reportes.generar, clave_reporte,
+                generar_reporte_anomalias, df_anomalias.copy(), mes, dependencia, None, perfil, formato,
+                app.config['UPLOAD_FOLDER'], limites_graficos,
+                mes=mes, dependencia=dependencia, perfil=perfil, formato=formato, cache=False
+            )
         
         # Calcular estadísticas (convertimos explícitamente a float/int)
         stats = {
@@ -145,9 +202,27 @@ def analyze_data():
         # Preparar datos para gráficos
         graficos = {}
         
-        # Gráfico de eficiencia
+        # Gráfico de eficiencia: histograma calculado en el servidor; la serie completa solo si se pide
         if 'EFICIENCIA' in df_filtrado.columns:
-            graficos['eficiencia'] = df_filtrado['EFICIENCIA'].dropna().astype(float).tolist()
+            graficos['eficiencia'] = histograma(df_filtrado['EFICIENCIA'], bins=bins)
+            if data.get('incluir_series'):
+                graficos['eficiencia_valores'] = df_filtrado['EFICIENCIA'].dropna().astype(float).tolist()
+        
+        # Dispersión eficiencia vs consumo (agregada en celdas si supera el máximo de puntos)
+        if 'EFICIENCIA' in df_filtrado.columns and 'TOTAL_CONSUMO' in df_filtrado.columns:
+            graficos['eficiencia_consumo'] = reducir_dispersion(
+                df_filtrado['EFICIENCIA'], df_filtrado['TOTAL_CONSUMO'],
+                max_puntos=limites_graficos.max_puntos_dispersion, celdas=limites_graficos.celdas_dispersion
+            )
+        
+        # Tendencia diaria de consumo reducida con LTTB
+        if 'FECHA_INGRESO_VALE' in df_filtrado.columns and 'TOTAL_CONSUMO' in df_filtrado.columns:
+            fechas = pd.to_datetime(df_filtrado['FECHA_INGRESO_VALE'], errors='coerce').dt.normalize()
+            tendencia = reducir_serie(df_filtrado.groupby(fechas)['TOTAL_CONSUMO'].sum(), limites_graficos.max_puntos_linea)
+            graficos['tendencia_diaria'] = {
+                'labels': tendencia.index.strftime('%Y-%m-%d').tolist(),
+                'data': tendencia.astype(float).tolist()
+            }
         
         # Gráfico de consumo por día
         if 'DIA_SEMANA' in df_filtrado.columns and 'TOTAL_CONSUMO' in df_filtrado.columns:
@@ -164,11 +239,24 @@ def analyze_data():
             'success': True,
             'stats': stats,
             'graficos': graficos,
-            'report_filename': report_filename
+            'report_id': report_id,
+            'report_status_url': url_for('estado_reporte', report_id=report_id)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/reportes/estado/<report_id>', methods=['GET'])
+@login_required
+def estado_reporte(report_id):
+    estado = gestor_reportes.obtener_estado(report_id)
+    if estado is None:
+        return jsonify({'error': 'Reporte no encontrado'}), 404
+    
+    respuesta = {'success': True, 'reporte': estado}
+    if estado['estado'] == 'completado':
+        respuesta['download_url'] = url_for('download_report', filename=estado['archivo'])
+    return jsonify(respuesta)
+
 @app.route('/download/<filename>')
 @login_required
 def download_report(filename):
@@ -181,12 +269,14 @@ def download_report(filename):
         if not os.path.exists(file_path):
             return jsonify({'error': 'File not found'}), 404
             
-        # Enviar el archivo con el tipo MIME correcto
-        return send_file(
-            file_path,
+        # Enviar el archivo con el tipo MIME correcto (con ETag y soporte de Range)
+        return send_from_directory(
+            uploads_dir,
+            filename,
             as_attachment=True,
             download_name=f"Reporte_Anomalias_{filename}",
-            mimetype='application/pdf'
+            etag=cache_reportes.etag(filename) or True,
+            conditional=True
         )
     except Exception as e:
         app.logger.error(f"Error downloading file: {str(e)}")
@@ -6,6 +6,7 @@ import pandas as pd
 import numpy as np
 import os
 import tempfile
+import time
 from datetime import datetime, timedelta
 import sys
 from pathlib import Path
@@ -167,6 +168,1029 @@ class TestUtils(unittest.TestCase):
             # Limpiar archivo temporal
             os.unlink(tmp_path)
 
+class TestAnomaliasLote(unittest.TestCase):
+    """Pruebas para la detección de anomalías en lote"""
+    
+    def setUp(self):
+        """Configurar datos de prueba con varias particiones"""
+        try:
+            from backend.anomalias_lote import ProcesadorAnomaliasLote
+        except ImportError as e:
+            self.skipTest(f"Módulo de lote no disponible: {e}")
+        
+        self.ProcesadorAnomaliasLote = ProcesadorAnomaliasLote
+        self.procesador = ProcesadorAnomaliasLote(max_workers=2, detector='isolation_forest')
+        n = 120
+        self.df_test = pd.DataFrame({
+            'FECHA_INGRESO_VALE': pd.date_range('2023-01-01', periods=n, freq='D'),
+            'UNIDAD_ORGANICA': ['GERENCIA_A', 'GERENCIA_B'] * (n // 2),
+            'TIPO_COMBUSTIBLE': ['DIESEL'] * n,
+            'CANTIDAD_GALONES': np.abs(np.random.normal(20, 5, n)),
+            'KM_RECORRIDO': np.abs(np.random.normal(200, 50, n)),
+            'TOTAL_CONSUMO': np.abs(np.random.normal(100, 20, n)),
+            'PRECIO': np.abs(np.random.normal(5, 1, n)),
+            'PLACA': [f'ABC-{i % 10:03d}' for i in range(n)]
+        })
+        self.df_test['EFICIENCIA'] = self.df_test['KM_RECORRIDO'] / self.df_test['CANTIDAD_GALONES']
+        self.df_test['DIA_SEMANA'] = self.df_test['FECHA_INGRESO_VALE'].dt.dayofweek
+        self.df_test['MES'] = self.df_test['FECHA_INGRESO_VALE'].dt.month
+    
+    def test_todas_las_filas_tienen_resultado(self):
+        """Cada registro recibe ANOMALIA, SCORE_ANOMALIA y NIVEL_RIESGO"""
+        resultados = self.procesador.ejecutar(self.df_test)
+        
+        self.assertIsNotNone(resultados)
+        self.assertTrue(resultados.index.equals(self.df_test.index))
+        for col in ['ANOMALIA', 'SCORE_ANOMALIA', 'NIVEL_RIESGO']:
+            self.assertFalse(resultados[col].isna().any())
+    
+    def test_progreso_y_tiempos(self):
+        """El estado reporta avance completo y el tiempo de cada partición"""
+        self.procesador.ejecutar(self.df_test)
+        estado = self.procesador.obtener_estado()
+        
+        particiones = self.df_test.groupby(['MES', 'UNIDAD_ORGANICA']).ngroups
+        self.assertEqual(estado['estado'], 'completado')
+        self.assertEqual(estado['particiones_procesadas'], particiones)
+        self.assertEqual(len(estado['tiempos_particiones']), particiones)
+        self.assertEqual(estado['porcentaje'], 100.0)
+    
+    def test_particiones_pequenas_usan_nivel_rapido(self):
+        """En modo auto las particiones bajo el umbral no pasan por IsolationForest"""
+        procesador = self.ProcesadorAnomaliasLote(max_workers=2, detector='auto', umbral_isolation_forest=200)
+        resultados = procesador.ejecutar(self.df_test)
+        estado = procesador.obtener_estado()
+        
+        self.assertFalse(resultados['SCORE_ANOMALIA'].isna().any())
+        self.assertEqual(estado['total_particiones'], 0)
+        self.assertEqual(estado['registros_nivel_rapido'], len(self.df_test))
+
+    def test_procesamientos_en_cola(self):
+        """Un procesamiento pedido durante otro espera su turno y el último pedido reemplaza a los pendientes"""
+        import threading
+        procesador = self.ProcesadorAnomaliasLote(detector='robusto')
+        en_curso, continuar = threading.Event(), threading.Event()
+        aplicados = []
+
+        def al_terminar(df, resultados):
+            aplicados.append(len(df))
+            en_curso.set()
+            continuar.wait(10)
+
+        hilo = procesador.ejecutar_en_segundo_plano(self.df_test, al_terminar)
+        self.assertTrue(en_curso.wait(30))
+        procesador.ejecutar_en_segundo_plano(self.df_test.iloc[:80], al_terminar)
+        procesador.ejecutar_en_segundo_plano(self.df_test.iloc[:60], al_terminar)
+        self.assertTrue(procesador.obtener_estado()['pendiente'])
+        continuar.set()
+        hilo.join(30)
+
+        estado = procesador.obtener_estado()
+        self.assertEqual(aplicados, [120, 60])
+        self.assertEqual(estado['estado'], 'completado')
+        self.assertEqual(estado['registros_nivel_rapido'], 60)
+        self.assertFalse(estado['pendiente'])
+
+    def test_ajuste_muestreado_y_puntuacion_por_bloques(self):
+        """Con muestra acotada y bloques pequeños se puntúan todos los registros igual que en una sola llamada"""
+        from backend.analisis_combustible import (
+            ajustar_modelo_anomalias, puntuar_por_bloques, detectar_anomalias_isolation_forest
+        )
+        features = ['TIPO_COMBUSTIBLE', 'KM_RECORRIDO', 'CANTIDAD_GALONES', 'EFICIENCIA']
+        df_model = self.df_test[features]
+        preprocessor, iso_forest, X = ajustar_modelo_anomalias(df_model, tamano_muestra=50)
+        self.assertLessEqual(X.shape[0], 50)
+        
+        por_bloques = puntuar_por_bloques(preprocessor, iso_forest, df_model, tamano_bloque=32)
+        completo = iso_forest.decision_function(preprocessor.transform(df_model))
+        np.testing.assert_allclose(por_bloques, completo)
+        
+        resultado = detectar_anomalias_isolation_forest(self.df_test, tamano_muestra=50, tamano_bloque=32)
+        self.assertFalse(resultado['SCORE_ANOMALIA'].isna().any())
+
+    def test_muestra_estratificada_no_supera_tamano(self):
+        """El redondeo por categoría no hace que la muestra supere el tamaño pedido"""
+        from backend.analisis_combustible import muestra_estratificada
+        df = pd.DataFrame({'TIPO_COMBUSTIBLE': ['DIESEL', 'GASOHOL', 'GLP'] * 3, 'KM_RECORRIDO': range(9)})
+        muestra = muestra_estratificada(df, 5)
+
+        self.assertEqual(len(muestra), 5)
+        self.assertEqual(set(muestra['TIPO_COMBUSTIBLE']), {'DIESEL', 'GASOHOL', 'GLP'})
+
+class TestDetectorRobusto(unittest.TestCase):
+    """Pruebas para el detector de estadística robusta"""
+    
+    def setUp(self):
+        try:
+            from backend.detectores_anomalias import DetectorRobusto, seleccionar_detector
+        except ImportError as e:
+            self.skipTest(f"Módulo de detectores no disponible: {e}")
+        
+        self.DetectorRobusto = DetectorRobusto
+        self.seleccionar_detector = seleccionar_detector
+    
+    def test_valor_extremo_detectado(self):
+        """Un consumo muy superior al histórico del vehículo se marca como anomalía"""
+        n = 40
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            'UNIDAD_ORGANICA': ['GERENCIA_A'] * n,
+            'PLACA': ['ABC-001', 'ABC-002'] * (n // 2),
+            'CANTIDAD_GALONES': rng.normal(20, 1, n),
+            'KM_RECORRIDO': rng.normal(200, 10, n)
+        })
+        df.loc[7, 'CANTIDAD_GALONES'] = 80
+        
+        resultado = self.DetectorRobusto().detectar(df)
+        self.assertEqual(resultado.loc[7, 'ANOMALIA'], 1)
+        self.assertEqual(resultado['SCORE_ANOMALIA'].idxmax(), 7)
+        self.assertIn(resultado.loc[7, 'NIVEL_RIESGO'], ['Moderado', 'Alto', 'Critico'])
+    
+    def test_seleccion_por_tamano(self):
+        """En modo auto se elige el detector según el tamaño de la partición"""
+        self.assertEqual(self.seleccionar_detector(50, 'auto', 200).nombre, 'robusto')
+        self.assertEqual(self.seleccionar_detector(500, 'auto', 200).nombre, 'isolation_forest')
+        self.assertEqual(self.seleccionar_detector(500, 'robusto', 200).nombre, 'robusto')
+
+class TestAnalisisSecuencias(unittest.TestCase):
+    """Pruebas para el análisis de secuencias de vales por vehículo"""
+    
+    def setUp(self):
+        try:
+            from backend.analisis_secuencias import AnalizadorSecuencias
+        except ImportError as e:
+            self.skipTest(f"Módulo de secuencias no disponible: {e}")
+        
+        # Dos vehículos con una carga cada 3 días, en orden mezclado
+        n = 20
+        self.df_test = pd.DataFrame({
+            'PLACA': ['ABC-001', 'ABC-002'] * (n // 2),
+            'FECHA_INGRESO_VALE': [pd.Timestamp('2024-01-01') + pd.Timedelta(days=3 * (i // 2)) for i in range(n)],
+            'CANTIDAD_GALONES': [10.0] * n,
+            'KM_RECORRIDO': [120.0] * n
+        }).sample(frac=1, random_state=0)
+        self.analizador = AnalizadorSecuencias()
+    
+    def test_secuencia_regular_sin_inconsistencias(self):
+        """Cargas espaciadas y coherentes no generan inconsistencias"""
+        resultado = self.analizador.analizar(self.df_test)
+        
+        self.assertTrue(resultado.index.equals(self.df_test.index))
+        self.assertEqual(resultado['INCONSISTENCIA_SECUENCIA'].sum(), 0)
+        self.assertEqual(resultado['DIAS_DESDE_CARGA_ANTERIOR'].dropna().unique().tolist(), [3.0])
+    
+    def test_carga_repetida_y_sobrecarga(self):
+        """Una segunda carga el mismo día sin recorrido se marca como carga rápida y sobrecarga"""
+        extra = pd.DataFrame({
+            'PLACA': ['ABC-001'],
+            'FECHA_INGRESO_VALE': [pd.Timestamp('2024-01-10')],
+            'CANTIDAD_GALONES': [10.0],
+            'KM_RECORRIDO': [0.0]
+        }, index=[100])
+        resultado = self.analizador.analizar(pd.concat([self.df_test, extra]))
+        
+        self.assertEqual(resultado.loc[100, 'CARGA_RAPIDA'], 1)
+        self.assertEqual(resultado.loc[100, 'SOBRECARGA_TANQUE'], 1)
+        self.assertEqual(resultado.loc[100, 'KM_INCONSISTENTE'], 1)
+        self.assertEqual(resultado['INCONSISTENCIA_SECUENCIA'].sum(), 1)
+
+class TestGestorReportes(unittest.TestCase):
+    """Pruebas para la generación de reportes en segundo plano"""
+    
+    def setUp(self):
+        try:
+            from backend.gestor_reportes import GestorReportes
+        except ImportError as e:
+            self.skipTest(f"Módulo de reportes no disponible: {e}")
+        
+        self.gestor = GestorReportes()
+    
+    def esperar(self, report_id):
+        import time
+        for _ in range(100):
+            estado = self.gestor.obtener_estado(report_id)
+            if estado['estado'] in ('completado', 'error'):
+                return estado
+            time.sleep(0.05)
+        self.fail('El reporte no terminó a tiempo')
+    
+    def test_reporte_completado(self):
+        """El estado pasa a completado con el nombre del archivo generado"""
+        report_id = self.gestor.solicitar(lambda mes, dependencia: f'reporte_{dependencia}_{mes}.pdf', 3, 'ALCALDIA', mes=3)
+        estado = self.esperar(report_id)
+        
+        self.assertEqual(estado['estado'], 'completado')
+        self.assertEqual(estado['archivo'], 'reporte_ALCALDIA_3.pdf')
+        self.assertEqual(estado['mes'], 3)
+    
+    def test_reporte_fallido(self):
+        """Un generador que no produce archivo deja el reporte en estado de error"""
+        report_id = self.gestor.solicitar(lambda: None)
+        self.assertEqual(self.esperar(report_id)['estado'], 'error')
+        self.assertIsNone(self.gestor.obtener_estado('inexistente'))
+
+class TestCacheReportes(unittest.TestCase):
+    """Pruebas para el caché de reportes"""
+    
+    def setUp(self):
+        try:
+            from backend.cache_reportes import CacheReportes
+        except ImportError as e:
+            self.skipTest(f"Módulo de caché no disponible: {e}")
+        
+        self.CacheReportes = CacheReportes
+        self.directorio = tempfile.mkdtemp()
+        self.df_test = pd.DataFrame({'PLACA': ['ABC-001', 'ABC-002'], 'TOTAL_CONSUMO': [10.0, 20.0]})
+        self.generados = []
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directorio, ignore_errors=True)
+    
+    def _generar(self, nombre):
+        self.generados.append(nombre)
+        with open(os.path.join(self.directorio, nombre), 'wb') as f:
+            f.write(b'%PDF-1.4')
+        return nombre
+    
+    def test_clave_depende_de_entradas(self):
+        """La clave cambia con los datos, los parámetros y el tipo de reporte"""
+        clave = self.CacheReportes.clave('anomalias', self.df_test, mes=3, dependencia='A')
+        self.assertEqual(clave, self.CacheReportes.clave('anomalias', self.df_test.copy(), dependencia='A', mes=3))
+        self.assertNotEqual(clave, self.CacheReportes.clave('anomalias', self.df_test, mes=4, dependencia='A'))
+        self.assertNotEqual(clave, self.CacheReportes.clave('emisiones', self.df_test, mes=3, dependencia='A'))
+        modificado = self.df_test.copy()
+        modificado.loc[0, 'TOTAL_CONSUMO'] = 11.0
+        self.assertNotEqual(clave, self.CacheReportes.clave('anomalias', modificado, mes=3, dependencia='A'))
+    
+    def test_reutiliza_archivo(self):
+        """Un acierto no regenera el reporte y el índice persiste entre instancias"""
+        cache = self.CacheReportes(self.directorio)
+        clave = cache.clave('anomalias', self.df_test, mes=3)
+        
+        self.assertEqual(cache.generar(clave, self._generar, 'a.pdf'), 'a.pdf')
+        self.assertEqual(cache.generar(clave, self._generar, 'b.pdf'), 'a.pdf')
+        self.assertEqual(self.generados, ['a.pdf'])
+        self.assertEqual(cache.etag('a.pdf'), clave)
+        
+        otra = self.CacheReportes(self.directorio)
+        self.assertEqual(otra.obtener(clave), 'a.pdf')
+        
+        # Si el archivo se elimina, la entrada deja de ser válida
+        os.remove(os.path.join(self.directorio, 'a.pdf'))
+        self.assertIsNone(otra.obtener(clave))
+
+    def test_generacion_concurrente_misma_clave(self):
+        """Las solicitudes de una clave nunca generan a la vez, aunque lleguen mientras otra espera"""
+        import threading
+        cache = self.CacheReportes(self.directorio)
+        clave = cache.clave('anomalias', self.df_test, mes=3)
+        activos = []
+        maximo = [0]
+        bloqueo = threading.Lock()
+
+        def generar_fallido():
+            # Un reporte que falla obliga a la siguiente solicitud a generarlo de nuevo
+            with bloqueo:
+                activos.append(1)
+                maximo[0] = max(maximo[0], len(activos))
+            time.sleep(0.2)
+            with bloqueo:
+                activos.pop()
+            return None
+
+        hilos = []
+        # La tercera llega cuando la primera ya terminó y la segunda está generando
+        for espera in (0, 0.05, 0.25):
+            time.sleep(espera)
+            hilo = threading.Thread(target=cache.generar, args=(clave, generar_fallido))
+            hilo.start()
+            hilos.append(hilo)
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(maximo[0], 1)
+        self.assertEqual(cache._locks_clave, {})
+
+class TestLoteReportes(unittest.TestCase):
+    """Pruebas para la generación de reportes en lote"""
+    
+    def setUp(self):
+        try:
+            from backend import lote_reportes
+            from backend.cache_reportes import CacheReportes
+        except ImportError as e:
+            self.skipTest(f"Módulo de lote de reportes no disponible: {e}")
+        
+        self.lote_reportes = lote_reportes
+        self.directorio = tempfile.mkdtemp()
+        directorio = self.directorio
+        
+        def generar_pdf(prefijo, df, mes, dependencia):
+            nombre = f"{prefijo}_{dependencia}_mes{mes}.pdf"
+            with open(os.path.join(directorio, nombre), 'wb') as f:
+                f.write(b'%PDF-1.4 ' + str(len(df)).encode())
+            return nombre
+        
+        class CalculadorFalso:
+            def generar_reporte_emisiones(self, df, mes, dependencia, *args):
+                return generar_pdf('emisiones', df, mes, dependencia)
+        
+        self._original = lote_reportes.generar_reporte_anomalias
+        lote_reportes.generar_reporte_anomalias = lambda df, mes, dependencia, *args: generar_pdf('anomalias', df, mes, dependencia)
+        self.generador = lote_reportes.GeneradorLoteReportes(
+            CacheReportes(directorio), CalculadorFalso(), directorio=directorio, max_workers=2)
+        
+        n = 60
+        self.df_test = pd.DataFrame({
+            'MES': [3] * 40 + [4] * 20,
+            'UNIDAD_ORGANICA': (['GERENCIA_A', 'GERENCIA_B'] * 30),
+            'PLACA': [f'ABC-{i % 5:03d}' for i in range(n)],
+            'TOTAL_CONSUMO': np.arange(n, dtype=float),
+            'ANOMALIA': 0,
+            'SCORE_ANOMALIA': 0.0,
+            'NIVEL_RIESGO': 'Bajo'
+        })
+    
+    def tearDown(self):
+        import shutil
+        self.lote_reportes.generar_reporte_anomalias = self._original
+        shutil.rmtree(self.directorio, ignore_errors=True)
+    
+    def test_lote_zip(self):
+        """Un lote genera ambos reportes por dependencia y el zip los contiene a todos"""
+        import io
+        import zipfile
+        
+        lote_id = self.generador.iniciar(self.df_test, [3])
+        contenido = b''.join(self.generador.stream_zip(lote_id))
+        
+        estado = self.generador.obtener_estado(lote_id)
+        self.assertEqual(estado['total'], 4)
+        self.assertEqual(estado['terminados'], 4)
+        self.assertEqual(estado['estado'], 'completado')
+        
+        with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+            nombres = sorted(zf.namelist())
+            self.assertEqual(nombres, [
+                'anomalias/mes03_anomalias_GERENCIA_A_mes3.pdf', 'anomalias/mes03_anomalias_GERENCIA_B_mes3.pdf',
+                'emisiones/mes03_emisiones_GERENCIA_A_mes3.pdf', 'emisiones/mes03_emisiones_GERENCIA_B_mes3.pdf'
+            ])
+            self.assertEqual(zf.read(nombres[0]), b'%PDF-1.4 20')
+        
+        self.assertIsNone(self.generador.iniciar(self.df_test, [12]))
+
+class TestCuboConsumo(unittest.TestCase):
+    """Pruebas para el cubo de agregados de consumo"""
+    
+    def setUp(self):
+        try:
+            from backend.cubo_consumo import CuboConsumo, calcular_version_dataset
+            from backend.modulo_emisiones import CalculadorEmisiones
+        except ImportError as e:
+            self.skipTest(f"Módulo de cubo no disponible: {e}")
+        
+        n = 300
+        rng = np.random.default_rng(1)
+        self.df_test = pd.DataFrame({
+            'FECHA_INGRESO_VALE': pd.Timestamp('2023-11-01') + pd.to_timedelta(rng.integers(0, 120, n), unit='D'),
+            'UNIDAD_ORGANICA': rng.choice(['GERENCIA_A', 'GERENCIA_B'], n),
+            'PLACA': rng.choice(['ABC-001', 'ABC-002', 'ABC-003'], n),
+            'TIPO_COMBUSTIBLE': rng.choice(['DIESEL', 'GASOLINA 90', None], n),
+            'CANTIDAD_GALONES': rng.normal(10, 3, n),
+            'KM_RECORRIDO': rng.normal(120, 40, n),
+            'TOTAL_CONSUMO': rng.normal(150, 30, n)
+        })
+        self.df_test['EFICIENCIA'] = self.df_test['KM_RECORRIDO'] / self.df_test['CANTIDAD_GALONES']
+        self.calculador = CalculadorEmisiones()
+        self.cubo = CuboConsumo.construir(self.df_test, self.calculador)
+        self.calcular_version_dataset = calcular_version_dataset
+    
+    def test_rollups_coinciden_con_groupby(self):
+        """Sumas y medias del cubo reproducen los groupby sobre los registros"""
+        mes = self.df_test['FECHA_INGRESO_VALE'].dt.month
+        esperado = self.df_test.groupby(mes)['TOTAL_CONSUMO'].sum()
+        obtenido = self.cubo.serie('TOTAL_CONSUMO', 'MES')
+        np.testing.assert_allclose(obtenido.values, esperado.values)
+        
+        filtro = self.df_test['UNIDAD_ORGANICA'] == 'GERENCIA_A'
+        esperado = self.df_test[filtro].groupby('PLACA')['EFICIENCIA'].mean()
+        obtenido = self.cubo.serie('EFICIENCIA', 'PLACA', {'UNIDAD_ORGANICA': 'GERENCIA_A'}, agregacion='mean')
+        np.testing.assert_allclose(obtenido.values, esperado.values)
+    
+    def test_emisiones_y_version(self):
+        """Las emisiones del cubo suman lo mismo que el cálculo por registro y la versión depende del contenido"""
+        emisiones = self.calculador.calcular_emisiones_dataframe(self.df_test)['EMISIONES_CO2_KG']
+        total = self.cubo.consultar(medidas=['EMISIONES_CO2_KG'])['EMISIONES_CO2_KG']
+        self.assertAlmostEqual(total, emisiones.sum(), places=6)
+        
+        self.assertEqual(self.cubo.version, self.calcular_version_dataset(self.df_test.copy()))
+        modificado = self.df_test.copy()
+        modificado.loc[0, 'CANTIDAD_GALONES'] += 1
+        self.assertNotEqual(self.cubo.version, self.calcular_version_dataset(modificado))
+
+class TestPuntuacionAnomalias(unittest.TestCase):
+    """Pruebas para la puntuación contra modelos de referencia"""
+    
+    def setUp(self):
+        try:
+            from sklearn.ensemble import IsolationForest
+            from backend.arboles_compactos import BosqueAislamientoCompacto
+            from backend.puntuacion_anomalias import PuntuadorAnomalias
+        except ImportError as e:
+            self.skipTest(f"Módulos de puntuación no disponibles: {e}")
+        
+        self.IsolationForest = IsolationForest
+        self.BosqueAislamientoCompacto = BosqueAislamientoCompacto
+        self.directorio = tempfile.mkdtemp()
+        self.puntuador = PuntuadorAnomalias(directorio=self.directorio)
+    
+    def test_bosque_compacto_equivalente(self):
+        """El bosque compacto reproduce decision_function de sklearn"""
+        X = np.random.normal(size=(300, 6))
+        iso_forest = self.IsolationForest(n_estimators=50, contamination=0.05, random_state=42).fit(X)
+        compacto = self.BosqueAislamientoCompacto(iso_forest)
+        
+        np.testing.assert_allclose(compacto.decision_function(X), iso_forest.decision_function(X), atol=1e-12)
+    
+    def test_vale_individual_coincide_con_mes(self):
+        """Un vale en JSON obtiene el mismo score que su fila del DataFrame"""
+        n = 60
+        df = pd.DataFrame({
+            'UNIDAD_ORGANICA': ['GERENCIA_A'] * n,
+            'MES': [1] * n,
+            'TIPO_COMBUSTIBLE': ['DIESEL'] * n,
+            'KM_RECORRIDO': np.abs(np.random.normal(200, 50, n)),
+            'CANTIDAD_GALONES': np.abs(np.random.normal(20, 5, n)) + 1,
+            'PRECIO': np.abs(np.random.normal(5, 1, n)),
+            'DIA_SEMANA': [2] * n
+        })
+        df['TOTAL_CONSUMO'] = df['CANTIDAD_GALONES'] * df['PRECIO']
+        df['EFICIENCIA'] = df['KM_RECORRIDO'] / df['CANTIDAD_GALONES']
+        df['COSTO_POR_KM'] = df['TOTAL_CONSUMO'] / df['KM_RECORRIDO']
+        
+        self.assertIsNotNone(self.puntuador.entrenar_referencia(df, 'GERENCIA_A', 1))
+        mes = self.puntuador.puntuar_dataframe(df, 'GERENCIA_A')
+        
+        fila = df.iloc[0]
+        vale = {
+            'FECHA_INGRESO_VALE': '2024-01-03',  # miércoles
+            'TIPO_COMBUSTIBLE': 'DIESEL',
+            'KM_RECORRIDO': fila['KM_RECORRIDO'],
+            'CANTIDAD_GALONES': fila['CANTIDAD_GALONES'],
+            'PRECIO': fila['PRECIO'],
+            'TOTAL_CONSUMO': fila['TOTAL_CONSUMO']
+        }
+        resultado = self.puntuador.puntuar_vales([vale], 'GERENCIA_A')['resultados'][0]
+        self.assertAlmostEqual(resultado['SCORE_ANOMALIA'], mes['SCORE_ANOMALIA'].iloc[0], places=9)
+
+class TestReduccionDatos(unittest.TestCase):
+    """Pruebas para la reducción de series de gráficos"""
+    
+    def setUp(self):
+        try:
+            from backend.reduccion_datos import histograma, reducir_serie, reducir_dispersion
+            self.histograma = histograma
+            self.reducir_serie = reducir_serie
+            self.reducir_dispersion = reducir_dispersion
+        except ImportError as e:
+            self.skipTest(f"Módulo de reducción no disponible: {e}")
+    
+    def test_histograma(self):
+        """El histograma conserva el total y los estadísticos de la serie"""
+        valores = pd.Series(np.random.default_rng(0).normal(12, 2, 5000))
+        valores.iloc[:10] = np.nan
+        resultado = self.histograma(valores, bins=20)
+        
+        self.assertEqual(len(resultado['edges']), 21)
+        self.assertEqual(sum(resultado['counts']), 4990)
+        self.assertEqual(resultado['total'], 4990)
+        self.assertAlmostEqual(resultado['mean'], valores.mean())
+        self.assertAlmostEqual(resultado['quantiles']['p50'], valores.median())
+        self.assertEqual(self.histograma([])['counts'], [])
+    
+    def test_lttb_conserva_extremos(self):
+        """LTTB reduce al umbral conservando los extremos y los picos de la serie"""
+        fechas = pd.date_range('2024-01-01', periods=5000, freq='h')
+        serie = pd.Series(np.sin(np.arange(5000) / 50.0), index=fechas)
+        serie.iloc[2345] = 10.0
+        reducida = self.reducir_serie(serie, 200)
+        
+        self.assertEqual(len(reducida), 200)
+        self.assertEqual(reducida.index[0], fechas[0])
+        self.assertEqual(reducida.index[-1], fechas[-1])
+        self.assertIn(fechas[2345], reducida.index)
+        self.assertTrue(reducida.index.is_monotonic_increasing)
+        self.assertEqual(len(self.reducir_serie(serie.head(50), 200)), 50)
+    
+    def test_dispersion_agregada(self):
+        """Las dispersiones grandes se envían como celdas cuyo conteo suma el total"""
+        rng = np.random.default_rng(0)
+        x, y = rng.normal(size=20000), rng.normal(size=20000)
+        
+        agregada = self.reducir_dispersion(x, y, max_puntos=1000, celdas=25)
+        self.assertEqual(agregada['tipo'], 'histograma2d')
+        self.assertEqual(sum(agregada['counts']), 20000)
+        self.assertLessEqual(len(agregada['x']), 25 * 25)
+        
+        puntos = self.reducir_dispersion(x[:500], y[:500], max_puntos=1000)
+        self.assertEqual(puntos['tipo'], 'puntos')
+        self.assertEqual(len(puntos['x']), 500)
+
+class TestContextoReporte(unittest.TestCase):
+    """Pruebas para los agregados compartidos de los reportes"""
+    
+    def setUp(self):
+        try:
+            from backend.contexto_reporte import ContextoReporte, NIVELES_RIESGO
+        except ImportError as e:
+            self.skipTest(f"Módulo de contexto de reporte no disponible: {e}")
+        
+        self.ContextoReporte = ContextoReporte
+        self.NIVELES_RIESGO = NIVELES_RIESGO
+        n = 200
+        rng = np.random.default_rng(5)
+        self.df_test = pd.DataFrame({
+            'FECHA_INGRESO_VALE': pd.Timestamp('2024-03-01') + pd.to_timedelta(rng.integers(0, 28, n), unit='D'),
+            'UNIDAD_ORGANICA': 'GERENCIA_A',
+            'PLACA': rng.choice(['ABC-001', 'ABC-002', 'ABC-003', 'ABC-004'], n),
+            'TOTAL_CONSUMO': rng.normal(150, 30, n),
+            'EFICIENCIA': rng.normal(10, 2, n),
+            'ANOMALIA': rng.integers(0, 2, n),
+            'NIVEL_RIESGO': rng.choice(['Bajo', 'Moderado', 'Alto', 'Critico'], n)
+        })
+        self.df_test['DIA_SEMANA'] = self.df_test['FECHA_INGRESO_VALE'].dt.dayofweek
+    
+    def test_agregados_equivalentes(self):
+        """Los agregados coinciden con los cálculos por sección que reemplazan"""
+        df = self.df_test
+        contexto = self.ContextoReporte.construir(df, 3, 'GERENCIA_A')
+        
+        self.assertAlmostEqual(contexto.consumo_fin_de_semana, df[df['DIA_SEMANA'].isin([5, 6])]['TOTAL_CONSUMO'].sum())
+        self.assertEqual(contexto.riesgo['CANTIDAD'].to_dict(), df['NIVEL_RIESGO'].value_counts().to_dict())
+        
+        # Series.mode sobre la categoría ordenada (así llegan los niveles de clasificar_nivel_riesgo)
+        niveles = df['NIVEL_RIESGO'].astype(pd.CategoricalDtype(self.NIVELES_RIESGO, ordered=True))
+        esperado = niveles[df['ANOMALIA'] == 1].groupby(df['PLACA']).agg(lambda x: x.mode().iloc[0]).astype(str)
+        vehiculos = contexto.vehiculos_anomalias
+        self.assertEqual(vehiculos['NIVEL_RIESGO'].to_dict(), esperado.loc[vehiculos.index].to_dict())
+        self.assertEqual(vehiculos['ANOMALIA'].sum(), df['ANOMALIA'].sum())
+
+    def test_limites_graficos(self):
+        """Los límites configurados llegan a la tendencia, a las dispersiones y a la clave del caché"""
+        from backend.reduccion_datos import LimitesGraficos, LIMITES_POR_DEFECTO
+        from backend.reportes_ligeros import datos_reporte_anomalias
+        from backend.cache_reportes import CacheReportes
+        limites = LimitesGraficos(max_puntos_linea=5, max_puntos_dispersion=20, celdas_dispersion=4)
+        contexto = self.ContextoReporte.construir(self.df_test, 3, 'GERENCIA_A', limites=limites)
+
+        self.assertEqual(len(contexto.consumo_temporal), 5)
+        dispersion = datos_reporte_anomalias(contexto)['graficos']['eficiencia_consumo']
+        self.assertEqual(len(dispersion['x_edges']), 5)
+        self.assertEqual(sum(dispersion['counts']), len(self.df_test))
+        self.assertNotEqual(CacheReportes.clave('anomalias', self.df_test, limites=limites),
+                            CacheReportes.clave('anomalias', self.df_test, limites=LIMITES_POR_DEFECTO))
+
+    def test_empate_nivel_riesgo(self):
+        """En empate se informa el nivel de menor riesgo, no el primero alfabéticamente"""
+        df = pd.DataFrame({
+            'PLACA': ['ABC-001'] * 4 + ['ABC-002'] * 3,
+            'ANOMALIA': 1,
+            'TOTAL_CONSUMO': 100.0,
+            'EFICIENCIA': 10.0,
+            'NIVEL_RIESGO': ['Bajo', 'Alto', 'Alto', 'Bajo', 'Critico', 'Moderado', 'Critico']
+        })
+        contexto = self.ContextoReporte.construir(df, 3, 'GERENCIA_A')
+
+        niveles = contexto.vehiculos_anomalias['NIVEL_RIESGO'].to_dict()
+        self.assertEqual(niveles, {'ABC-001': 'Bajo', 'ABC-002': 'Critico'})
+
+class TestGraficosMemoria(unittest.TestCase):
+    """Pruebas para los gráficos de reportes generados en memoria"""
+    
+    def setUp(self):
+        try:
+            from backend.analisis_combustible import procesar_datos, crear_graficos_pdf
+        except ImportError as e:
+            self.skipTest(f"Módulo de análisis no disponible: {e}")
+        
+        self.crear_graficos_pdf = crear_graficos_pdf
+        n = 120
+        rng = np.random.default_rng(3)
+        self.df_test = procesar_datos(pd.DataFrame({
+            'FECHA_INGRESO_VALE': pd.Timestamp('2024-03-01') + pd.to_timedelta(rng.integers(0, 28, n), unit='D'),
+            'UNIDAD_ORGANICA': ['GERENCIA_A'] * n,
+            'PLACA': rng.choice(['ABC-001', 'ABC-002', 'ABC-003'], n),
+            'CANTIDAD_GALONES': rng.normal(10, 2, n).clip(1),
+            'KM_RECORRIDO': rng.normal(120, 30, n).clip(1),
+            'TOTAL_CONSUMO': rng.normal(150, 30, n).clip(1)
+        }))
+        self.df_test['ANOMALIA'] = 0
+        self.df_test['NIVEL_RIESGO'] = 'Bajo'
+    
+    def test_graficos_sin_archivos_temporales(self):
+        """Los gráficos se retornan como PNG en memoria sin escribir en disco"""
+        directorio_original = os.getcwd()
+        with tempfile.TemporaryDirectory() as directorio:
+            os.chdir(directorio)
+            try:
+                graficos = self.crear_graficos_pdf(self.df_test, 3, 'GERENCIA_A')
+                self.assertEqual(os.listdir(directorio), [])
+            finally:
+                os.chdir(directorio_original)
+        
+        self.assertIn('eficiencia_hist', graficos)
+        for buffer in graficos.values():
+            self.assertEqual(buffer.getvalue()[:8], b'\x89PNG\r\n\x1a\n')
+    
+    def test_perfiles_salida(self):
+        """Cada perfil produce su formato y el perfil compacto pesa menos que el de alta resolución"""
+        from backend import render_graficos
+        
+        firmas = {'alta': b'\x89PNG', 'estandar': b'\x89PNG', 'compacto': b'\xff\xd8', 'vectorial': b'<?xml'}
+        tamanos = {}
+        for perfil, firma in firmas.items():
+            graficos = self.crear_graficos_pdf(self.df_test, 3, 'GERENCIA_A', perfil=perfil)
+            self.assertEqual(len(graficos), 6, perfil)
+            for buffer in graficos.values():
+                self.assertTrue(buffer.getvalue().startswith(firma), perfil)
+            tamanos[perfil] = sum(len(b.getvalue()) for b in graficos.values())
+        
+        self.assertLess(tamanos['compacto'], tamanos['alta'])
+        with self.assertRaises(ValueError):
+            render_graficos.renderizar({}, perfil='desconocido')
+
+    def test_procesos_no_inician_servicios(self):
+        """Los procesos de los pools no se consideran proceso principal"""
+        from backend.procesos import contexto_procesos, es_proceso_principal
+
+        self.assertTrue(es_proceso_principal())
+        with contexto_procesos().Pool(processes=1) as pool:
+            self.assertFalse(pool.apply(es_proceso_principal))
+
+class TestReportesLigeros(unittest.TestCase):
+    """Pruebas para los reportes en HTML y JSON"""
+    
+    def setUp(self):
+        try:
+            from backend.contexto_reporte import ContextoReporte
+            from backend.reportes_ligeros import datos_reporte_anomalias, guardar_reporte_ligero
+        except ImportError as e:
+            self.skipTest(f"Módulo de reportes ligeros no disponible: {e}")
+        
+        self.ContextoReporte = ContextoReporte
+        self.datos_reporte_anomalias = datos_reporte_anomalias
+        self.guardar_reporte_ligero = guardar_reporte_ligero
+        n = 150
+        rng = np.random.default_rng(8)
+        self.df_test = pd.DataFrame({
+            'FECHA_INGRESO_VALE': pd.Timestamp('2024-03-01') + pd.to_timedelta(rng.integers(0, 28, n), unit='D'),
+            'UNIDAD_ORGANICA': 'GERENCIA_A',
+            'PLACA': rng.choice(['ABC-001', 'ABC-002', 'ABC-003'], n),
+            'CANTIDAD_GALONES': rng.normal(10, 2, n),
+            'TOTAL_CONSUMO': rng.normal(150, 30, n),
+            'EFICIENCIA': rng.normal(10, 2, n),
+            'ANOMALIA': rng.integers(0, 2, n),
+            'NIVEL_RIESGO': rng.choice(['Bajo', 'Alto'], n)
+        })
+        self.df_test['DIA_SEMANA'] = self.df_test['FECHA_INGRESO_VALE'].dt.dayofweek
+    
+    def test_json_y_html(self):
+        """El documento es JSON válido con los mismos totales y la página HTML lo incluye"""
+        import json
+        datos = self.datos_reporte_anomalias(self.ContextoReporte.construir(self.df_test, 3, 'GERENCIA_A'))
+        
+        self.assertEqual(datos['resumen']['total_registros'], len(self.df_test))
+        self.assertEqual(datos['resumen']['total_anomalias'], int(self.df_test['ANOMALIA'].sum()))
+        self.assertEqual(sum(datos['graficos']['eficiencia']['counts']), len(self.df_test))
+        self.assertEqual(len(datos['graficos']['consumo_diario']['data']), 7)
+        
+        with tempfile.TemporaryDirectory() as directorio:
+            archivo_json = self.guardar_reporte_ligero(datos, 'reporte_completo', 'json', directorio)
+            archivo_html = self.guardar_reporte_ligero(datos, 'reporte_completo', 'html', directorio)
+            with open(os.path.join(directorio, archivo_json), encoding='utf-8') as f:
+                self.assertEqual(json.load(f)['resumen'], datos['resumen'])
+            with open(os.path.join(directorio, archivo_html), encoding='utf-8') as f:
+                html = f.read()
+        
+        self.assertTrue(archivo_html.endswith('.html'))
+        self.assertIn('id="datos-reporte"', html)
+        self.assertIn('grafico-top_vehiculos', html)
+
+class TestTablaPDF(unittest.TestCase):
+    """Pruebas para las tablas largas de los reportes PDF"""
+    
+    def setUp(self):
+        try:
+            from fpdf import FPDF
+            from backend.tabla_pdf import TablaPDF
+        except ImportError as e:
+            self.skipTest(f"Módulo de tablas PDF no disponible: {e}")
+        
+        self.pdf = FPDF()
+        self.pdf.add_page()
+        self.TablaPDF = TablaPDF
+        n = 1000
+        self.df_test = pd.DataFrame({
+            'PLACA': [f'ABC-{i:04d}' for i in range(n)],
+            'TOTAL_CONSUMO': np.linspace(1, 100000, n),
+            'NIVEL_RIESGO': ['Alto'] * n
+        })
+        self.df_test.loc[5, 'TOTAL_CONSUMO'] = np.nan
+    
+    def test_paginacion(self):
+        """Todas las filas se escriben en páginas completas y los anchos ocupan el ancho útil"""
+        columnas = [('Placa', 'PLACA', None, 'L'), ('Consumo (S/)', 'TOTAL_CONSUMO', '{:,.2f}', 'R'),
+                    ('Nivel', 'NIVEL_RIESGO', None, 'C')]
+        tabla = self.TablaPDF(self.pdf, columnas, alto_fila=5)
+        tabla.dibujar(self.df_test)
+        
+        util = self.pdf.w - self.pdf.l_margin - self.pdf.r_margin
+        self.assertAlmostEqual(tabla.anchos.sum(), util)
+        filas_por_pagina = int((self.pdf.h - self.pdf.b_margin - self.pdf.t_margin) // 5) - 1
+        self.assertEqual(self.pdf.page, -(-len(self.df_test) // filas_por_pagina))
+        self.assertTrue(self.pdf.auto_page_break)
+
+class TestAlmacenArtefactos(unittest.TestCase):
+    """Pruebas para la retención de cargas, reportes y exportaciones"""
+    
+    def setUp(self):
+        try:
+            from backend.almacen_artefactos import AlmacenArtefactos
+            from backend.cache_reportes import CacheReportes
+        except ImportError as e:
+            self.skipTest(f"Módulo de almacén no disponible: {e}")
+        
+        self.AlmacenArtefactos = AlmacenArtefactos
+        self.CacheReportes = CacheReportes
+        self.directorio = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directorio, ignore_errors=True)
+    
+    def _escribir(self, almacen, area, nombre, tamano=100):
+        with open(almacen.ruta(area, nombre), 'wb') as f:
+            f.write(b'x' * tamano)
+        return almacen.registrar(area, nombre)
+    
+    def test_presupuesto_lru(self):
+        """Al exceder el presupuesto se elimina lo usado hace más tiempo, salvo descargas en curso"""
+        almacen = self.AlmacenArtefactos(self.directorio, max_bytes=300)
+        for nombre in ['a.pdf', 'b.pdf', 'c.pdf']:
+            self._escribir(almacen, 'reportes', nombre)
+        almacen.tocar('reportes', 'a.pdf')
+        
+        with almacen.usando('reportes', 'b.pdf') as disponible:
+            self.assertTrue(disponible)
+            self._escribir(almacen, 'exportaciones', 'd.xlsx')
+        
+        self.assertFalse(os.path.exists(almacen.ruta('reportes', 'c.pdf')))
+        self.assertTrue(os.path.exists(almacen.ruta('reportes', 'b.pdf')))
+        estado = almacen.obtener_estado()
+        self.assertEqual(estado['bytes'], 300)
+        self.assertEqual(estado['descargas_en_curso'], 0)
+        self.assertEqual(estado['areas']['exportaciones']['archivos'], 1)
+    
+    def test_barrido_antiguedad_y_cache(self):
+        """El barrido incorpora archivos escritos por fuera, elimina los vencidos y los olvida del caché"""
+        cache = None
+        almacen = self.AlmacenArtefactos(
+            self.directorio, max_edad=3600, al_eliminar=lambda area, nombres: cache.olvidar(nombres))
+        cache = self.CacheReportes(almacen.ruta('reportes'), almacen=almacen)
+        
+        clave = cache.clave('anomalias', pd.DataFrame({'A': [1]}))
+        cache.generar(clave, lambda: self._escribir(almacen, 'reportes', 'nuevo.pdf'))
+        viejo = os.path.join(almacen.ruta('cargas'), 'viejo.xlsx')
+        with open(viejo, 'wb') as f:
+            f.write(b'x')
+        os.utime(viejo, (time.time() - 7200,) * 2)
+        
+        self.assertEqual(almacen.barrer(), {'cargas': ['viejo.xlsx']})
+        self.assertEqual(cache.obtener(clave), 'nuevo.pdf')
+        
+        almacen.max_edad = 0
+        time.sleep(0.01)
+        self.assertEqual(almacen.barrer(), {'reportes': ['nuevo.pdf']})
+        self.assertNotIn(clave, cache.indice)
+
+class TestRegistroModelos(unittest.TestCase):
+    """Pruebas para el registro versionado del modelo de predicción"""
+    
+    def setUp(self):
+        try:
+            from backend.prediccion_ia import PrediccionConsumo
+            from backend.registro_modelos import RegistroModelos
+        except ImportError as e:
+            self.skipTest(f"Módulo de predicción no disponible: {e}")
+        
+        self.PrediccionConsumo = PrediccionConsumo
+        self.RegistroModelos = RegistroModelos
+        self.directorio = tempfile.mkdtemp()
+        
+        n = 80
+        rng = np.random.default_rng(0)
+        galones = rng.uniform(5, 15, n)
+        self.df_test = pd.DataFrame({
+            'FECHA_INGRESO_VALE': pd.date_range('2024-01-01', periods=n, freq='D'),
+            'PLACA': [f'ABC-{i % 4:03d}' for i in range(n)],
+            'TIPO_COMBUSTIBLE': ['DIESEL', 'GASOHOL'] * (n // 2),
+            'UNIDAD_ORGANICA': ['GERENCIA_A'] * n,
+            'KM_RECORRIDO': galones * 30,
+            'CANTIDAD_GALONES': galones,
+            'PRECIO': 15.0,
+            'TOTAL_CONSUMO': galones * 15.0
+        })
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directorio, ignore_errors=True)
+    
+    def test_reutiliza_version(self):
+        """Los mismos datos reutilizan la versión registrada, también tras un reinicio"""
+        prediccion = self.PrediccionConsumo(self.RegistroModelos(self.directorio))
+        primero = prediccion.entrenar_modelo(self.df_test.copy())
+        self.assertFalse(primero['reutilizado'])
+        self.assertIn('r2', primero['metricas'])
+        self.assertTrue(prediccion.entrenar_modelo(self.df_test.copy())['reutilizado'])
+        
+        reiniciada = self.PrediccionConsumo(self.RegistroModelos(self.directorio))
+        self.assertTrue(reiniciada.cargar_modelo())
+        self.assertEqual(reiniciada.version, primero['version'])
+        self.assertEqual(reiniciada.metricas, primero['metricas'])
+        
+        modificado = self.df_test.copy()
+        modificado.loc[0, 'TOTAL_CONSUMO'] += 1
+        segundo = reiniciada.entrenar_modelo(modificado)
+        self.assertFalse(segundo['reutilizado'])
+        self.assertNotEqual(segundo['version'], primero['version'])
+        self.assertEqual(len(reiniciada.registro.listar()), 2)
+        self.assertIsNone(reiniciada.entrenar_modelo(self.df_test.head(10).copy()))
+    
+    def test_almacen_caracteristicas(self):
+        """La matriz se calcula una vez por versión, se relee del disco y no modifica el DataFrame"""
+        from backend.caracteristicas_prediccion import AlmacenCaracteristicas
+        
+        columnas = list(self.df_test.columns)
+        almacen = AlmacenCaracteristicas(os.path.join(self.directorio, 'caracteristicas'))
+        matriz = almacen.obtener(self.df_test)
+        self.assertEqual(list(self.df_test.columns), columnas)
+        self.assertEqual(matriz.X.dtype, np.float32)
+        self.assertTrue(matriz.X.flags['C_CONTIGUOUS'])
+        self.assertEqual(matriz.X.shape, (len(self.df_test), len(matriz.features)))
+        self.assertEqual(matriz.categorias['TIPO_COMBUSTIBLE'], ['DIESEL', 'GASOHOL'])
+        self.assertIs(almacen.obtener(self.df_test), matriz)
+        
+        # Promedio por vehículo, igual que groupby('PLACA').transform('mean')
+        esperado = self.df_test.groupby('PLACA')['KM_RECORRIDO'].transform('mean').to_numpy()
+        np.testing.assert_allclose(matriz.columna('km_promedio'), esperado, rtol=1e-6)
+        
+        releida = AlmacenCaracteristicas(os.path.join(self.directorio, 'caracteristicas')).obtener(self.df_test)
+        self.assertIsNot(releida, matriz)
+        np.testing.assert_array_equal(releida.X, matriz.X)
+        self.assertEqual(releida.placas, matriz.placas)
+    
+    def test_pronostico_lote(self):
+        """El pronóstico por lote cubre cada entidad y coincide con el pronóstico individual"""
+        prediccion = self.PrediccionConsumo(self.RegistroModelos(self.directorio))
+        prediccion.entrenar_modelo(self.df_test.copy())
+        
+        lote = prediccion.predecir_consumo_lote(self.df_test, placas='todas', dependencias=['GERENCIA_A'],
+                                                fecha_inicio='2025-01-06')
+        self.assertEqual(sorted(lote['placas']), ['ABC-000', 'ABC-001', 'ABC-002', 'ABC-003'])
+        self.assertEqual(len(lote['placas']['ABC-001']), 7)
+        self.assertEqual(lote['placas']['ABC-001'][0]['dia_semana'], 'Lunes')
+        self.assertAlmostEqual(lote['total_placas'],
+                               sum(d['consumo_predicho'] for dias in lote['placas'].values() for d in dias))
+        
+        individual = prediccion.predecir_consumo_semanal(self.df_test, placa='ABC-001')
+        self.assertEqual(len(individual), 7)
+        lote_hoy = prediccion.predecir_consumo_lote(self.df_test, placas=['ABC-001'])
+        self.assertEqual([d['consumo_predicho'] for d in individual],
+                         [d['consumo_predicho'] for d in lote_hoy['placas']['ABC-001']])
+
+    def test_actualizacion_incremental(self):
+        """Los registros agregados al final agregan árboles; el calendario fuerza el reentrenamiento completo"""
+        prediccion = self.PrediccionConsumo(self.RegistroModelos(self.directorio), estimadores_incrementales=5,
+                                            actualizaciones_antes_de_completo=1)
+        nuevos = self.df_test.tail(30).assign(
+            FECHA_INGRESO_VALE=pd.date_range('2024-03-21', periods=30, freq='D'))
+        ampliado = pd.concat([self.df_test, nuevos], ignore_index=True)
+        
+        self.assertEqual(prediccion.entrenar_modelo(self.df_test.copy())['modo'], 'completo')
+        incremental = prediccion.entrenar_modelo(ampliado)
+        self.assertEqual(incremental['modo'], 'incremental')
+        self.assertEqual(incremental['metricas']['arboles'], 105)
+        self.assertEqual(set(incremental['metricas']['tiempos_entrenamiento']), {'completo', 'incremental'})
+        self.assertTrue(prediccion.entrenar_modelo(ampliado)['reutilizado'])
+        
+        otra_vez = pd.concat([ampliado, nuevos.assign(
+            FECHA_INGRESO_VALE=pd.date_range('2024-04-20', periods=30, freq='D'))], ignore_index=True)
+        self.assertEqual(prediccion.entrenar_modelo(otra_vez)['modo'], 'completo')
+    
+    def test_paquete_inmutable(self):
+        """Actualizar el modelo publica un paquete nuevo sin tocar el que usan las predicciones en curso"""
+        prediccion = self.PrediccionConsumo(self.RegistroModelos(self.directorio), estimadores_incrementales=5)
+        prediccion.entrenar_modelo(self.df_test.copy())
+        anterior = prediccion.paquete
+        with self.assertRaises(AttributeError):
+            anterior.version = 'otra'
+        
+        nuevos = self.df_test.tail(30).assign(
+            FECHA_INGRESO_VALE=pd.date_range('2024-03-21', periods=30, freq='D'))
+        prediccion.entrenar_modelo(pd.concat([self.df_test, nuevos], ignore_index=True))
+        self.assertIsNot(prediccion.paquete, anterior)
+        self.assertEqual(prediccion.paquete.modelo.n_arboles, 105)
+        self.assertEqual(anterior.modelo.n_arboles, 100)
+        np.testing.assert_array_equal(prediccion.paquete.scaler.mean_, anterior.scaler.mean_)
+        self.assertEqual(prediccion.paquete.actualizaciones, anterior.actualizaciones + 1)
+    
+    def test_formato_compacto(self):
+        """El modelo en uso es el bosque compacto cargado con mmap y predice como el de sklearn"""
+        prediccion = self.PrediccionConsumo(self.RegistroModelos(self.directorio))
+        prediccion.entrenar_modelo(self.df_test.copy())
+        compacto = prediccion.paquete.modelo
+        self.assertIsInstance(compacto.valor, np.memmap)
+        
+        X = prediccion.paquete.scaler.transform(prediccion.caracteristicas.obtener(self.df_test).entrenamiento()[0])
+        estimador = prediccion.registro.cargar_estimador(prediccion.version)
+        np.testing.assert_allclose(compacto.predict(X), estimador.predict(X), rtol=1e-5)
+        
+        rendimiento = prediccion.medir_inferencia(self.df_test)
+        self.assertEqual(rendimiento['formato_en_uso'], 'compacto')
+        formatos = rendimiento['formatos']
+        self.assertLess(formatos['compacto']['bytes'], formatos['joblib']['bytes'])
+        self.assertIn('latencia_registro_ms', formatos['compacto'])
+    
+    def test_ajuste_hiperparametros(self):
+        """La búsqueda registra al mejor candidato con sus métricas de validación temporal"""
+        from backend.ajuste_prediccion import AjusteModeloPrediccion
+        prediccion = self.PrediccionConsumo(self.RegistroModelos(self.directorio))
+        prediccion.entrenar_modelo(self.df_test.copy())
+        anterior = prediccion.version
+        
+        ajuste = AjusteModeloPrediccion(prediccion, max_workers=1, presupuesto=60,
+                                        grilla={'n_estimators': [10], 'max_depth': [2, 6]})
+        resultado = ajuste.ejecutar(self.df_test)
+        estado = ajuste.obtener_estado()
+        self.assertEqual(estado['estado'], 'completado')
+        self.assertEqual(estado['candidatos_evaluados'], 2)
+        self.assertEqual(resultado['parametros'], estado['mejor']['parametros'])
+        self.assertNotEqual(prediccion.version, anterior)
+        self.assertEqual(prediccion.metricas['validacion'], 'temporal')
+        self.assertEqual(prediccion.parametros['n_estimators'], 10)
+        
+        # La versión ajustada es la que se carga tras un reinicio
+        reiniciada = self.PrediccionConsumo(self.RegistroModelos(self.directorio))
+        self.assertTrue(reiniciada.cargar_modelo())
+        self.assertEqual(reiniciada.parametros, prediccion.parametros)
+
+        # Mientras una búsqueda está en curso no se lanza otra
+        hilo = ajuste.ejecutar_en_segundo_plano(self.df_test)
+        self.assertIsNone(ajuste.ejecutar_en_segundo_plano(self.df_test))
+        hilo.join(60)
+        self.assertEqual(ajuste.obtener_estado()['estado'], 'completado')
+    
+    def test_ajuste_candidato_fallido(self):
+        """Un candidato inválido queda registrado como fallido y la búsqueda sigue con los demás"""
+        from backend.ajuste_prediccion import AjusteModeloPrediccion
+        prediccion = self.PrediccionConsumo(self.RegistroModelos(self.directorio))
+
+        ajuste = AjusteModeloPrediccion(prediccion, max_workers=1, presupuesto=60,
+                                        grilla={'n_estimators': [10], 'max_depth': [-1, 4]})
+        resultado = ajuste.ejecutar(self.df_test)
+        estado = ajuste.obtener_estado()
+        self.assertEqual(estado['estado'], 'completado')
+        self.assertEqual(estado['candidatos_evaluados'], 2)
+        self.assertEqual([f['parametros']['max_depth'] for f in estado['fallidos']], [-1])
+        self.assertEqual(resultado['parametros']['max_depth'], 4)
+
+        # Si ningún candidato se valida la búsqueda termina en error
+        ajuste = AjusteModeloPrediccion(prediccion, max_workers=1, presupuesto=60,
+                                        grilla={'n_estimators': [10], 'max_depth': [-1]})
+        self.assertIsNone(ajuste.ejecutar(self.df_test))
+        self.assertEqual(ajuste.obtener_estado()['estado'], 'error')
+
+    def test_pronostico_series(self):
+        """Holt-Winters recupera un patrón semanal y el pronóstico por series no requiere modelo"""
+        from backend.motor_pronostico import holt_winters, estacional_ingenuo
+        semana = np.array([10., 20., 30., 40., 50., 60., 70.])
+        series = np.tile(semana, (3, 8))
+        pronostico, error = holt_winters(series, 7, 7)
+        np.testing.assert_allclose(pronostico, np.tile(semana, (3, 1)), atol=1e-6)
+        np.testing.assert_allclose(error, 0, atol=1e-6)
+        np.testing.assert_array_equal(estacional_ingenuo(series, 9, 7)[0], np.r_[semana, semana[:2]])
+        
+        prediccion = self.PrediccionConsumo(self.RegistroModelos(self.directorio))
+        resultado = prediccion.predecir_series(self.df_test, placas='todas', dependencias='todas', horizonte=5)
+        self.assertEqual(sorted(resultado['placas']['entidades']), ['ABC-000', 'ABC-001', 'ABC-002', 'ABC-003'])
+        self.assertEqual(resultado['placas']['periodos'][0], '2024-03-21')
+        self.assertEqual(len(resultado['dependencias']['entidades']['GERENCIA_A']['pronostico']), 5)
+        
+        mensual = prediccion.predecir_series(self.df_test, placas=['ABC-001'], frecuencia='mensual',
+                                             horizonte=2, metodo='estacional_ingenuo')
+        self.assertEqual(mensual['placas']['periodos'], ['2024-04', '2024-05'])
+
 class TestIntegracion(unittest.TestCase):
     """Pruebas de integración del sistema completo"""
     